@@ -0,0 +1,203 @@
+"""
+Semantic Answer Cache
+
+Returns the stored answer to a past question when a new one means the same
+thing, skipping the Zotero search, the PubMed search and synthesis.
+
+Past questions that have a synthesized answer in queries.db are embedded
+into a small in-memory FAISS inner-product index (keyed by query_id). A new
+question is embedded once and compared with them; the closest one answered
+within ANSWER_CACHE_TTL_DAYS and at least ANSWER_CACHE_THRESHOLD cosine
+similarity is a hit, and its answer and result papers are read back from
+query_results and result_items. Answers stored by other processes are
+picked up on the next lookup.
+
+Hits and misses are logged per query in query_metrics, together with the
+pipeline time the hit saved; print the totals with:
+    python scripts/answer_cache.py
+"""
+
+import threading
+from datetime import datetime
+from typing import NamedTuple
+
+import faiss
+import numpy as np
+
+from db import DB_PATH, get_connection, load_result_items, log_metrics
+from embedding_pipeline import embed_texts
+from utils import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL_DAYS
+
+# Nearest past questions considered per lookup, in case the closest ones have expired
+CANDIDATES = 10
+
+
+class CachedAnswer(NamedTuple):
+    query_id: int
+    query: str
+    similarity: float
+    asked_at: datetime
+    answer: str
+    zotero: list
+    pubmed: list
+    saved_seconds: float  # pipeline time of the original question, 0 if unknown
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+class AnswerCache:
+    """Similarity lookup over answered questions, safe to share between threads."""
+
+    def __init__(self, db_path=DB_PATH, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_DAYS * 86400):
+        self.db_path = db_path
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._index = None
+        self._asked_at = {}  # query_id -> datetime
+        self._last_result_id = 0  # highest query_results row already indexed
+
+    def _refresh(self) -> None:
+        """Indexes answers saved since the last refresh (by any process)."""
+        cutoff = datetime.now().timestamp() - self.ttl_seconds
+        with self._lock:
+            rows = get_connection(self.db_path).execute("""
+                SELECT r.id, l.id, l.query_text, l.timestamp
+                FROM query_results r JOIN query_log l ON l.id = r.query_id
+                WHERE r.source = 'synthesis' AND r.id > ?
+                ORDER BY r.id
+            """, (self._last_result_id,)).fetchall()
+            if not rows:
+                return
+            self._last_result_id = rows[-1][0]
+
+            fresh = {}
+            for _, query_id, text, timestamp in rows:
+                asked_at = datetime.fromisoformat(str(timestamp))
+                if asked_at.timestamp() >= cutoff and query_id not in self._asked_at:
+                    fresh[query_id] = (text, asked_at)
+        if not fresh:
+            return
+        # Embedding is a network call, so other lookups keep running meanwhile
+        vectors = _normalized(embed_texts([text for text, _ in fresh.values()]))
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+            keep = [i for i, query_id in enumerate(fresh) if query_id not in self._asked_at]
+            self._index.add_with_ids(vectors[keep], np.fromiter(fresh, dtype=np.int64)[keep])
+            self._asked_at.update((query_id, asked_at) for query_id, (_, asked_at) in fresh.items())
+
+    def lookup(self, query: str):
+        """
+        Finds a stored answer for a question.
+
+        Returns:
+            CachedAnswer, or None if no question within the TTL is similar enough.
+        """
+        self._refresh()
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return None
+        vector = _normalized(embed_texts([query]))
+        with self._lock:
+            similarities, ids = self._index.search(vector, min(CANDIDATES, self._index.ntotal))
+
+        now = datetime.now()
+        # Best similarity first; among equally similar questions, the newest answer
+        candidates = sorted(
+            ((float(s), int(i)) for s, i in zip(similarities[0], ids[0]) if i >= 0),
+            key=lambda c: (-c[0], -c[1]),
+        )
+        for similarity, query_id in candidates:
+            if similarity < self.threshold:
+                break
+            if (now - self._asked_at[query_id]).total_seconds() <= self.ttl_seconds:
+                return self._load(query_id, similarity)
+        return None
+
+    def _load(self, query_id: int, similarity: float) -> CachedAnswer:
+        conn = get_connection(self.db_path)
+        query_text = conn.execute("SELECT query_text FROM query_log WHERE id = ?", (query_id,)).fetchone()[0]
+        answer = conn.execute(
+            "SELECT content FROM query_results WHERE query_id = ? AND source = 'synthesis' ORDER BY id DESC LIMIT 1",
+            (query_id,),
+        ).fetchone()[0]
+        saved = conn.execute(
+            "SELECT value FROM query_metrics WHERE query_id = ? AND name = 'pipeline_seconds' ORDER BY id DESC LIMIT 1",
+            (query_id,),
+        ).fetchone()
+        return CachedAnswer(
+            query_id=query_id,
+            query=query_text,
+            similarity=similarity,
+            asked_at=self._asked_at[query_id],
+            answer=answer,
+            zotero=load_result_items(query_id, "zotero", db_path=self.db_path),
+            pubmed=load_result_items(query_id, "pubmed", db_path=self.db_path),
+            saved_seconds=saved[0] if saved else 0.0,
+        )
+
+    def record(self, query_id: int, hit: CachedAnswer = None, forced: bool = False) -> None:
+        """
+        Logs the outcome of a lookup for a newly logged query.
+
+        Args:
+            query_id: ID of the new question.
+            hit: The answer served from the cache, or None on a miss.
+            forced: The user asked for a fresh answer, so the cache was not consulted.
+        """
+        if forced:
+            metrics = {"answer_cache_bypassed": 1}
+        elif hit is None:
+            metrics = {"answer_cache_hit": 0}
+        else:
+            metrics = {
+                "answer_cache_hit": 1,
+                "answer_cache_similarity": hit.similarity,
+                "answer_cache_source_query": hit.query_id,
+                "answer_cache_saved_seconds": hit.saved_seconds,
+            }
+        log_metrics(query_id, metrics, db_path=self.db_path)
+
+    def stats(self) -> dict:
+        """Lifetime hits, misses, hit rate and pipeline seconds saved, from query_metrics."""
+        totals = dict(get_connection(self.db_path).execute("""
+            SELECT name, SUM(value) FROM query_metrics
+            WHERE name IN ('answer_cache_hit', 'answer_cache_saved_seconds', 'answer_cache_bypassed')
+            GROUP BY name
+        """))
+        lookups = get_connection(self.db_path).execute(
+            "SELECT COUNT(*) FROM query_metrics WHERE name = 'answer_cache_hit'"
+        ).fetchone()[0]
+        hits = int(totals.get("answer_cache_hit") or 0)
+        return {
+            "hits": hits,
+            "misses": lookups - hits,
+            "bypassed": int(totals.get("answer_cache_bypassed") or 0),
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_seconds": totals.get("answer_cache_saved_seconds") or 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Returns the process-wide answer cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
+
+
+if __name__ == "__main__":
+    stats = get_answer_cache().stats()
+    print(f"♻️ Answer cache: {stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+          f"{stats['bypassed']} forced refreshes, {stats['saved_seconds']:.1f}s of pipeline time saved")
@@ -1,16 +1,19 @@
 import os
 import sys
+import time
 from pathlib import Path
 import streamlit as st
 from dotenv import load_dotenv
 from openai import OpenAI
 
-# Add scripts folder to path so we can import manager_agent
+# Add scripts folder to path so we can import the pipeline modules
 ROOT = Path(__file__).resolve().parents[1]
 SCRIPTS_DIR = ROOT / "scripts"
 sys.path.append(str(SCRIPTS_DIR))
 
-from manager_agent import query_zotero_library, query_pubmed, synthesize, log_query
+from db import log_query, save_results, save_result_items, log_metrics, load_spans, recent_spans
+from query_client import get_query_client
+from tracing import trace, stage_breakdown, stage_percentiles
 
 # Load environment variables for OpenAI key
 load_dotenv(ROOT / ".env")
@@ -41,23 +44,12 @@ st.markdown(
 st.markdown('<div class="title">Research Assistant — Multi-Agent Mode</div>', unsafe_allow_html=True)
 
 query = st.text_input("Enter your research question", "")
+force_refresh = st.checkbox(
+    "Force refresh", help="Answer from scratch even if a near-identical question was answered recently"
+)
 
-if st.button("Run Multi-Agent Query") and query.strip():
-    query_id = log_query(query)  # Reuse the DRY logging function
-    st.info(f"✅ Logged query to database with ID {query_id}")
-
-    with st.spinner("🔍 Querying Zotero library..."):
-        zotero_results = query_zotero_library(query, k=5)
-
-    with st.spinner("🔎 Querying PubMed..."):
-        pubmed_results = query_pubmed(query, max_results=5)
-
-    with st.spinner("🧠 Synthesizing results with GPT-4..."):
-        answer = synthesize(query, zotero_results, pubmed_results)
-
-    st.markdown("### 🧠 Synthesized Answer")
-    st.write(answer)
 
+def show_papers(zotero_results, pubmed_results):
     st.markdown("### 📚 Zotero Results")
     for doc in zotero_results:
         url = doc.get("url", "#")
@@ -75,7 +67,82 @@ if st.button("Run Multi-Agent Query") and query.strip():
         title = doc.get("title", "Untitled")
         year = doc.get("year", "n.d.")
         authors = doc.get("authors", "Unknown")
+        in_library = " — 📚 already in your library" if doc.get("in_library") else ""
         st.markdown(
-            f"- <a href='{url}' target='_blank' class='paper-title'>{title}</a> ({year}) – {authors}",
+            f"- <a href='{url}' target='_blank' class='paper-title'>{title}</a> ({year}) – {authors}{in_library}",
             unsafe_allow_html=True,
         )
+
+
+def show_stage_breakdown(query_id):
+    """Where this answer's time and money went, from its trace spans."""
+    stages = stage_breakdown(load_spans(query_id))
+    if not stages:
+        return
+    with st.expander(f"⏱️ Stage breakdown — estimated cost ${sum(r['cost_usd'] for r in stages):.4f}"):
+        st.dataframe(stages, hide_index=True)
+
+
+with st.sidebar:
+    st.markdown("### 📈 Recent stage latency")
+    try:
+        percentiles = stage_percentiles(recent_spans(100))
+    except Exception as e:
+        percentiles = []
+        st.caption(f"Telemetry unavailable: {e}")
+    if percentiles:
+        st.dataframe(percentiles, hide_index=True)
+    else:
+        st.caption("No traced queries yet.")
+
+
+if st.button("Run Multi-Agent Query") and query.strip():
+    query_id = log_query(query)  # Reuse the DRY logging function
+    st.info(f"✅ Logged query to database with ID {query_id}")
+
+    # The query server keeps the index and answer cache loaded for every session; without one, this process loads them
+    client = get_query_client()
+    with trace(query_id):
+        hit = client.lookup_answer(query, query_id, force_refresh=force_refresh)
+    if hit:
+        st.success(
+            f"♻️ Answered from a similar question asked {hit.asked_at:%Y-%m-%d %H:%M} "
+            f"(similarity {hit.similarity:.2f}): “{hit.query}”. Tick *Force refresh* for a new answer."
+        )
+        st.markdown("### 🧠 Synthesized Answer")
+        st.markdown(hit.answer)
+        st.caption(f"Saved about {hit.saved_seconds:.0f}s")
+        show_papers(hit.zotero, hit.pubmed)
+        st.stop()
+
+    started = time.perf_counter()
+    with trace(query_id), st.spinner("🔍 Querying Zotero library and PubMed..."):
+        zotero_results, pubmed_results = client.gather_sources(
+            query, k=5, max_results=5, iterative=False, query_id=query_id
+        )
+    save_result_items(query_id, "zotero", zotero_results)
+    save_result_items(query_id, "pubmed", pubmed_results)
+    index_stats = client.last_index_stats
+    st.caption(
+        f"{'Query server' if client.last_used_server else 'This process'}: "
+        f"Zotero index loaded {index_stats['loads']}× "
+        f"(last load {index_stats['load_seconds'] * 1000:.0f} ms), "
+        f"search {index_stats['last_search_seconds'] * 1000:.1f} ms"
+    )
+
+    st.markdown("### 🧠 Synthesized Answer")
+    timings = {}
+    # Render the answer progressively as tokens arrive
+    with trace(query_id):
+        answer = st.write_stream(
+            client.synthesize_stream(query, zotero_results, pubmed_results, query_id=query_id, timings=timings)
+        )
+    save_results(query_id, "synthesis", answer)
+    log_metrics(query_id, {"pipeline_seconds": time.perf_counter() - started})
+    st.caption(
+        f"First token after {timings.get('ttft_seconds', 0):.1f}s, "
+        f"full answer in {timings['total_seconds']:.1f}s"
+    )
+    show_stage_breakdown(query_id)
+
+    show_papers(zotero_results, pubmed_results)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Compares FAISS index specs on recall@k against the exact Flat index and on
+per-query latency (p50/p99), to help choose --index-spec for build_index.py.
+
+Vectors come from the existing zotero.index (any index that supports
+reconstruct, e.g. Flat or HNSW) or from a synthetic clustered set. Queries
+are library vectors held out of every index, including the exact one, so no
+query finds itself. Trained specs (IVF) are trained on a random sample.
+
+Usage:
+    python scripts/benchmark_index.py --spec Flat --spec HNSW --spec IVF-Flat
+    python scripts/benchmark_index.py --synthetic 200000 --dim 1536 --json bench.json
+"""
+
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from index_specs import resolve_index_spec, make_index, training_rows
+
+
+def load_vectors(index_file: str) -> np.ndarray:
+    """Reads every stored vector back out of an existing FAISS index."""
+    index = faiss.read_index(index_file)
+    if isinstance(index, faiss.IndexIDMap):
+        # Vectors are stored in the wrapped index; ids are entry hashes, not rows
+        index = faiss.downcast_index(index.index)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random topic centroids, like title embeddings."""
+    rng = np.random.default_rng(seed)
+    n_topics = max(1, n // 200)
+    centroids = rng.standard_normal((n_topics, dim), dtype=np.float32)
+    vectors = centroids[rng.integers(0, n_topics, n)] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def split_queries(vectors: np.ndarray, n_queries: int, seed: int = 1):
+    """
+    Holds out random vectors to use as queries.
+
+    Returns:
+        tuple: (vectors to index, query vectors); at most half the vectors
+        become queries.
+    """
+    picks = np.random.default_rng(seed).choice(len(vectors), size=min(n_queries, len(vectors) // 2), replace=False)
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[picks] = True
+    return np.ascontiguousarray(vectors[~held_out]), np.ascontiguousarray(vectors[held_out])
+
+
+def time_queries(index, queries: np.ndarray, k: int):
+    """Searches one query at a time, as query_zotero_library does."""
+    latencies = np.empty(len(queries))
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, I = index.search(queries[i:i + 1], k)
+        latencies[i] = time.perf_counter() - started
+        ids[i] = I[0]
+    return ids, latencies
+
+
+def recall_at_k(found: np.ndarray, exact: np.ndarray) -> float:
+    """Mean fraction of the exact top-k that each approximate search returned."""
+    hits = [len(set(f[f >= 0]) & set(e)) / len(e) for f, e in zip(found, exact)]
+    return float(np.mean(hits))
+
+
+def benchmark(vectors: np.ndarray, specs, k: int = 10, n_queries: int = 200, nprobe=None, ef_search=None) -> list[dict]:
+    vectors, queries = split_queries(vectors, n_queries)
+    dim = vectors.shape[1]
+
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    truth, _ = time_queries(exact, queries, k)
+
+    results = []
+    for spec in specs:
+        factory_string = resolve_index_spec(spec, len(vectors))
+        index = make_index(factory_string, dim, nprobe=nprobe, ef_search=ef_search)
+
+        started = time.perf_counter()
+        rows = training_rows(index, len(vectors))
+        if len(rows):
+            index.train(vectors[rows])
+        index.add(vectors)
+        build_seconds = time.perf_counter() - started
+
+        found, latencies = time_queries(index, queries, k)
+        results.append({
+            "spec": spec,
+            "factory": factory_string,
+            "n_vectors": len(vectors),
+            "dim": dim,
+            "k": k,
+            "build_seconds": build_seconds,
+            f"recall@{k}": recall_at_k(found, truth),
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index specs: recall@k vs Flat and query latency.")
+    parser.add_argument("--spec", action="append", help="Index spec to test; repeat for several (default: Flat, HNSW, IVF-Flat)")
+    parser.add_argument("--index-file", default="zotero.index", help="Existing index to take vectors from")
+    parser.add_argument("--synthetic", type=int, help="Use N synthetic vectors instead of the library")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("-k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--nprobe", type=int, help="IVF lists to probe per query")
+    parser.add_argument("--ef-search", type=int, help="HNSW candidate list size per query")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.synthetic, args.dim) if args.synthetic else load_vectors(args.index_file)
+    specs = args.spec or ["Flat", "HNSW", "IVF-Flat"]
+    print(f"📐 Benchmarking {len(specs)} specs on {len(vectors)} vectors (dim {vectors.shape[1]}), "
+          f"{min(args.queries, len(vectors) // 2)} held out as queries")
+
+    results = benchmark(vectors, specs, k=args.k, n_queries=args.queries, nprobe=args.nprobe, ef_search=args.ef_search)
+
+    print(f"\n{'spec':<20}{'build s':>10}{f'recall@{args.k}':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for r in results:
+        print(f"{r['factory']:<20}{r['build_seconds']:>10.2f}{r[f'recall@{args.k}']:>12.3f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Measures PubMed XML parsing throughput and peak memory on a large local
+fixture, comparing the streaming parser with a whole-document ET.fromstring
+parse like the one query_pubmed used before.
+
+The fixture is generated once (synthetic but efetch-shaped) and reused.
+
+Usage:
+    python scripts/benchmark_pubmed_parser.py --articles 50000
+    python scripts/benchmark_pubmed_parser.py --fixture big_efetch.xml --json parser.json
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+from pubmed_parser import iter_pubmed_articles
+
+WORDS = ("calcium cholesterol lipid insulin mouse liver adipose signalling dietary "
+         "randomized trial cohort plasma LDL receptor expression metabolism").split()
+
+
+def _sentence(rng, n):
+    return escape(" ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + ".")
+
+
+def fixture_article(rng, pmid: int) -> str:
+    """One efetch-style <PubmedArticle> with a structured abstract, authors and MeSH terms."""
+    sections = "".join(
+        f'<AbstractText Label="{label}">{_sentence(rng, 40)}</AbstractText>'
+        for label in ("BACKGROUND", "METHODS", "RESULTS", "CONCLUSIONS")
+    )
+    authors = "".join(
+        f"<Author><LastName>Author{j}</LastName><ForeName>Name{j}</ForeName></Author>"
+        for j in range(rng.randint(1, 8))
+    )
+    mesh = "".join(
+        f"<MeshHeading><DescriptorName>{rng.choice(WORDS).title()}</DescriptorName></MeshHeading>"
+        for _ in range(6)
+    )
+    return (
+        f"<PubmedArticle><MedlineCitation><PMID Version=\"1\">{pmid}</PMID><Article>"
+        f"<Journal><Title>Journal {pmid % 50}</Title><JournalIssue><PubDate><Year>{1990 + pmid % 35}</Year>"
+        f"</PubDate></JournalIssue></Journal>"
+        f"<ArticleTitle>{_sentence(rng, 12)}</ArticleTitle>"
+        f"<ELocationID EIdType=\"doi\">10.1000/bench.{pmid}</ELocationID>"
+        f"<Abstract>{sections}</Abstract><AuthorList>{authors}</AuthorList></Article>"
+        f"<MeshHeadingList>{mesh}</MeshHeadingList></MedlineCitation></PubmedArticle>\n"
+    )
+
+
+def write_fixture(path, n_articles: int, seed: int = 0) -> None:
+    """Writes an efetch-style PubmedArticleSet with structured abstracts."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" ?>\n<PubmedArticleSet>\n')
+        for i in range(n_articles):
+            f.write(fixture_article(rng, 10000000 + i))
+        f.write("</PubmedArticleSet>\n")
+
+
+def parse_whole_document(path) -> int:
+    """Baseline: load the full document, then run descendant searches per article."""
+    with open(path, "rb") as f:
+        root = ET.fromstring(f.read())
+    count = 0
+    for article in root.findall(".//PubmedArticle"):
+        article.findtext(".//ArticleTitle")
+        article.findtext(".//AbstractText")
+        [a.findtext("LastName") for a in article.findall(".//Author")]
+        article.findtext(".//PubDate/Year")
+        count += 1
+    return count
+
+
+def parse_streaming(path) -> int:
+    with open(path, "rb") as f:
+        return sum(1 for _ in iter_pubmed_articles(f))
+
+
+def measure(parse, path) -> dict:
+    """Times one parse, then repeats it under tracemalloc for peak memory."""
+    started = time.perf_counter()
+    count = parse(path)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    parse(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "articles": count,
+        "seconds": elapsed,
+        "articles_per_sec": count / elapsed,
+        "peak_mb": peak / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PubMed XML parsing throughput.")
+    parser.add_argument("--articles", type=int, default=20000, help="Articles in the generated fixture")
+    parser.add_argument("--fixture", help="Fixture path (generated if missing)")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    path = args.fixture or os.path.join(tempfile.gettempdir(), f"pubmed_fixture_{args.articles}.xml")
+    if not os.path.exists(path):
+        print(f"🧪 Writing {args.articles} articles to {path}")
+        write_fixture(path, args.articles)
+    print(f"📄 Fixture: {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+    results = {
+        "fixture_mb": os.path.getsize(path) / 1e6,
+        "streaming": measure(parse_streaming, path),
+        "whole_document": measure(parse_whole_document, path),
+    }
+
+    print(f"\n{'parser':<16}{'articles':>10}{'seconds':>10}{'articles/s':>12}{'peak MB':>10}")
+    for name in ("streaming", "whole_document"):
+        r = results[name]
+        print(f"{name:<16}{r['articles']:>10}{r['seconds']:>10.2f}{r['articles_per_sec']:>12.0f}{r['peak_mb']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
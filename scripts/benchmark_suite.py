@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Offline Benchmark Suite
+
+Runs the real pipeline against the local stand-ins in stub_services.py, so
+no network or API keys are needed, and measures:
+
+    build_index/<n>     build_index.py on a synthetic library.bib of n entries
+    query_zotero/<n>    query_zotero_library latency on a synthetic n-vector
+                        index (1k to 1M), plus the FAISS search time alone
+    pubmed_parser       streaming parse of a local efetch fixture
+    query_pubmed        query_pubmed: search, fetch and parse through the stub
+    manager_agent       gather_sources + streamed synthesis per question,
+                        including time to first token
+
+Everything runs in a temporary directory with its own CACHE_DIR, so caches
+start cold and the real library, caches and queries.db are never touched.
+The one thing the stub can't stand in for is tiktoken's encoding file, which
+the embedding batcher needs: it is downloaded on first use and then read from
+TIKTOKEN_CACHE_DIR. The suite loads it before it starts and stops with
+instructions if it is neither cached nor reachable.
+The stub's latency, jitter and error rate are set from the command line;
+NCBI requests are paced as with an API key (10/sec).
+
+Results are written as JSON (one metrics dict per benchmark, plus the git
+commit and settings) and can be compared between versions. A comparison
+exits with status 1 if any timing or throughput got worse by more than
+--threshold percent.
+
+Usage:
+    python scripts/benchmark_suite.py --json bench.json
+    python scripts/benchmark_suite.py --only query_zotero --sizes 1k,100k,1M --dim 256
+    python scripts/benchmark_suite.py --openai-latency 0.3 --ncbi-latency 0.1 --error-rate 0.02
+    python scripts/benchmark_suite.py --baseline before.json --json after.json
+    python scripts/benchmark_suite.py --compare before.json after.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from stub_services import StubServices, StubProfile
+from benchmark_pubmed_parser import WORDS, write_fixture, measure, parse_streaming
+
+ROOT = Path(__file__).resolve().parents[1]
+
+BENCHMARKS = ("build_index", "query_zotero", "pubmed_parser", "query_pubmed", "manager_agent")
+# Benchmarks that batch texts for the embeddings API, and so need the tiktoken encoding
+TOKENIZED_BENCHMARKS = ("build_index", "query_zotero", "manager_agent")
+
+# Settings the pipeline modules read from the environment when they are imported
+PIPELINE_MODULES = ("utils", "embedding_backends", "query_zotero", "query_pubmed", "manager_agent", "build_index")
+
+
+def parse_sizes(text: str) -> list[int]:
+    """"1k,10k,1M" -> [1000, 10000, 1000000]."""
+    scale = {"k": 1000, "m": 1000000}
+    return [int(float(s[:-1]) * scale[s[-1].lower()]) if s[-1].lower() in scale else int(s)
+            for s in text.replace(" ", "").split(",") if s]
+
+
+def configure_environment(stub: StubServices, cache_dir) -> None:
+    """Points the OpenAI and NCBI clients at the stub and isolates every cache."""
+    loaded = [name for name in PIPELINE_MODULES if name in sys.modules]
+    if loaded:
+        raise RuntimeError(f"Configure the benchmark environment before importing {', '.join(loaded)}.")
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-stub",
+        "OPENAI_BASE_URL": stub.openai_url,
+        "EUTILS_BASE_URL": stub.eutils_url,
+        "NCBI_API_KEY": "stub",
+        "EMBEDDING_BACKEND": "openai",
+        "SEARCH_MODE": "semantic",
+        "ANSWER_CACHE": "false",
+        "QUERY_SERVER_URL": "",
+        "CACHE_DIR": str(cache_dir),
+    })
+
+
+def check_tokenizer() -> None:
+    """
+    Loads the tiktoken encoding of EMBEDDING_MODEL up front, from its cache or,
+    the first time, by downloading it.
+
+    Raises:
+        SystemExit: with download instructions if it is neither cached nor reachable.
+    """
+    from embedding_pipeline import get_encoding
+    from utils import EMBEDDING_MODEL
+
+    try:
+        get_encoding()
+    except OSError as e:  # requests' ConnectionError and friends are OSErrors
+        raise SystemExit(
+            f"❌ The tiktoken encoding for {EMBEDDING_MODEL} is not cached and could not be downloaded ({e}).\n"
+            f"   Download it once with network access:\n"
+            f"   python -c \"import tiktoken; tiktoken.encoding_for_model('{EMBEDDING_MODEL}')\"\n"
+            f"   Set TIKTOKEN_CACHE_DIR to keep it somewhere that isn't cleared like the temp directory."
+        ) from None
+
+
+@contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextmanager
+def quiet():
+    """Hides the pipeline's progress prints while it is being timed."""
+    with redirect_stdout(io.StringIO()):
+        yield
+
+
+@contextmanager
+def use_index(handle):
+    """Makes the pipeline search `handle` instead of the library's ZOTERO_INDEX."""
+    import query_zotero
+    modules = [m for m in (query_zotero, sys.modules.get("manager_agent")) if m is not None]
+    previous = [m.ZOTERO_INDEX for m in modules]
+    for m in modules:
+        m.ZOTERO_INDEX = handle
+    try:
+        yield handle
+    finally:
+        for m, old in zip(modules, previous):
+            m.ZOTERO_INDEX = old
+
+
+def latency_summary(seconds, prefix: str = "") -> dict:
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if len(ms) == 0:
+        return {}
+    return {
+        f"{prefix}p50_ms": float(np.percentile(ms, 50)),
+        f"{prefix}p95_ms": float(np.percentile(ms, 95)),
+        f"{prefix}p99_ms": float(np.percentile(ms, 99)),
+        f"{prefix}mean_ms": float(ms.mean()),
+    }
+
+
+def write_bib(path, n: int, seed: int = 0) -> None:
+    """Writes a synthetic library.bib with titles, authors, abstracts and keywords."""
+    rng = random.Random(seed)
+
+    def words(count):
+        return " ".join(rng.choice(WORDS) for _ in range(count))
+
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            f.write(
+                f"@article{{bench{i},\n"
+                f"  title = {{{words(10).capitalize()} {i}}},\n"
+                f"  author = {{Author{i % 997}, Name and Writer{i % 89}, Other}},\n"
+                f"  year = {{{1990 + i % 35}}},\n"
+                f"  doi = {{10.1000/library.{i}}},\n"
+                f"  abstract = {{{words(120).capitalize()}.}},\n"
+                f"  keywords = {{{', '.join(rng.sample(WORDS, 4))}}}\n"
+                f"}}\n"
+            )
+
+
+def build_library(folder, n: int, index_spec: str) -> float:
+    """Runs build_index.py on a synthetic library in `folder`; returns the seconds it took."""
+    import build_index
+    write_bib(Path(folder) / build_index.BIB_FILE, n)
+    started = time.perf_counter()
+    with working_directory(folder), quiet():
+        build_index.main(index_spec=index_spec, chunks=False)
+    return time.perf_counter() - started
+
+
+def write_synthetic_index(folder, n: int, dim: int) -> None:
+    """Writes an n-vector Flat index and metadata directly, without embedding anything."""
+    import faiss
+    from benchmark_index import synthetic_vectors
+    from bib_entries import entry_id
+    from embedding_backends import get_embedding_backend
+    from index_specs import make_index
+    from meta_store import write_meta_store
+
+    keys = [f"bench{i}" for i in range(n)]
+    ids = np.fromiter((entry_id(key) for key in keys), dtype=np.int64, count=n)
+    index = faiss.IndexIDMap2(make_index("Flat", dim))
+    index.add_with_ids(synthetic_vectors(n, dim), ids)
+    faiss.write_index(index, str(Path(folder) / "zotero.index"))
+    del index
+    records = ({"title": f"Synthetic paper {i}", "authors": f"Author{i % 997}", "year": str(1990 + i % 35), "id": key}
+               for i, key in enumerate(keys))
+    write_meta_store(Path(folder) / "zotero_meta.bin", records, ids=ids,
+                     attrs={"index_factory": "IDMap2,Flat", "embedding_model": get_embedding_backend().name})
+
+
+def bench_build_index(folder, n: int, index_spec: str) -> dict:
+    seconds = build_library(folder, n, index_spec)
+    return {"entries": n, "seconds": seconds, "entries_per_sec": n / seconds}
+
+
+def bench_query_zotero(folder, n: int, dim: int, queries: int, k: int) -> dict:
+    import query_zotero
+    write_synthetic_index(folder, n, dim)
+    handle = query_zotero.ZoteroIndex(Path(folder) / "zotero.index", Path(folder) / "zotero_meta.bin")
+    with use_index(handle):
+        query_zotero.query_zotero_library("warm-up question", k=k)  # loads the index
+        latencies, searches = [], []
+        for i in range(queries):
+            started = time.perf_counter()
+            # A new question each time, so every search makes its embedding request
+            query_zotero.query_zotero_library(f"benchmark question {i} of {n} on calcium and cholesterol", k=k)
+            latencies.append(time.perf_counter() - started)
+            searches.append(handle.last_search_seconds)
+    return {
+        "vectors": n,
+        "dim": dim,
+        "load_ms": handle.load_seconds * 1000,
+        **latency_summary(latencies),
+        **latency_summary(searches, prefix="search_"),
+    }
+
+
+def bench_pubmed_parser(folder, articles: int) -> dict:
+    path = Path(folder) / "efetch.xml"
+    write_fixture(path, articles)
+    return measure(parse_streaming, path)
+
+
+def bench_query_pubmed(articles: int, runs: int) -> dict:
+    from query_pubmed import query_pubmed
+    seconds, found = [], 0
+    for i in range(runs):
+        started = time.perf_counter()
+        with quiet():
+            found = len(query_pubmed(f"calcium and cholesterol in cohort {i}", max_results=articles))
+        seconds.append(time.perf_counter() - started)
+    return {"articles": found, **latency_summary(seconds), "articles_per_sec": found / float(np.median(seconds))}
+
+
+def bench_manager_agent(folder, n: int, runs: int, k: int, index_spec: str) -> dict:
+    import manager_agent
+    import query_zotero
+    build_library(folder, n, index_spec)
+    handle = query_zotero.ZoteroIndex(Path(folder) / "zotero.index", Path(folder) / "zotero_meta.bin")
+
+    totals, sources, first_tokens, failures = [], [], [], 0
+    with use_index(handle):
+        for i in range(runs):
+            question = f"What is the effect of dietary calcium on LDL cholesterol in study {i}?"
+            started = time.perf_counter()
+            first = None
+            try:
+                with quiet():
+                    zotero, pubmed = manager_agent.gather_sources(question, k=k, max_results=5)
+                    gathered = time.perf_counter()
+                    for _ in manager_agent.synthesize_stream(question, zotero, pubmed):
+                        first = first or time.perf_counter()
+            except Exception as e:
+                print(f"⚠️ manager_agent run {i} failed: {type(e).__name__}: {e}")
+                failures += 1
+                continue
+            totals.append(time.perf_counter() - started)
+            sources.append(gathered - started)
+            if first is not None:
+                first_tokens.append(first - started)
+    return {
+        "library": n,
+        "runs": runs,
+        "failures": failures,
+        **latency_summary(totals),
+        **latency_summary(sources, prefix="sources_"),
+        **latency_summary(first_tokens, prefix="first_token_"),
+    }
+
+
+def run_info(args) -> dict:
+    """Git commit, machine and settings, stored next to the results."""
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], cwd=ROOT, capture_output=True, text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    settings = {k: v for k, v in vars(args).items() if k not in ("json", "baseline", "compare")}
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or "unknown",
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": settings,
+    }
+
+
+def run_suite(args) -> dict:
+    stub = StubServices(
+        openai=StubProfile(args.openai_latency, args.jitter, args.error_rate),
+        ncbi=StubProfile(args.ncbi_latency, args.jitter, args.error_rate),
+        dim=args.dim,
+        token_interval=args.token_interval,
+    )
+    selected = args.only or BENCHMARKS
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="research-assistant-bench-") as tmp, stub:
+        tmp = Path(tmp)
+        configure_environment(stub, tmp / "cache")
+        if any(name in selected for name in TOKENIZED_BENCHMARKS):
+            check_tokenizer()
+
+        def run(name, bench, *bench_args):
+            folder = tmp / name.replace("/", "_")
+            folder.mkdir()
+            print(f"⏱️ {name}...", flush=True)
+            results[name] = bench(folder, *bench_args)
+            print(f"   {format_metrics(results[name])}")
+
+        if "build_index" in selected:
+            for n in args.build_sizes:
+                run(f"build_index/{n}", bench_build_index, n, args.index_spec)
+        if "query_zotero" in selected:
+            for n in args.sizes:
+                run(f"query_zotero/{n}", bench_query_zotero, n, args.dim, args.queries, args.k)
+        if "pubmed_parser" in selected:
+            run("pubmed_parser", bench_pubmed_parser, args.parser_articles)
+        if "query_pubmed" in selected:
+            run("query_pubmed", lambda folder: bench_query_pubmed(args.pubmed_articles, args.pubmed_runs))
+        if "manager_agent" in selected:
+            run("manager_agent", bench_manager_agent, args.e2e_size, args.e2e_runs, args.k, args.index_spec)
+
+    info = run_info(args)
+    info["stub_requests"] = dict(stub.requests)
+    return {"run": info, "results": results}
+
+
+def format_metrics(metrics: dict) -> str:
+    return ", ".join(f"{name}={value:.4g}" if isinstance(value, float) else f"{name}={value}"
+                     for name, value in metrics.items())
+
+
+def metric_direction(name: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 for counts and settings."""
+    if name.endswith("_per_sec"):
+        return 1
+    if name.endswith(("_ms", "_seconds", "_mb")) or name == "seconds":
+        return -1
+    return 0
+
+
+def compare_results(before: dict, after: dict, threshold: float = 10.0) -> list[dict]:
+    """
+    Compares the timings and throughputs two runs have in common.
+
+    Args:
+        before, after: Outputs of run_suite (as loaded from --json files).
+        threshold: Percent change beyond which a worse value is a regression.
+
+    Returns:
+        list of dicts with keys: benchmark, metric, before, after, change_pct, regression.
+    """
+    rows = []
+    for benchmark, metrics in after["results"].items():
+        old = before["results"].get(benchmark, {})
+        for metric, value in metrics.items():
+            direction = metric_direction(metric)
+            if not direction or not old.get(metric):
+                continue
+            change = (value - old[metric]) / old[metric] * 100
+            rows.append({
+                "benchmark": benchmark,
+                "metric": metric,
+                "before": old[metric],
+                "after": value,
+                "change_pct": change,
+                "regression": change * direction < -threshold,
+            })
+    return rows
+
+
+def print_comparison(rows, before: dict, after: dict) -> None:
+    print(f"\n📊 {before['run']['commit']} ({before['run']['timestamp']}) -> "
+          f"{after['run']['commit']} ({after['run']['timestamp']})")
+    print(f"{'benchmark':<24}{'metric':<22}{'before':>12}{'after':>12}{'change':>10}")
+    for r in rows:
+        flag = "  ❌" if r["regression"] else ""
+        print(f"{r['benchmark']:<24}{r['metric']:<22}{r['before']:>12.4g}{r['after']:>12.4g}"
+              f"{r['change_pct']:>9.1f}%{flag}")
+    regressions = sum(r["regression"] for r in rows)
+    print(f"\n{'❌' if regressions else '✅'} {regressions} regression(s) in {len(rows)} compared metrics")
+
+
+def load_results(path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline offline against local stand-ins for OpenAI and NCBI.")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="Run only this benchmark; repeat for several")
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("1k,10k,100k"),
+                        help="Synthetic library sizes for query_zotero, e.g. 1k,100k,1M (default: 1k,10k,100k)")
+    parser.add_argument("--build-sizes", type=parse_sizes, default=parse_sizes("1k,10k"),
+                        help="library.bib sizes for build_index (default: 1k,10k)")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimension served by the stub; lower it for 1M vectors")
+    parser.add_argument("--index-spec", default="Flat", help="Index spec passed to build_index.py")
+    parser.add_argument("--queries", type=int, default=100, help="Questions timed per query_zotero library")
+    parser.add_argument("-k", type=int, default=5, help="Papers per Zotero search")
+    parser.add_argument("--parser-articles", type=int, default=20000, help="Articles in the parser fixture")
+    parser.add_argument("--pubmed-articles", type=int, default=1000, help="Articles fetched per query_pubmed run")
+    parser.add_argument("--pubmed-runs", type=int, default=5, help="query_pubmed runs")
+    parser.add_argument("--e2e-size", type=parse_sizes, default=[1000], help="Library size for manager_agent (default: 1k)")
+    parser.add_argument("--e2e-runs", type=int, default=10, help="Questions timed end to end")
+    parser.add_argument("--openai-latency", type=float, default=0.0, help="Stub seconds before each OpenAI response")
+    parser.add_argument("--ncbi-latency", type=float, default=0.0, help="Stub seconds before each E-utilities response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random stub delay, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests answered with an error")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="Stub seconds between streamed answer chunks")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare the results with this earlier JSON file")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change counted as a regression (default: 10)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Only compare two result files")
+    args = parser.parse_args()
+    args.e2e_size = args.e2e_size[0]
+
+    if args.compare:
+        before, after = map(load_results, args.compare)
+    else:
+        after = run_suite(args)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(after, f, indent=2)
+            print(f"\n💾 Results written to {args.json}")
+        if not args.baseline:
+            return
+        before = load_results(args.baseline)
+
+    rows = compare_results(before, after, args.threshold)
+    print_comparison(rows, before, after)
+    if any(r["regression"] for r in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
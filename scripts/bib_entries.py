@@ -0,0 +1,100 @@
+"""
+Helpers for turning pybtex entries from library.bib into the flat records
+stored alongside the FAISS index.
+
+Each entry gets a stable FAISS id derived from its citation key, and a hash
+of the text we embed, so update_index.py can tell which entries are new,
+edited or deleted without re-embedding anything else.
+"""
+
+import hashlib
+import re
+
+from utils import CHUNK_WORDS
+
+# FAISS ids are signed 64-bit; 52 bits of the key hash keeps clear of the sign bit
+ENTRY_ID_BITS = 52
+
+
+def format_authors(persons) -> str:
+    """Flattens pybtex Person objects into "First Last, First Last"."""
+    names = []
+    for person in persons:
+        parts = person.first_names + person.middle_names + person.prelast_names + person.last_names
+        names.append(" ".join(parts).replace("{", "").replace("}", ""))
+    return ", ".join(names)
+
+
+def entry_id(key: str) -> int:
+    """Stable FAISS id for a citation key."""
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") >> (64 - ENTRY_ID_BITS)
+
+
+def text_hash(text: str) -> str:
+    """Content hash of the embedded text; changes only when we must re-embed."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def entry_text(entry) -> str:
+    """Text that gets embedded for an entry."""
+    return entry.fields.get("title", "") or "No title"
+
+
+def entry_chunks(entry, max_words: int = CHUNK_WORDS) -> list[str]:
+    """
+    Splits an entry's abstract into runs of whole sentences of about
+    max_words words, plus one chunk for its keywords.
+    """
+    chunks, current = [], []
+    abstract = " ".join(entry.fields.get("abstract", "").split())
+    for sentence in re.split(r"(?<=[.!?])\s+", abstract):
+        words = sentence.split()
+        if current and len(current) + len(words) > max_words:
+            chunks.append(" ".join(current))
+            current = []
+        current.extend(words)
+    if current:
+        chunks.append(" ".join(current))
+
+    keywords = entry.fields.get("keywords", "").strip()
+    if keywords:
+        chunks.append(f"Keywords: {keywords}")
+    return chunks
+
+
+def entry_pmid(entry) -> str:
+    """PubMed ID of an entry: its pmid field, or "PMID: n" in extra/note (as Zotero exports it)."""
+    if entry.fields.get("pmid"):
+        return entry.fields["pmid"].strip()
+    for field in ("extra", "note", "annote"):
+        match = re.search(r"PMID:\s*(\d+)", entry.fields.get(field, ""))
+        if match:
+            return match.group(1)
+    return ""
+
+
+def entry_record(entry) -> dict:
+    """Metadata record for an entry, as returned by query_zotero_library."""
+    return {
+        "title": entry.fields.get("title", ""),
+        "authors": format_authors(entry.persons.get("author", [])),
+        "year": entry.fields.get("year", ""),
+        "abstract": entry.fields.get("abstract", "") or "[No abstract available]",
+        "keywords": entry.fields.get("keywords", ""),
+        "doi": entry.fields.get("doi", "").strip(),
+        "pmid": entry_pmid(entry),
+        "id": entry.key,
+        "faiss_id": entry_id(entry.key),
+        "text_hash": text_hash(entry_text(entry)),
+        "chunks_hash": text_hash("\n".join(entry_chunks(entry))),
+    }
+
+
+def check_unique_ids(records) -> None:
+    """Raises ValueError if two citation keys hash to the same FAISS id."""
+    seen = {}
+    for r in records:
+        other = seen.setdefault(r["faiss_id"], r["id"])
+        if other != r["id"]:
+            raise ValueError(f"Citation keys {other!r} and {r['id']!r} map to the same index id; rename one.")
@@ -1,81 +1,193 @@
 # build_index.py
+import argparse
+import functools
+import hashlib
+import json
 import os
-import numpy as np
 import faiss
 from pybtex.database import parse_file
-from openai import OpenAI
-from dotenv import load_dotenv
-import pickle
-from tqdm import tqdm
 
-# Load environment variables
-load_dotenv()
-
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Load model names from .env with fallback defaults
-EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+from utils import INDEX_SPEC, INDEX_CHUNKS, INDEX_CHECKPOINT_EVERY, replace_atomically, replace_together
+from embedding_pipeline import embed_into_index
+from embedding_backends import get_embedding_backend
+from bib_entries import entry_record, entry_text, check_unique_ids
+from meta_store import meta_store_writer
+from index_specs import resolve_index_spec, make_index
+from chunk_index import chunk_rows
+from lexical_index import write_lexical_index
+from dedup import write_library_keys
 
 # Paths
 BIB_FILE = "library.bib"
 INDEX_FILE = "zotero.index"
-META_FILE = "zotero_meta.pkl"
+META_FILE = "zotero_meta.bin"
+CHUNK_INDEX_FILE = "zotero_chunks.index"
+LEXICAL_INDEX_FILE = "zotero_lexical.npz"
+LIBRARY_KEYS_FILE = "zotero_keys.npz"
+# Interrupted builds: what was being built, and the partial indexes next to the final ones
+CHECKPOINT_FILE = "zotero_build.json"
+PARTIAL_SUFFIX = ".partial"
+
+
+def build_fingerprint(ids, texts, settings: dict) -> str:
+    """Identifies a build: the entries' ids and texts plus the index settings."""
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+    for faiss_id, text in zip(ids, texts):
+        digest.update(f"{faiss_id}\t{text}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class Checkpoints:
+    """
+    Partial indexes saved while a build embeds, so an interrupted build can
+    continue where it stopped instead of paying for the embeddings again.
+
+    CHECKPOINT_FILE records the fingerprint of the build; a partial index is
+    only resumed by a build with the same entries and settings. Entries are
+    added in order, so a partial index with n vectors holds the first n.
+    The metadata is not checkpointed: it is rebuilt from library.bib without
+    any API calls.
+    """
+
+    def __init__(self, fingerprint: str, every: int = INDEX_CHECKPOINT_EVERY):
+        self.fingerprint = fingerprint
+        self.every = every
+
+    def found(self, index_file: str = INDEX_FILE) -> bool:
+        """True if an interrupted build of the same library left a partial index_file."""
+        try:
+            with open(CHECKPOINT_FILE) as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        return saved.get("fingerprint") == self.fingerprint and os.path.exists(index_file + PARTIAL_SUFFIX)
+
+    def resume(self, index_file: str):
+        """The partial index saved for index_file by an interrupted build of the same library, or None."""
+        if not self.found(index_file):
+            return None
+        index = faiss.read_index(index_file + PARTIAL_SUFFIX)
+        print(f"⏩ Resuming {index_file} after {index.ntotal} embedded entries")
+        return index
+
+    def start(self, resuming: bool) -> None:
+        """Records this build; a fresh build first drops the checkpoints of an older one."""
+        if not resuming:
+            self.clear()
+        if self.every:
+            replace_atomically(CHECKPOINT_FILE, lambda path: self._write_manifest(path))
+
+    def _write_manifest(self, path):
+        with open(path, "w") as f:
+            json.dump({"fingerprint": self.fingerprint}, f)
 
-def embed(text: str) -> list[float]:
-    """Call OpenAI embeddings API to embed a string."""
-    response = client.embeddings.create(
-        input=[text],
-        model=EMBEDDING_MODEL
-    )
-    return response.data[0].embedding
+    def save(self, index_file: str, index) -> None:
+        if not self.every or index is None:
+            return
+        replace_atomically(index_file + PARTIAL_SUFFIX, lambda path: faiss.write_index(index, path))
+        print(f"\n💾 Checkpoint: {index.ntotal} entries in {index_file}{PARTIAL_SUFFIX}")
 
-def main():
+    def saver(self, index_file: str) -> dict:
+        """Keyword arguments for embed_into_index that checkpoint into index_file's partial file."""
+        return {"checkpoint": functools.partial(self.save, index_file), "checkpoint_every": self.every}
+
+    def clear(self) -> None:
+        for path in (CHECKPOINT_FILE, INDEX_FILE + PARTIAL_SUFFIX, CHUNK_INDEX_FILE + PARTIAL_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def embed_or_resume(texts, ids, index_file, checkpoints, resume, **kwargs):
+    """Embeds texts into a new index, or into the saved partial one, skipping the entries already in it."""
+    index = checkpoints.resume(index_file) if resume else None
+    done = index.ntotal if index is not None else 0
+    return embed_into_index(texts[done:], index=index, ids=ids[done:], **checkpoints.saver(index_file), **kwargs)
+
+
+def main(index_spec=INDEX_SPEC, nprobe=None, ef_search=None, chunks=INDEX_CHUNKS, resume=False,
+         checkpoint_every=INDEX_CHECKPOINT_EVERY):
     # Parse bib file
     print(f"Loading bibliography from {BIB_FILE}")
     bib_data = parse_file(BIB_FILE)
     entries = list(bib_data.entries.values())
     print(f"Loaded {len(entries)} entries from {BIB_FILE}")
 
-    # Embed first entry to get dimension
-    first_text = entries[0].fields.get("title", "") or "No title"
-    first_emb = embed(first_text)
-    dim = len(first_emb)
-    print(f"Embedding dimension detected: {dim}")
-
-    # Create new FAISS index
-    index = faiss.IndexFlatL2(dim)
-
-    # Metadata storage (e.g. titles, authors, year)
-    metadata = []
-
-    # Add first embedding
-    index.add(np.array([first_emb], dtype=np.float32))
-    metadata.append({
-        "title": entries[0].fields.get("title", ""),
-        "authors": entries[0].persons.get("author", []),
-        "year": entries[0].fields.get("year", ""),
-        "id": entries[0].key
-    })
-
-    # Embed and add remaining entries
-    for entry in tqdm(entries[1:], desc="Embedding entries"):
-        text = entry.fields.get("title", "") or "No title"
-        emb = embed(text)
-        index.add(np.array([emb], dtype=np.float32))
-        metadata.append({
-            "title": entry.fields.get("title", ""),
-            "authors": entry.persons.get("author", []),
-            "year": entry.fields.get("year", ""),
-            "id": entry.key
-        })
-
-    # Save FAISS index and metadata
-    faiss.write_index(index, INDEX_FILE)
-    with open(META_FILE, "wb") as f:
-        pickle.dump(metadata, f)
+    # Metadata storage (e.g. titles, authors, year), looked up by each entry's stable FAISS id
+    metadata = [entry_record(entry) for entry in entries]
+    check_unique_ids(metadata)
+    ids = [m["faiss_id"] for m in metadata]
+
+    # Embed all entries in token-bounded batches and build a new FAISS index
+    factory_string = resolve_index_spec(index_spec, len(entries))
+    embedding_model = get_embedding_backend().name
+    print(f"Embedding with {embedding_model} into a {factory_string} index")
+    texts = [entry_text(entry) for entry in entries]
+
+    # Save the partial index every checkpoint_every entries; --resume continues from there
+    settings = {"index_factory": factory_string, "embedding_model": embedding_model, "chunks": chunks,
+                "nprobe": nprobe, "ef_search": ef_search}
+    checkpoints = Checkpoints(build_fingerprint(ids, texts, settings), every=checkpoint_every)
+    if resume and not checkpoints.found():
+        print("No checkpoint of this library and settings found; starting from scratch")
+        resume = False
+    checkpoints.start(resuming=resume)
+
+    try:
+        # IndexIDMap2 lets update_index.py remove and replace single entries later
+        index = embed_or_resume(
+            texts, ids, INDEX_FILE, checkpoints, resume,
+            index_factory=lambda dim: faiss.IndexIDMap2(make_index(factory_string, dim, nprobe=nprobe, ef_search=ef_search)),
+        )
+
+        # Optionally embed abstract and keyword chunks into a second index, several vectors per paper
+        chunk_index = None
+        if chunks:
+            checkpoints.save(INDEX_FILE, index)  # a failure while chunking keeps every entry
+            chunk_texts, chunk_ids = chunk_rows(entries, ids)
+            chunk_factory = resolve_index_spec(index_spec, len(chunk_texts))
+            print(f"Embedding {len(chunk_texts)} abstract/keyword chunks into a {chunk_factory} index")
+            chunk_index = embed_or_resume(
+                chunk_texts, chunk_ids, CHUNK_INDEX_FILE, checkpoints, resume,
+                index_factory=lambda dim: faiss.IndexIDMap2(make_index(chunk_factory, dim, nprobe=nprobe, ef_search=ef_search)),
+                desc="Embedding chunks",
+            )
+    except Exception:
+        if checkpoint_every:
+            print("❌ Build interrupted; run scripts/build_index.py --resume to continue from the last checkpoint")
+        raise
+
+    # Save FAISS index and metadata, plus the BM25 index used by lexical and hybrid search
+    # and the PMID/DOI/title keys used to flag PubMed hits already in the library
+    # Each file is swapped in atomically so a running app never reads a partial file
+    write_lexical_index(LEXICAL_INDEX_FILE, metadata)
+    write_library_keys(LIBRARY_KEYS_FILE, metadata)
+    if chunk_index is None and os.path.exists(CHUNK_INDEX_FILE):
+        os.remove(CHUNK_INDEX_FILE)  # stale chunks would point at the previous build
+    # The index and its metadata are written in full before either is renamed into place
+    writes = {}
+    if chunk_index is not None:
+        writes[CHUNK_INDEX_FILE] = lambda path: faiss.write_index(chunk_index, path)
+    writes[INDEX_FILE] = lambda path: faiss.write_index(index, path)
+    writes[META_FILE] = meta_store_writer(metadata, ids=ids,
+                                          attrs={"index_factory": factory_string, "embedding_model": embedding_model})
+    replace_together(writes)
+    checkpoints.clear()
 
     print(f"Index and metadata saved: {INDEX_FILE}, {META_FILE}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build the FAISS index for library.bib.")
+    parser.add_argument("--index-spec", default=INDEX_SPEC,
+                        help="Flat (exact), HNSW, IVF-Flat, or any FAISS factory string (default: %(default)s)")
+    parser.add_argument("--nprobe", type=int, help="IVF lists to probe per query")
+    parser.add_argument("--ef-search", type=int, help="HNSW candidate list size per query")
+    parser.add_argument("--chunks", action=argparse.BooleanOptionalAction, default=INDEX_CHUNKS,
+                        help="Also index abstract and keyword chunks (default: INDEX_CHUNKS in .env)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted build from its last checkpoint")
+    parser.add_argument("--checkpoint-every", type=int, default=INDEX_CHECKPOINT_EVERY,
+                        help="Save the partial index every N embedded entries, 0 to disable (default: %(default)s)")
+    args = parser.parse_args()
+
+    main(args.index_spec, nprobe=args.nprobe, ef_search=args.ef_search, chunks=args.chunks, resume=args.resume,
+         checkpoint_every=args.checkpoint_every)
@@ -0,0 +1,139 @@
+"""
+Chunk Index
+
+Optional second FAISS index holding several vectors per paper: one per
+abstract chunk plus one for its keywords (see bib_entries.entry_chunks).
+Chunk j of the paper with FAISS id p is stored under id (p << CHUNK_BITS) | j,
+so a search label maps back to its paper with a single shift.
+
+At query time, chunk hits and title hits are merged into per-paper scores
+with NumPy (sort + reduceat, no Python loop over hits), taking the best
+(`max`) or total (`sum`) similarity of each paper's vectors.
+"""
+
+import math
+
+import faiss
+import numpy as np
+
+from bib_entries import ENTRY_ID_BITS, entry_chunks
+
+# Chunk ids must stay clear of the sign bit of FAISS's int64 labels
+CHUNK_BITS = 63 - ENTRY_ID_BITS
+MAX_CHUNKS = 1 << CHUNK_BITS
+
+# Extra candidates fetched per expected paper, so a few papers with many
+# matching chunks do not crowd the rest out of the top k
+OVERFETCH = 2
+
+
+def chunk_rows(entries, paper_ids):
+    """
+    Lists the chunk texts of every entry with their chunk ids.
+
+    Args:
+        entries: pybtex entries.
+        paper_ids: FAISS id of each entry.
+
+    Returns:
+        tuple: (list of texts, int64 array of chunk ids)
+    """
+    texts, ids = [], []
+    for entry, paper_id in zip(entries, paper_ids):
+        chunks = entry_chunks(entry)[:MAX_CHUNKS]
+        texts.extend(chunks)
+        ids.extend((paper_id << CHUNK_BITS) | j for j in range(len(chunks)))
+    return texts, np.array(ids, dtype=np.int64)
+
+
+def chunk_ids_for_papers(index, paper_ids) -> np.ndarray:
+    """Ids of all chunks in an IndexIDMap2 chunk index that belong to paper_ids."""
+    all_ids = faiss.vector_to_array(index.id_map)
+    return all_ids[np.isin(all_ids >> CHUNK_BITS, np.asarray(list(paper_ids), dtype=np.int64))]
+
+
+def similarities(distances: np.ndarray) -> np.ndarray:
+    """Squared L2 distances between unit vectors, as cosine similarities."""
+    return 1.0 - distances / 2.0
+
+
+def aggregate_by_paper(scores: np.ndarray, paper_ids: np.ndarray, k: int, how: str = "max"):
+    """
+    Combines hit scores per (query, paper) and keeps each query's top k papers.
+
+    Args:
+        scores: (n_queries, m) similarities, higher is better.
+        paper_ids: (n_queries, m) paper FAISS ids; -1 marks padding.
+        k: Papers to keep per query.
+        how: "max" (best hit per paper) or "sum" (total over its hits).
+
+    Returns:
+        tuple: (scores, paper ids), each of shape (n_queries, k) and padded
+        with -inf / -1 when a query has fewer than k papers.
+    """
+    if how not in ("max", "sum"):
+        raise ValueError(f"Unknown aggregation {how!r}; use 'max' or 'sum'.")
+    n_queries = scores.shape[0]
+    out_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+    out_ids = np.full((n_queries, k), -1, dtype=np.int64)
+
+    queries = np.repeat(np.arange(n_queries), scores.shape[1])
+    papers, values = paper_ids.ravel(), scores.ravel()
+    valid = papers >= 0
+    queries, papers, values = queries[valid], papers[valid], values[valid]
+    if len(papers) == 0:
+        return out_scores, out_ids
+
+    # Group hits by (query, paper) and reduce each group to one score
+    order = np.lexsort((papers, queries))
+    queries, papers, values = queries[order], papers[order], values[order]
+    starts = np.flatnonzero(np.r_[True, (queries[1:] != queries[:-1]) | (papers[1:] != papers[:-1])])
+    reduce = np.maximum if how == "max" else np.add
+    group_scores = reduce.reduceat(values, starts)
+    group_queries, group_papers = queries[starts], papers[starts]
+
+    # Rank papers within each query, best first, and keep the top k
+    order = np.lexsort((-group_scores, group_queries))
+    group_queries, group_papers, group_scores = group_queries[order], group_papers[order], group_scores[order]
+    found = np.bincount(group_queries, minlength=n_queries)
+    first = np.r_[0, np.cumsum(found)[:-1]]
+    rank = np.arange(len(group_queries)) - first[group_queries]
+    keep = rank < k
+    out_scores[group_queries[keep], rank[keep]] = group_scores[keep]
+    out_ids[group_queries[keep], rank[keep]] = group_papers[keep]
+    return out_scores, out_ids
+
+
+def search_papers(index, chunk_index, vectors: np.ndarray, k: int, how: str = "max"):
+    """
+    Searches the title index and the chunk index and ranks papers by their
+    aggregated similarity.
+
+    The chunk search fetches about k * (chunks per paper) * OVERFETCH hits
+    and doubles that while some query's k-th paper scores below the weakest
+    chunk fetched, i.e. while an unfetched chunk could still change the
+    ranking (exact for "max", a good approximation for "sum").
+
+    Returns:
+        tuple: (scores, paper FAISS ids), each of shape (n_queries, k).
+    """
+    D, I = index.search(vectors, k)
+    title_scores = similarities(D)
+    k_found = min(k, index.ntotal)
+    if chunk_index is None or chunk_index.ntotal == 0 or k_found == 0:
+        return title_scores, I
+
+    per_paper = chunk_index.ntotal / max(index.ntotal, 1)
+    fetch = min(chunk_index.ntotal, math.ceil(k * per_paper * OVERFETCH))
+    while True:
+        chunk_D, chunk_I = chunk_index.search(vectors, fetch)
+        chunk_scores = similarities(chunk_D)
+        chunk_papers = np.where(chunk_I >= 0, chunk_I >> CHUNK_BITS, -1)
+        scores, ids = aggregate_by_paper(
+            np.hstack([title_scores, chunk_scores]),
+            np.hstack([I, chunk_papers]),
+            k, how,
+        )
+        if fetch >= chunk_index.ntotal or np.all(scores[:, k_found - 1] >= chunk_scores[:, -1]):
+            return scores, ids
+        fetch = min(chunk_index.ntotal, fetch * 2)
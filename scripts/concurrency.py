@@ -0,0 +1,45 @@
+"""
+Per-service concurrency limits shared by every thread in the process.
+
+Wrap each outbound call in `service_slot("openai")` or `service_slot("ncbi")`
+so that running pipeline stages in parallel never has more than the
+configured number of requests in flight to one service. Answer synthesis
+uses `service_slot("openai_synthesis")`, which is held for the whole stream.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from tracing import in_context
+from utils import OPENAI_CONCURRENCY, OPENAI_SYNTHESIS_CONCURRENCY, NCBI_CONCURRENCY
+
+SERVICE_LIMITS = {
+    "openai": OPENAI_CONCURRENCY,
+    "openai_synthesis": OPENAI_SYNTHESIS_CONCURRENCY,
+    "ncbi": NCBI_CONCURRENCY,
+}
+
+_semaphores = {name: threading.BoundedSemaphore(limit) for name, limit in SERVICE_LIMITS.items()}
+
+
+@contextmanager
+def service_slot(service: str):
+    """Blocks until a request slot for `service` is free, then holds it."""
+    with _semaphores[service]:
+        yield
+
+
+def parallel_map(func, items, max_workers: int = None) -> list:
+    """
+    Calls func on every item in worker threads and returns results in input order.
+
+    Exceptions raised by func propagate to the caller.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=max_workers or len(items)) as pool:
+        # Each call runs in a copy of the caller's context, so trace spans keep their parent
+        futures = [pool.submit(in_context(func), item) for item in items]
+        return [future.result() for future in futures]
@@ -0,0 +1,320 @@
+"""
+Query Database
+
+Shared access to queries.db for the app, the CLI and the PubMed watchers.
+
+- Connections are reused: one per thread and database file, opened in WAL
+  mode with a busy timeout, so concurrent Streamlit sessions and cron jobs
+  read while another process writes instead of failing with "database is
+  locked".
+- The schema is created once per process by numbered migrations tracked in
+  PRAGMA user_version, instead of CREATE TABLE IF NOT EXISTS on every call.
+- Search results are stored as one JSON row per paper (result_items), so
+  they can be queried back as structured records.
+
+Tables:
+    query_log        questions asked (id, query_text, timestamp)
+    query_results    free-text outputs per query and source (e.g. the synthesis)
+    result_items     papers returned per query and source, in rank order
+    query_metrics    numeric measurements per query (timings, ...)
+    spans            timed pipeline stages per query, with tokens and cost (see tracing.py)
+    seen_pmids, watch_watermarks, watch_schedule
+                     PubMed watcher state, per watcher (see watch_store.py)
+"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils import ROOT
+
+DB_PATH = ROOT / "queries.db"
+
+# Applied in order; a database at user_version N has had the first N applied.
+# The first and third use IF NOT EXISTS because databases from before
+# migrations may already have those tables.
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS query_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        query_text TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS query_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        query_id INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(query_id) REFERENCES query_log(id)
+    );
+    CREATE TABLE IF NOT EXISTS query_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        query_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        value REAL NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(query_id) REFERENCES query_log(id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_query_log_timestamp ON query_log(timestamp);
+    CREATE INDEX IF NOT EXISTS idx_query_log_text ON query_log(query_text);
+    CREATE INDEX IF NOT EXISTS idx_query_results_query_id ON query_results(query_id);
+    CREATE INDEX IF NOT EXISTS idx_query_metrics_query_id ON query_metrics(query_id);
+    """,
+    """
+    CREATE TABLE result_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        query_id INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        rank INTEGER NOT NULL,
+        item TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(query_id) REFERENCES query_log(id)
+    );
+    CREATE INDEX idx_result_items_query_id ON result_items(query_id, source, rank);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS seen_pmids (
+        term TEXT NOT NULL,
+        pmid TEXT NOT NULL,
+        first_seen TEXT NOT NULL,
+        PRIMARY KEY (term, pmid)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS watch_watermarks (
+        term TEXT PRIMARY KEY,
+        last_checked TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS watch_schedule (
+        term TEXT PRIMARY KEY,
+        next_check REAL NOT NULL,
+        hit_rate REAL NOT NULL,
+        checks INTEGER NOT NULL DEFAULT 0
+    );
+    """,
+    """
+    CREATE TABLE spans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        query_id INTEGER NOT NULL,
+        span_id TEXT NOT NULL,
+        parent_id TEXT,
+        name TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        duration_ms REAL NOT NULL,
+        status TEXT NOT NULL,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        cost_usd REAL,
+        attrs TEXT NOT NULL DEFAULT '{}',
+        FOREIGN KEY(query_id) REFERENCES query_log(id)
+    );
+    CREATE INDEX idx_spans_query_id ON spans(query_id);
+    """,
+    # Each watcher (watch_pubmed.py, the find_new_papers.py daemon) keeps its own seen
+    # PMIDs and watermarks. Rows from before are copied to both, so neither re-reports them.
+    """
+    CREATE TABLE seen_pmids_by_watcher (
+        watcher TEXT NOT NULL,
+        term TEXT NOT NULL,
+        pmid TEXT NOT NULL,
+        first_seen TEXT NOT NULL,
+        PRIMARY KEY (watcher, term, pmid)
+    ) WITHOUT ROWID;
+    INSERT INTO seen_pmids_by_watcher (watcher, term, pmid, first_seen)
+        SELECT watcher, term, pmid, first_seen FROM seen_pmids,
+            (SELECT 'watch_pubmed' AS watcher UNION ALL SELECT 'refresh_daemon');
+    DROP TABLE seen_pmids;
+    ALTER TABLE seen_pmids_by_watcher RENAME TO seen_pmids;
+    CREATE TABLE watch_watermarks_by_watcher (
+        watcher TEXT NOT NULL,
+        term TEXT NOT NULL,
+        last_checked TEXT NOT NULL,
+        PRIMARY KEY (watcher, term)
+    );
+    INSERT INTO watch_watermarks_by_watcher (watcher, term, last_checked)
+        SELECT watcher, term, last_checked FROM watch_watermarks,
+            (SELECT 'watch_pubmed' AS watcher UNION ALL SELECT 'refresh_daemon');
+    DROP TABLE watch_watermarks;
+    ALTER TABLE watch_watermarks_by_watcher RENAME TO watch_watermarks;
+    """,
+]
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Applies the migrations a database has not had yet."""
+    # BEGIN IMMEDIATE takes the write lock, so two processes never apply the same step
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in script.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def get_connection(db_path=DB_PATH) -> sqlite3.Connection:
+    """
+    Returns this thread's connection to a database, opening and migrating it
+    on first use.
+    """
+    key = str(db_path)
+    connections = _local.__dict__.setdefault("connections", {})
+    conn = connections.get(key)
+    if conn is None:
+        # isolation_level=None: statements autocommit unless wrapped in transaction()
+        conn = sqlite3.connect(key, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _migrate_lock:
+            if key not in _migrated:
+                _migrate(conn)
+                _migrated.add(key)
+        connections[key] = conn
+    return conn
+
+
+def close_connection(db_path=DB_PATH) -> None:
+    """Closes this thread's connection to a database, if it has one."""
+    conn = _local.__dict__.get("connections", {}).pop(str(db_path), None)
+    if conn is not None:
+        conn.close()
+
+
+@contextmanager
+def transaction(db_path=DB_PATH):
+    """Runs the statements in the block as one transaction, rolled back on error."""
+    conn = get_connection(db_path)
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def log_query(query: str, db_path=DB_PATH) -> int:
+    """Logs a user query and returns its ID."""
+    cursor = get_connection(db_path).execute(
+        "INSERT INTO query_log (query_text, timestamp) VALUES (?, ?)", (query, datetime.now())
+    )
+    return cursor.lastrowid
+
+
+def save_results(query_id: int, source: str, content: str, db_path=DB_PATH) -> None:
+    """Saves a free-text result (such as the synthesized answer) for a query."""
+    get_connection(db_path).execute(
+        "INSERT INTO query_results (query_id, source, content) VALUES (?, ?, ?)",
+        (query_id, source, content),
+    )
+
+
+def save_result_items(query_id: int, source: str, items, db_path=DB_PATH) -> None:
+    """
+    Saves the papers a source returned for a query, one JSON row each, in a
+    single transaction.
+
+    Args:
+        query_id: ID from log_query.
+        source: "zotero", "pubmed", ...
+        items: Result dicts in rank order.
+    """
+    rows = [(query_id, source, rank, json.dumps(item, default=str)) for rank, item in enumerate(items)]
+    with transaction(db_path) as conn:
+        conn.executemany("INSERT INTO result_items (query_id, source, rank, item) VALUES (?, ?, ?, ?)", rows)
+
+
+def load_result_items(query_id: int, source: str = None, db_path=DB_PATH) -> list[dict]:
+    """Papers saved for a query (optionally from one source), in rank order."""
+    sql = "SELECT item FROM result_items WHERE query_id = ?"
+    params = [query_id]
+    if source is not None:
+        sql += " AND source = ?"
+        params.append(source)
+    rows = get_connection(db_path).execute(sql + " ORDER BY source, rank", params)
+    return [json.loads(item) for (item,) in rows]
+
+
+def log_metrics(query_id: int, metrics: dict, db_path=DB_PATH) -> None:
+    """Records numeric measurements for a query, e.g. {"synthesis_seconds": 4.2}."""
+    with transaction(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO query_metrics (query_id, name, value) VALUES (?, ?, ?)",
+            [(query_id, name, value) for name, value in metrics.items()],
+        )
+
+
+def log_metric(query_id: int, name: str, value: float, db_path=DB_PATH) -> None:
+    """Records one numeric measurement for a query."""
+    log_metrics(query_id, {name: value}, db_path=db_path)
+
+
+def recent_queries(limit: int = None, db_path=DB_PATH) -> list[str]:
+    """Distinct logged questions, most recently asked first."""
+    sql = "SELECT query_text FROM query_log GROUP BY query_text ORDER BY MAX(id) DESC"
+    params = ()
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = (limit,)
+    return [text for (text,) in get_connection(db_path).execute(sql, params)]
+
+
+SPAN_COLUMNS = ("span_id", "parent_id", "name", "started_at", "duration_ms", "status",
+                "prompt_tokens", "completion_tokens", "cost_usd")
+
+
+def save_spans(query_id: int, spans, db_path=DB_PATH) -> None:
+    """
+    Saves the spans of a query's trace in a single transaction.
+
+    Args:
+        query_id: ID from log_query.
+        spans: Dicts with the SPAN_COLUMNS keys plus "attrs" (see tracing.Span.to_dict).
+    """
+    rows = [
+        (query_id, *(span[c] for c in SPAN_COLUMNS), json.dumps(span.get("attrs") or {}, default=str))
+        for span in spans
+    ]
+    with transaction(db_path) as conn:
+        conn.executemany(
+            f"INSERT INTO spans (query_id, {', '.join(SPAN_COLUMNS)}, attrs) VALUES ({', '.join('?' * (len(SPAN_COLUMNS) + 2))})",
+            rows,
+        )
+
+
+def _span_dicts(rows) -> list[dict]:
+    spans = []
+    for query_id, *values, attrs in rows:
+        span = dict(zip(SPAN_COLUMNS, values), query_id=query_id)
+        span["attrs"] = json.loads(attrs)
+        spans.append(span)
+    return spans
+
+
+def load_spans(query_id: int, db_path=DB_PATH) -> list[dict]:
+    """Spans recorded for a query, in start order."""
+    rows = get_connection(db_path).execute(
+        f"SELECT query_id, {', '.join(SPAN_COLUMNS)}, attrs FROM spans WHERE query_id = ? ORDER BY started_at, id",
+        (query_id,),
+    )
+    return _span_dicts(rows)
+
+
+def recent_spans(queries: int = 100, db_path=DB_PATH) -> list[dict]:
+    """Spans of the most recent `queries` traced queries."""
+    rows = get_connection(db_path).execute(f"""
+        SELECT query_id, {', '.join(SPAN_COLUMNS)}, attrs FROM spans
+        WHERE query_id IN (SELECT DISTINCT query_id FROM spans ORDER BY query_id DESC LIMIT ?)
+        ORDER BY query_id, started_at, id
+    """, (queries,))
+    return _span_dicts(rows)
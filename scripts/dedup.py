@@ -0,0 +1,364 @@
+"""
+Paper De-duplication
+
+Recognises the same paper across PubMed searches and the Zotero library by,
+in order: PMID, DOI, normalized title, and near-identical title (small
+differences in punctuation, markup or typos).
+
+Near-identical titles are found with MinHash over character 5-grams and
+locality-sensitive hashing: each title gets BANDS band keys, and only titles
+sharing a band key are compared, so matching stays linear in the number of
+papers instead of comparing every pair. Candidates are confirmed by the
+Jaccard similarity of their 5-gram sets (TITLE_SIMILARITY). Two papers whose
+PMIDs or DOIs are both known and differ are never merged.
+
+The Zotero library's keys are precomputed by build_index.py/update_index.py
+into zotero_keys.npz (sorted 64-bit key hashes, searched with
+np.searchsorted), so each PubMed hit is checked against the library without
+touching the metadata store. Strings are kept as UTF-8 bytes plus offsets
+and the file is memory-mapped, so opening it costs little whatever the
+library size.
+"""
+
+import hashlib
+import mmap
+import re
+import struct
+import unicodedata
+import zipfile
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils import replace_atomically
+
+SHINGLE = 5
+BANDS = 8
+ROWS = 4  # MinHash values per band; BANDS * ROWS hash functions in total
+TITLE_SIMILARITY = 0.8
+# Cap on fuzzy candidates examined per paper
+MAX_CANDIDATES = 50
+
+_SEEDS = np.random.default_rng(20240501).integers(1, 2 ** 63, size=BANDS * ROWS, dtype=np.uint64)
+_EMPTY = np.uint64(0)  # band key of titles too short to shingle; never matched
+
+
+def normalize_title(title) -> str:
+    """Lowercase ASCII words of a title, without accents, markup or punctuation."""
+    text = unicodedata.normalize("NFKD", str(title or "")).encode("ascii", "ignore").decode()
+    text = re.sub(r"<[^>]+>", " ", text)
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def normalize_doi(doi) -> str:
+    doi = str(doi or "").strip().lower()
+    return re.sub(r"^(https?://(dx\.)?doi\.org/|doi:\s*)", "", doi)
+
+
+def paper_ids(paper: dict) -> tuple[str, str]:
+    """(PMID, normalized DOI) of a PubMed result or library record; "" when unknown."""
+    return str(paper.get("pmid") or "").strip(), normalize_doi(paper.get("doi"))
+
+
+def exact_keys(paper: dict) -> list[str]:
+    """Keys that identify a paper exactly, strongest first."""
+    pmid, doi = paper_ids(paper)
+    title = normalize_title(paper.get("title"))
+    return [key for key in (pmid and f"pmid:{pmid}", doi and f"doi:{doi}", title and f"title:{title}") if key]
+
+
+def conflicting(a: dict, b: dict) -> bool:
+    """True if two papers have different PMIDs or different DOIs (both known)."""
+    return any(x and y and x != y for x, y in zip(paper_ids(a), paper_ids(b)))
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    """splitmix64 finaliser, applied elementwise."""
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def _shingle_hashes(titles):
+    """
+    Hashes the character 5-grams of every normalized title in one pass.
+
+    Returns:
+        tuple: (title index per 5-gram, uint64 hash per 5-gram), grouped by title.
+    """
+    encoded = [t.encode("ascii") for t in titles]
+    data = np.frombuffer(b"\0".join(encoded) + b"\0", dtype=np.uint8)
+    if len(data) < SHINGLE:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.uint64)
+    doc_of_byte = np.repeat(np.arange(len(titles)), [len(e) + 1 for e in encoded])
+    windows = sliding_window_view(data, SHINGLE).astype(np.uint64)
+    valid = ~(windows == 0).any(axis=1)  # drop 5-grams spanning two titles
+    h = np.zeros(len(windows), dtype=np.uint64)
+    for j in range(SHINGLE):
+        h = h * np.uint64(0x100000001B3) ^ windows[:, j]
+    return doc_of_byte[:len(windows)][valid], _mix(h[valid])
+
+
+def title_bands(titles) -> np.ndarray:
+    """
+    LSH band keys of normalized titles.
+
+    Returns:
+        uint64 array of shape (len(titles), BANDS); titles sharing any key are
+        fuzzy-match candidates. Titles shorter than a 5-gram get _EMPTY keys.
+    """
+    n = len(titles)
+    bands = np.full((n, BANDS), _EMPTY, dtype=np.uint64)
+    docs, hashes = _shingle_hashes(titles)
+    if len(hashes) == 0:
+        return bands
+    starts = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+    has_shingles = docs[starts]
+
+    signature = np.empty((len(starts), BANDS * ROWS), dtype=np.uint64)
+    for p, seed in enumerate(_SEEDS):
+        signature[:, p] = np.minimum.reduceat(_mix(hashes ^ seed), starts)
+
+    keys = np.zeros((len(starts), BANDS), dtype=np.uint64)
+    for b in range(BANDS):
+        key = np.full(len(starts), b + 1, dtype=np.uint64)
+        for r in range(ROWS):
+            key = _mix(key ^ signature[:, b * ROWS + r])
+        keys[:, b] = key
+    keys[keys == _EMPTY] = 1  # keep _EMPTY reserved
+    bands[has_shingles] = keys
+    return bands
+
+
+def _grams(title: str) -> set:
+    return {title[i:i + SHINGLE] for i in range(len(title) - SHINGLE + 1)}
+
+
+def title_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the character 5-grams of two normalized titles."""
+    ga, gb = _grams(a), _grams(b)
+    return len(ga & gb) / len(ga | gb) if ga and gb else float(a == b)
+
+
+def merge_papers(papers: list[dict]) -> dict:
+    """The first paper, with fields it lacks filled in from the others."""
+    merged = dict(papers[0])
+    for other in papers[1:]:
+        for field, value in other.items():
+            if value and not merged.get(field):
+                merged[field] = value
+    return merged
+
+
+def deduplicate_papers(papers):
+    """
+    Merges duplicate papers (same PMID, DOI or normalized title, or a
+    near-identical title) and keeps the first occurrence's position.
+
+    Returns:
+        list of papers, each duplicate group merged with merge_papers.
+    """
+    papers = list(papers)
+    parent = list(range(len(papers)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        ri, rj = find(i), find(j)
+        if ri != rj and not conflicting(papers[ri], papers[rj]):
+            parent[max(ri, rj)] = min(ri, rj)
+
+    first_with_key = {}
+    for i, paper in enumerate(papers):
+        for key in exact_keys(paper):
+            union(first_with_key.setdefault(key, i), i)
+
+    titles = [normalize_title(p.get("title")) for p in papers]
+    buckets = {}  # (band, key) -> earlier papers with that band key
+    for i, row in enumerate(title_bands(titles)):
+        row_buckets = [buckets.setdefault((b, key), []) for b, key in enumerate(row) if key != _EMPTY]
+        candidates = dict.fromkeys(j for bucket in row_buckets for j in bucket)
+        for j in list(candidates)[:MAX_CANDIDATES]:
+            if find(i) != find(j) and title_similarity(titles[i], titles[j]) >= TITLE_SIMILARITY:
+                union(j, i)
+        for bucket in row_buckets:
+            bucket.append(i)
+
+    groups = {}
+    for i in range(len(papers)):
+        groups.setdefault(find(i), []).append(papers[i])
+    return [merge_papers(group) for group in groups.values()]
+
+
+def key_hashes(keys) -> np.ndarray:
+    """64-bit hashes of exact_keys strings."""
+    return np.array([int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+                     for key in keys], dtype=np.uint64)
+
+
+def _pack_strings(strings) -> tuple[np.ndarray, np.ndarray]:
+    """Concatenated UTF-8 bytes of strings, and the offset of each (plus the end)."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+class _Strings:
+    """Read-only list of strings stored by _pack_strings."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+
+def _map_npz(path) -> dict:
+    """
+    Memory-maps every array of an uncompressed .npz file (as written by np.savez).
+
+    np.load ignores mmap_mode for .npz files, so each member's .npy header is
+    read here and its data viewed in place with np.frombuffer.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} is compressed and cannot be memory-mapped; rebuild it.")
+            # Local file header: 30 bytes, then the file name and extra field
+            name_len, extra_len = struct.unpack_from("<HH", mm, info.header_offset + 26)
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            count = int(np.prod(shape))
+            array = np.frombuffer(mm, dtype=dtype, count=count, offset=f.tell())
+            arrays[info.filename.removesuffix(".npy")] = array.reshape(shape, order="F" if fortran_order else "C")
+    return arrays
+
+
+def write_library_keys(path, records) -> None:
+    """
+    Precomputes the lookup keys of the Zotero library and writes them atomically.
+
+    Args:
+        path: Destination file (.npz).
+        records: Metadata records (entry_record) with "id", "title", "doi", "pmid".
+    """
+    titles = [normalize_title(r.get("title")) for r in records]
+    rows, keys = [], []
+    for row, record in enumerate(records):
+        for key in exact_keys(record):
+            rows.append(row)
+            keys.append(key)
+    hashes = key_hashes(keys)
+    order = np.argsort(hashes, kind="stable")
+
+    bands = title_bands(titles).ravel()
+    band_rows = np.repeat(np.arange(len(records), dtype=np.int64), BANDS)
+    usable = bands != _EMPTY
+    band_order = np.argsort(bands[usable], kind="stable")
+
+    columns = {
+        "citation_keys": [r["id"] for r in records],
+        "titles": titles,
+        "pmids": [paper_ids(r)[0] for r in records],
+        "dois": [paper_ids(r)[1] for r in records],
+    }
+    arrays = {}
+    for name, strings in columns.items():
+        arrays[f"{name}_data"], arrays[f"{name}_offsets"] = _pack_strings(strings)
+
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                **arrays,
+                exact_hashes=hashes[order],
+                exact_rows=np.array(rows, dtype=np.int64)[order],
+                band_keys=bands[usable][band_order],
+                band_rows=band_rows[usable][band_order],
+            )
+
+    replace_atomically(path, write)
+
+
+class LibraryKeys:
+    """
+    Membership checks against the Zotero library, memory-mapped from
+    write_library_keys output.
+    """
+
+    def __init__(self, path):
+        data = _map_npz(path)
+        if "exact_hashes" not in data:
+            raise ValueError(f"{path} was written by an older version; run scripts/update_index.py.")
+        self.citation_keys, self.titles, self.pmids, self.dois = (
+            _Strings(data[f"{name}_data"], data[f"{name}_offsets"])
+            for name in ("citation_keys", "titles", "pmids", "dois")
+        )
+        self.exact_hashes = data["exact_hashes"]
+        self.exact_rows = data["exact_rows"]
+        self.band_keys = data["band_keys"]
+        self.band_rows = data["band_rows"]
+
+    def __len__(self) -> int:
+        return len(self.citation_keys)
+
+    def _record(self, row) -> dict:
+        return {"pmid": self.pmids[row], "doi": self.dois[row], "title": self.titles[row]}
+
+    def _exact_row(self, paper):
+        keys = exact_keys(paper)
+        hashes = key_hashes(keys)
+        lo = np.searchsorted(self.exact_hashes, hashes, side="left")
+        hi = np.searchsorted(self.exact_hashes, hashes, side="right")
+        for key, start, end in zip(keys, lo, hi):
+            for row in self.exact_rows[start:end]:
+                record = self._record(row)
+                # Equal hashes are confirmed against the row, in case two keys collide
+                if key in exact_keys(record) and not conflicting(paper, record):
+                    return row
+        return None
+
+    def match(self, papers) -> list:
+        """
+        Finds each paper in the library.
+
+        Returns:
+            list with the citation key of the matching library entry, or None,
+            for each paper.
+        """
+        papers = list(papers)
+        matches = [self._exact_row(p) if len(self) else None for p in papers]
+
+        todo = [i for i, row in enumerate(matches) if row is None]
+        titles = [normalize_title(papers[i].get("title")) for i in todo]
+        if todo and len(self.band_keys):
+            bands = title_bands(titles)
+            lo = np.searchsorted(self.band_keys, bands, side="left")
+            hi = np.searchsorted(self.band_keys, bands, side="right")
+            for n, i in enumerate(todo):
+                candidates = []
+                for start, end in zip(lo[n], hi[n]):
+                    candidates.extend(self.band_rows[start:end].tolist())
+                best, best_score = None, TITLE_SIMILARITY
+                for row in list(dict.fromkeys(candidates))[:MAX_CANDIDATES]:
+                    score = title_similarity(titles[n], self.titles[row])
+                    if score >= best_score and not conflicting(papers[i], self._record(row)):
+                        best, best_score = row, score
+                matches[i] = best
+
+        return [None if row is None else self.citation_keys[row] for row in matches]
@@ -0,0 +1,154 @@
+"""
+Embedding Backends
+
+Every embedding in the project (library entries, chunks and questions) goes
+through the backend selected by EMBEDDING_BACKEND:
+
+- "openai": the OpenAI embeddings endpoint (EMBEDDING_MODEL); vectors are
+  cached on disk and requests are packed into token-bounded batches.
+- "local": a hashed character n-gram embedder in pure NumPy. It needs no
+  network or model download and runs at CPU speed, so indexes can be
+  built offline and benchmarks are not capped by API rate limits. Its
+  vectors are lexical rather than semantic.
+
+A backend's `name` identifies the vector space: it keys the embedding cache
+and is stored in the index metadata, so an index is never queried with
+vectors from another backend. Add a backend by subclassing EmbeddingBackend
+and registering it in BACKENDS.
+"""
+
+import os
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from openai import OpenAI
+
+from tracing import span
+from utils import EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_CONCURRENCY, LOCAL_EMBEDDING_DIM
+
+_client = None
+
+
+def openai_client() -> OpenAI:
+    """The OpenAI client, created on first use so local builds need no API key."""
+    global _client
+    if _client is None:
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
+class EmbeddingBackend:
+    """
+    Interface for embedding providers.
+
+    Attributes:
+        name: Identifier of the vector space (model name plus settings).
+        use_cache: Whether vectors are worth storing in the embedding cache.
+        token_limited: Whether batches must respect the API token limits.
+        concurrency: Batches to embed in parallel.
+    """
+
+    name = None
+    use_cache = True
+    token_limited = True
+    concurrency = 1
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """
+        Embeds a batch of texts.
+
+        Returns:
+            float32 array of shape (len(texts), dim), in input order.
+        """
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """Calls the OpenAI embeddings endpoint, one request per batch."""
+
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        self.name = model
+        self.concurrency = EMBEDDING_CONCURRENCY
+
+    def embed(self, texts):
+        with span("openai.embeddings", texts=len(texts)) as s:
+            response = openai_client().embeddings.create(input=texts, model=self.name)
+            if getattr(response, "usage", None) is not None:
+                s.add_usage(self.name, response.usage.prompt_tokens)
+        data = sorted(response.data, key=lambda d: d.index)
+        return np.array([d.embedding for d in data], dtype=np.float32)
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    Local embedder: character n-grams of the lowercased text are hashed into
+    `dim` signed buckets (the hashing trick), counts are log-scaled and each
+    vector is L2-normalised, so L2 distance ranks like cosine similarity.
+
+    The whole batch is hashed at once over one byte array; there is no
+    Python loop over n-grams.
+    """
+
+    use_cache = False  # recomputing is faster than a cache lookup
+    token_limited = False
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM, ngrams=(3, 4, 5)):
+        self.dim = dim
+        self.ngrams = tuple(ngrams)
+        self.name = f"local-hash-{dim}-{'-'.join(map(str, self.ngrams))}"
+
+    def embed(self, texts):
+        n = len(texts)
+        # Pad each text with spaces so word boundaries form n-grams; \0 separates texts
+        encoded = [f" {' '.join(t.lower().split())} ".encode("utf-8") for t in texts]
+        data = np.frombuffer(b"\0".join(encoded) + b"\0", dtype=np.uint8)
+        doc_of_byte = np.repeat(np.arange(n), [len(e) + 1 for e in encoded])
+        counts = np.zeros(n * self.dim, dtype=np.float64)
+
+        for size in self.ngrams:
+            if len(data) < size:
+                continue
+            windows = sliding_window_view(data, size).astype(np.uint64)
+            valid = ~(windows == 0).any(axis=1)  # drop n-grams that span two texts
+            h = np.full(len(windows), size, dtype=np.uint64)
+            for j in range(size):
+                h = h * np.uint64(0x100000001B3) ^ windows[:, j]
+            # splitmix64 finaliser spreads similar n-grams across buckets
+            h ^= h >> np.uint64(30)
+            h *= np.uint64(0xBF58476D1CE4E5B9)
+            h ^= h >> np.uint64(27)
+            h *= np.uint64(0x94D049BB133111EB)
+            h ^= h >> np.uint64(31)
+
+            buckets = (h % np.uint64(self.dim)).astype(np.int64)
+            signs = np.where(h >> np.uint64(63), -1.0, 1.0)
+            docs = doc_of_byte[:len(windows)]
+            counts += np.bincount(
+                docs[valid] * self.dim + buckets[valid], weights=signs[valid], minlength=n * self.dim
+            )
+
+        vectors = counts.reshape(n, self.dim)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+BACKENDS = {
+    "openai": OpenAIEmbeddingBackend,
+    "local": HashingEmbeddingBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_embedding_backend() -> EmbeddingBackend:
+    """Returns the process-wide backend chosen by EMBEDDING_BACKEND."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if EMBEDDING_BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown EMBEDDING_BACKEND {EMBEDDING_BACKEND!r}; use one of {', '.join(BACKENDS)}.")
+            _backend = BACKENDS[EMBEDDING_BACKEND]()
+        return _backend
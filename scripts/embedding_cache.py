@@ -0,0 +1,149 @@
+"""
+Embedding Cache
+
+Persistent, content-addressed store of embedding vectors shared by
+build_index.py, update_index.py and query_zotero.py. Entries are keyed by
+(embedding model, SHA-256 of the text) and kept in a SQLite file under
+CACHE_DIR. When the file grows past EMBEDDING_CACHE_MAX_MB the least
+recently used vectors are evicted.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from utils import CACHE_DIR, EMBEDDING_CACHE_MAX_MB
+
+CACHE_PATH = CACHE_DIR / "embeddings.sqlite"
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+def text_hash(text: str) -> str:
+    """Returns the content address used as the cache key for a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed LRU cache of float32 embedding vectors.
+
+    Safe to share between threads; all access goes through one connection
+    guarded by a lock.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        # Running estimate of stored bytes; recomputed exactly before evicting
+        self._total_bytes = self._stored_bytes()
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts) -> dict[int, np.ndarray]:
+        """
+        Looks up cached vectors for a list of texts.
+
+        Returns:
+            dict mapping position in `texts` to its float32 vector, for hits only.
+        """
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), _LOOKUP_CHUNK):
+                chunk = list(set(hashes[i:i + _LOOKUP_CHUNK]))
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk],
+                ).fetchall()
+                found.update(rows)
+
+            # Touch hits so eviction removes the least recently used vectors first
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+
+        result = {
+            i: np.frombuffer(found[h], dtype=np.float32)
+            for i, h in enumerate(hashes) if h in found
+        }
+        self.hits += len(result)
+        self.misses += len(texts) - len(result)
+        return result
+
+    def put_many(self, model: str, texts, vectors) -> None:
+        """Stores vectors for texts, then evicts old entries if over the size cap."""
+        now = time.time()
+        rows = [
+            (model, text_hash(t), np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            self._total_bytes += sum(len(r[2]) for r in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Deletes least recently used rows until the stored vectors fit in max_bytes."""
+        total = self._stored_bytes()
+        self._total_bytes = total
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% of the cap so we don't evict again on the very next insert
+        excess = total - int(self.max_bytes * 0.9)
+        cursor = self._conn.execute("SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_used")
+        doomed = []
+        for rowid, size in cursor:
+            doomed.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", doomed)
+        self._conn.commit()
+        self._total_bytes = self._stored_bytes()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Returns the process-wide embedding cache, opening it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
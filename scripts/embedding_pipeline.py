@@ -0,0 +1,214 @@
+"""
+Embedding Pipeline
+
+Shared by build_index.py, update_index.py and query_zotero.py. Packs texts
+into batches (token-bounded for the OpenAI API), sends several batches to the
+configured embedding backend at once, and streams the returned vectors into
+a FAISS index with one bulk `index.add` call per window of entries. Texts
+already in the embedding cache are never sent to the API.
+"""
+
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+import tiktoken
+from tqdm import tqdm
+
+from embedding_backends import get_embedding_backend
+from embedding_cache import get_embedding_cache
+from index_specs import training_rows
+from tracing import in_context
+from utils import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BATCH_TOKENS,
+    EMBEDDING_BATCH_SIZE,
+)
+
+# The embeddings endpoint rejects any single input longer than this
+MAX_INPUT_TOKENS = 8191
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    """Tokenizer of EMBEDDING_MODEL, loaded on first use (tiktoken may download it)."""
+    try:
+        return tiktoken.encoding_for_model(EMBEDDING_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _truncate(tokens: list[int], text: str) -> str:
+    """Cuts a text down to MAX_INPUT_TOKENS tokens so the API accepts it."""
+    if len(tokens) <= MAX_INPUT_TOKENS:
+        return text
+    return get_encoding().decode(tokens[:MAX_INPUT_TOKENS])
+
+
+def iter_token_batches(texts, max_tokens: int = None, max_items: int = None):
+    """
+    Groups texts into consecutive batches that fit a single embeddings request.
+
+    Args:
+        texts: Sequence of strings to embed.
+        max_tokens: Upper bound on the summed token count of a batch
+            (default EMBEDDING_BATCH_TOKENS).
+        max_items: Upper bound on the number of inputs in a batch
+            (default EMBEDDING_BATCH_SIZE).
+
+    Yields:
+        tuple: (start offset into texts, list of texts in the batch)
+    """
+    max_tokens = max_tokens or EMBEDDING_BATCH_TOKENS
+    max_items = max_items or EMBEDDING_BATCH_SIZE
+    encoding = get_encoding()
+    batch, batch_tokens, start = [], 0, 0
+    for i, text in enumerate(texts):
+        tokens = encoding.encode_ordinary(text)
+        text = _truncate(tokens, text)
+        n_tokens = min(len(tokens), MAX_INPUT_TOKENS)
+        if batch and (batch_tokens + n_tokens > max_tokens or len(batch) >= max_items):
+            yield start, batch
+            batch, batch_tokens, start = [], 0, i
+        batch.append(text)
+        batch_tokens += n_tokens
+    if batch:
+        yield start, batch
+
+
+def iter_fixed_batches(texts, max_items: int = None):
+    """Batches of at most max_items texts, for backends without token limits."""
+    max_items = max_items or EMBEDDING_BATCH_SIZE
+    for start in range(0, len(texts), max_items):
+        yield start, list(texts[start:start + max_items])
+
+
+def embed_batch(texts: list[str]) -> np.ndarray:
+    """
+    Embeds a list of texts with one backend call (one API request for OpenAI).
+
+    Returns:
+        float32 array of shape (len(texts), dim), in input order.
+    """
+    return get_embedding_backend().embed(texts)
+
+
+def iter_embeddings(texts, concurrency: int = None):
+    """
+    Embeds texts with up to `concurrency` batches in flight, reading through
+    the embedding cache.
+
+    Texts are processed in windows; cached vectors are looked up per window
+    and only the misses are sent to the backend. Windows are yielded in input
+    order so callers can keep metadata aligned with FAISS row ids.
+
+    Yields:
+        tuple: (start offset into texts, float32 array of vectors)
+    """
+    backend = get_embedding_backend()
+    concurrency = concurrency or backend.concurrency
+    window = EMBEDDING_BATCH_SIZE * concurrency
+    cache = get_embedding_cache()
+    batches = iter_token_batches if backend.token_limited else iter_fixed_batches
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for start in range(0, len(texts), window):
+            chunk = list(texts[start:start + window])
+            vectors = cache.get_many(backend.name, chunk) if backend.use_cache else {}
+
+            missing = [i for i in range(len(chunk)) if i not in vectors]
+            if missing:
+                missing_texts = [chunk[i] for i in missing]
+                futures = [
+                    (offset, pool.submit(in_context(embed_batch), batch))
+                    for offset, batch in batches(missing_texts)
+                ]
+                for offset, future in futures:
+                    embedded = future.result()
+                    if backend.use_cache:
+                        cache.put_many(backend.name, missing_texts[offset:offset + len(embedded)], embedded)
+                    for j, vector in enumerate(embedded):
+                        vectors[missing[offset + j]] = vector
+
+            yield start, np.stack([vectors[i] for i in range(len(chunk))])
+
+
+def embed_texts(texts) -> np.ndarray:
+    """
+    Embeds a handful of texts (e.g. user queries) through the cache.
+
+    Returns:
+        float32 array of shape (len(texts), dim).
+    """
+    return np.concatenate([vectors for _, vectors in iter_embeddings(texts)])
+
+
+def embed_into_index(texts, index=None, index_factory=faiss.IndexFlatL2, desc="Embedding entries", ids=None,
+                     checkpoint=None, checkpoint_every: int = None):
+    """
+    Embeds texts and adds them to a FAISS index in bulk, reporting entries/sec.
+
+    Indexes that need training (e.g. IVF) are first trained on a random
+    sample of the texts (see `training_rows`); with a caching backend those
+    texts are then read back from the cache when they are added.
+
+    Args:
+        texts: Sequence of strings; row i of the index (offset by its current
+            size) corresponds to texts[i].
+        index: Existing FAISS index to extend. If None, one is created with
+            `index_factory(dim)` once the first batch reveals the dimension.
+        index_factory: Callable taking the embedding dimension.
+        desc: Progress bar label.
+        ids: Optional FAISS ids, one per text, for indexes wrapped in
+            IndexIDMap2; vectors are then added with add_with_ids.
+        checkpoint: Optional callable taking the index, called whenever at
+            least `checkpoint_every` more texts have been added since the
+            last call. Texts are added in order, so texts[:index.ntotal]
+            (less any vectors the index held before) are in it by then.
+
+    Returns:
+        The FAISS index (None only if texts is empty and no index was given).
+    """
+    if ids is not None:
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) != len(texts):
+            raise ValueError(f"Got {len(ids)} ids for {len(texts)} texts.")
+
+    def add(vectors, start):
+        if ids is None:
+            index.add(vectors)
+        else:
+            index.add_with_ids(vectors, ids[start:start + len(vectors)])
+
+    started = time.perf_counter()
+    cache = get_embedding_cache()
+    hits_before = cache.hits
+    added = 0
+    checkpointed = 0
+    with tqdm(total=len(texts), desc=desc, unit="entries") as progress:
+        for start, vectors in iter_embeddings(texts):
+            progress.update(len(vectors))
+            if index is None:
+                index = index_factory(vectors.shape[1])
+                print(f"Embedding dimension detected: {vectors.shape[1]}")
+            if not index.is_trained:
+                sample = [texts[i] for i in training_rows(index, len(texts))]
+                _train(index, np.concatenate([v for _, v in iter_embeddings(sample)]))
+            add(vectors, start)
+            added = start + len(vectors)
+            if checkpoint and checkpoint_every and added - checkpointed >= checkpoint_every:
+                checkpoint(index)
+                checkpointed = added
+
+    elapsed = time.perf_counter() - started
+    if texts:
+        print(f"⚡ Embedded {len(texts)} entries in {elapsed:.1f}s ({len(texts) / max(elapsed, 1e-9):.1f} entries/sec, "
+              f"{cache.hits - hits_before} from cache)")
+    return index
+
+
+def _train(index, vectors: np.ndarray) -> None:
+    started = time.perf_counter()
+    index.train(vectors)
+    print(f"🎯 Trained index on {len(vectors)} vectors in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,180 @@
+"""
+NCBI E-utilities Client
+
+One pooled HTTP session for esearch, epost and efetch, shared by
+query_pubmed.py, watch_pubmed.py and find_new_papers.py. Requests are paced
+by a token bucket at NCBI's published limit (3 requests/sec, or 10 with an
+NCBI_API_KEY), and 429/5xx responses are retried with backoff. Searches can
+keep their results on the NCBI history server (usehistory / WebEnv) so that
+follow-up fetches don't have to resend the ID list.
+"""
+
+import threading
+import time
+from xml.etree import ElementTree as ET
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import EUTILS_BASE_URL, NCBI_API_KEY, NCBI_EMAIL
+from concurrency import service_slot, SERVICE_LIMITS
+from tracing import span
+
+NCBI_TOOL = "research-assistant"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Above this many IDs, send them in a POST body instead of the URL
+POST_ID_THRESHOLD = 200
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `acquire()` blocks until a request may be sent.
+
+    With the default capacity of 1, requests are spaced evenly at `rate` per
+    second, which never exceeds NCBI's per-second limit in any window.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EutilsClient:
+    """Rate-limited E-utilities client over a pooled keep-alive session."""
+
+    def __init__(self, api_key=NCBI_API_KEY, email=NCBI_EMAIL, base_url=EUTILS_BASE_URL,
+                 rate: float = None, max_retries: int = 4, timeout: float = 30):
+        self.api_key = api_key
+        self.email = email
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = TokenBucket(rate or (10 if api_key else 3))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(SERVICE_LIMITS["ncbi"], 1))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _request(self, endpoint: str, params: dict, stream: bool = False) -> requests.Response:
+        """Sends one E-utilities request, pacing it and retrying throttled calls."""
+        url = f"{self.base_url}/{endpoint}"
+        params = {k: v for k, v in params.items() if v is not None}
+        params.update(tool=NCBI_TOOL, email=self.email)
+        if self.api_key:
+            params["api_key"] = self.api_key
+        use_post = len(str(params.get("id", "")).split(",")) > POST_ID_THRESHOLD
+
+        with span(f"ncbi.{endpoint.split('.')[0]}") as s:
+            for attempt in range(self.max_retries + 1):
+                self.limiter.acquire()
+                with service_slot("ncbi"):
+                    if use_post:
+                        response = self.session.post(url, data=params, timeout=self.timeout, stream=stream)
+                    else:
+                        response = self.session.get(url, params=params, timeout=self.timeout, stream=stream)
+                s.set(attempts=attempt + 1, status_code=response.status_code)
+                if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    response.close()
+                    retry_after = response.headers.get("Retry-After", "")
+                    time.sleep(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+                    continue
+                response.raise_for_status()
+                return response
+
+    def esearch(self, term: str, db: str = "pubmed", retmax: int = 20, usehistory: bool = False, **params) -> dict:
+        """
+        Runs an ESearch query.
+
+        Extra keyword arguments are passed through as E-utilities parameters
+        (e.g. sort, datetype, mindate, maxdate).
+
+        Returns:
+            dict with keys: ids (list of str), count (int), webenv, query_key
+            (the last two only when usehistory is set).
+        """
+        response = self._request("esearch.fcgi", {
+            "db": db,
+            "term": term,
+            "retmode": "xml",
+            "retmax": retmax,
+            "usehistory": "y" if usehistory else None,
+            **params,
+        })
+        root = ET.fromstring(response.content)
+        return {
+            "ids": [id.text for id in root.findall(".//IdList/Id")],
+            "count": int(root.findtext("Count", "0")),
+            "webenv": root.findtext("WebEnv"),
+            "query_key": root.findtext("QueryKey"),
+        }
+
+    def epost(self, ids, db: str = "pubmed", webenv: str = None) -> dict:
+        """
+        Uploads IDs to the history server.
+
+        Returns:
+            dict with keys: webenv, query_key.
+        """
+        response = self._request("epost.fcgi", {"db": db, "id": ",".join(ids), "WebEnv": webenv})
+        root = ET.fromstring(response.content)
+        return {"webenv": root.findtext("WebEnv"), "query_key": root.findtext("QueryKey")}
+
+    def efetch(self, ids=None, db: str = "pubmed", webenv: str = None, query_key: str = None,
+               rettype: str = "abstract", retmode: str = "xml", retstart: int = None, retmax: int = None,
+               stream: bool = False):
+        """
+        Fetches records either by ID list or from a history-server result set.
+
+        Args:
+            stream: Return the open response instead of its body; read it via
+                `response.raw` (e.g. with pubmed_parser.iter_pubmed_articles)
+                and close it when done.
+
+        Returns:
+            Raw response body, or the streaming response if `stream` is set.
+        """
+        response = self._request("efetch.fcgi", {
+            "db": db,
+            "id": ",".join(ids) if ids else None,
+            "WebEnv": webenv,
+            "query_key": query_key,
+            "rettype": rettype,
+            "retmode": retmode,
+            "retstart": retstart,
+            "retmax": retmax,
+        }, stream=stream)
+        if stream:
+            response.raw.decode_content = True  # undo gzip transfer encoding
+            return response
+        return response.content
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_eutils_client() -> EutilsClient:
+    """Returns the process-wide client so every caller shares one session and rate budget."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = EutilsClient()
+        return _client
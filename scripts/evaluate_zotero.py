@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Offline evaluation of Zotero retrieval, using the batch query API.
+
+Scores a question set with known relevant papers (recall@k and MRR), or
+replays saved questions from query_log to review what the library returns.
+All queries are embedded together and searched as one matrix.
+
+Question sets are JSONL, one object per line:
+    {"query": "Does calcium lower LDL?", "expected": ["smith2020", "lee2021"]}
+
+Usage:
+    python scripts/evaluate_zotero.py --questions questions.jsonl -k 10
+    python scripts/evaluate_zotero.py --from-log 200 --json replay.json
+"""
+
+import argparse
+import json
+import time
+
+from db import DB_PATH, recent_queries
+from query_client import get_query_client
+
+
+def load_questions(path) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_logged_queries(limit: int, db_path=DB_PATH) -> list[dict]:
+    """Most recent distinct questions from query_log, newest first."""
+    return [{"query": text} for text in recent_queries(limit, db_path=db_path)]
+
+
+def score(questions, results, k: int) -> dict:
+    """
+    recall@k and mean reciprocal rank over questions that list expected keys.
+
+    Args:
+        questions: Dicts with "query" and optionally "expected" citation keys.
+        results: Retrieved metadata lists, one per question.
+        k: Cut-off used for the search.
+    """
+    recalls, reciprocal_ranks = [], []
+    for question, papers in zip(questions, results):
+        expected = set(question.get("expected") or [])
+        if not expected:
+            continue
+        keys = [p["id"] for p in papers[:k]]
+        recalls.append(len(expected & set(keys)) / len(expected))
+        first_hit = next((rank for rank, key in enumerate(keys, 1) if key in expected), None)
+        reciprocal_ranks.append(1 / first_hit if first_hit else 0.0)
+    if not recalls:
+        return {}
+    return {
+        "judged_queries": len(recalls),
+        f"recall@{k}": sum(recalls) / len(recalls),
+        "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks),
+    }
+
+
+def evaluate(questions, k: int = 10) -> dict:
+    """Runs every question through one batch search and scores the results."""
+    client = get_query_client()
+    started = time.perf_counter()
+    results = client.search([q["query"] for q in questions], k=k)
+    elapsed = time.perf_counter() - started
+    return {
+        "queries": len(questions),
+        "k": k,
+        "seconds": elapsed,
+        "search_seconds": client.last_index_stats["last_search_seconds"],
+        **score(questions, results, k),
+        "results": [
+            {"query": q["query"], "ids": [p["id"] for p in papers]}
+            for q, papers in zip(questions, results)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate Zotero retrieval with batched queries.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--questions", help="JSONL question set with expected citation keys")
+    source.add_argument("--from-log", type=int, metavar="N", help="Replay the N most recent logged questions")
+    parser.add_argument("-k", type=int, default=10, help="Papers retrieved per query")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions) if args.questions else load_logged_queries(args.from_log)
+    if not questions:
+        print("No questions to evaluate.")
+        return
+    report = evaluate(questions, k=args.k)
+
+    print(f"🔎 {report['queries']} queries in {report['seconds']:.2f}s "
+          f"(search {report['search_seconds'] * 1000:.1f} ms for the whole batch)")
+    if "mrr" in report:
+        print(f"📈 recall@{args.k}: {report[f'recall@{args.k}']:.3f}, MRR: {report['mrr']:.3f} "
+              f"over {report['judged_queries']} judged queries")
+    else:
+        for row in report["results"]:
+            print(f"\n❓ {row['query']}\n   {', '.join(row['ids']) or '(no results)'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
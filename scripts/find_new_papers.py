@@ -3,49 +3,51 @@
 Finds new PubMed papers for previously saved queries in the last N days.
 Prints a summary for each query, even if there are no new results.
 
+With --daemon it keeps running instead and re-checks each query on its own
+schedule: a priority queue orders queries by their next check time, and
+each query's interval shrinks while its checks keep turning up new papers
+and grows while they don't (between WATCH_MIN_INTERVAL_HOURS and
+WATCH_MAX_INTERVAL_DAYS). Checks run on WATCH_WORKERS threads within a
+shared budget of WATCH_NCBI_RATE requests/sec, and ask only for records
+entered since the query's previous check. The schedule, seen PMIDs and
+watermarks are kept in queries.db (see watch_store.py), so a restarted
+daemon carries on where it stopped.
+
 Usage:
     python scripts/find_new_papers.py --days 60
+    python scripts/find_new_papers.py --daemon
 """
 
-import os
-import sqlite3
+import heapq
 import argparse
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from dotenv import load_dotenv
-from Bio import Entrez
 
 ROOT = Path(__file__).resolve().parents[1]
-DB_PATH = ROOT / "queries.db"
 
 # Load .env
 load_dotenv(ROOT / ".env")
-Entrez.email = os.getenv("EMAIL_USER") or os.getenv("EMAIL_FROM") or "researchassistant@example.com"
-
-def get_saved_queries(db_path="queries.db"):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    
-    # Check which tables exist
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = [row[0] for row in cur.fetchall()]
-    
-    query_list = []
-    if "queries" in tables:
-        # Use queries table
-        cur.execute("SELECT DISTINCT query_text FROM query_log ORDER BY timestamp DESC")
-        query_list = [row[0] for row in cur.fetchall()]
-    elif "query_log" in tables:
-        # Fallback to query_log if queries table doesn't exist
-        cur.execute("PRAGMA table_info(query_log);")
-        cols = [row[1] for row in cur.fetchall()]
-        # Try to find a column with 'query' in its name
-        query_col = next((c for c in cols if "query" in c.lower()), cols[0])
-        cur.execute(f"SELECT DISTINCT {query_col} FROM query_log ORDER BY rowid DESC")
-        query_list = [row[0] for row in cur.fetchall()]
-
-    conn.close()
-    return query_list
+
+from eutils import get_eutils_client, TokenBucket
+from watch_store import WatchStore, REFRESH_DAEMON
+from db import DB_PATH, recent_queries
+from utils import WATCH_MIN_INTERVAL_HOURS, WATCH_MAX_INTERVAL_DAYS, WATCH_WORKERS, WATCH_NCBI_RATE
+
+# Weight of the latest check in a query's moving-average hit rate, and the
+# hit rate assumed for a query that has not been checked yet
+HIT_RATE_ALPHA = 0.3
+INITIAL_HIT_RATE = 0.5
+
+# How often the daemon re-reads query_log for new queries (seconds)
+SYNC_SECONDS = 600
+
+def get_saved_queries(db_path=DB_PATH):
+    """Distinct queries from query_log, most recently asked first."""
+    return recent_queries(db_path=db_path)
 
 
 def search_pubmed(query, since_days=30, max_results=10):
@@ -53,15 +55,179 @@ def search_pubmed(query, since_days=30, max_results=10):
     since_date = (datetime.today() - timedelta(days=since_days)).strftime("%Y/%m/%d")
     query_str = f"({query}) AND ({since_date}[PDAT] : 3000[PDAT])"
 
-    handle = Entrez.esearch(db="pubmed", term=query_str, retmax=max_results, sort="pub+date")
-    results = Entrez.read(handle)
-    handle.close()
+    results = get_eutils_client().esearch(query_str, retmax=max_results, sort="pub+date")
+    return results["ids"]
+
+def search_pubmed_since(query, since, max_results=10):
+    """Search PubMed for articles on a query entered (EDAT) on or after a date."""
+    results = get_eutils_client().esearch(
+        query, retmax=max_results, sort="pub+date", datetype="edat",
+        mindate=since.strftime("%Y/%m/%d"), maxdate=date.today().strftime("%Y/%m/%d"),
+    )
+    return results["ids"]
+
+def refresh_interval(hit_rate, min_interval, max_interval):
+    """
+    Seconds until a query's next check: min_interval for a query whose checks
+    always find new papers, max_interval for one whose checks never do, and
+    geometrically in between.
+    """
+    return min_interval * (max_interval / min_interval) ** (1 - hit_rate)
+
+
+class RefreshScheduler:
+    """
+    Priority queue of saved queries ordered by next check time, with
+    intervals adapted to each query's recent hit rate and persisted in a
+    WatchStore.
+    """
+
+    def __init__(self, store, min_interval=WATCH_MIN_INTERVAL_HOURS * 3600,
+                 max_interval=WATCH_MAX_INTERVAL_DAYS * 86400, workers=WATCH_WORKERS,
+                 rate=WATCH_NCBI_RATE, first_days=30, max_results=10, clock=time.time):
+        self.store = store
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.workers = workers
+        self.first_days = first_days
+        self.max_results = max_results
+        self.clock = clock
+        self.budget = TokenBucket(rate)  # on top of the client's process-wide NCBI limit
+
+        # term -> (next_check, hit_rate, checks); each term has exactly one queue entry
+        # except while it is being checked
+        self.state = store.load_schedule()
+        self.queue = [(next_check, term) for term, (next_check, _, _) in self.state.items()]
+        heapq.heapify(self.queue)
+
+    def sync_terms(self, terms) -> int:
+        """Schedules queries not seen before for an immediate check; returns how many were added."""
+        now = self.clock()
+        added = 0
+        for term in terms:
+            if term not in self.state:
+                self.state[term] = (now, INITIAL_HIT_RATE, 0)
+                self.store.save_schedule(term, now, INITIAL_HIT_RATE, 0)
+                heapq.heappush(self.queue, (now, term))
+                added += 1
+        return added
+
+    def pop_due(self, now, limit):
+        """Removes and returns up to `limit` queries whose check time has come, earliest first."""
+        due = []
+        while self.queue and self.queue[0][0] <= now and len(due) < limit:
+            due.append(heapq.heappop(self.queue)[1])
+        return due
+
+    def seconds_until_due(self, now):
+        return max(self.queue[0][0] - now, 0) if self.queue else None
+
+    def check(self, term):
+        """
+        Searches PubMed for a query from its watermark onwards and records
+        what it finds.
+
+        Returns:
+            list of PMIDs not seen before for this query.
+        """
+        today = date.today()
+        since = self.store.watermark(term) or today - timedelta(days=self.first_days)
+        self.budget.acquire()
+        ids = search_pubmed_since(term, since, max_results=self.max_results)
+        new_ids = self.store.filter_new(term, ids)
+        self.store.mark_seen(term, new_ids, today)
+        self.store.set_watermark(term, today)
+        return new_ids
+
+    def complete(self, term, new_ids, now):
+        """
+        Updates a query's hit rate after a check and puts it back in the queue.
+
+        Args:
+            term: The query that was checked.
+            new_ids: New PMIDs found, or None if the check failed (the query
+                is then retried after min_interval, with its hit rate unchanged).
+            now: Time the check finished.
+
+        Returns:
+            Timestamp of the query's next check.
+        """
+        _, hit_rate, checks = self.state[term]
+        if new_ids is None:
+            next_check = now + self.min_interval
+        else:
+            hit_rate = HIT_RATE_ALPHA * (1.0 if new_ids else 0.0) + (1 - HIT_RATE_ALPHA) * hit_rate
+            checks += 1
+            next_check = now + refresh_interval(hit_rate, self.min_interval, self.max_interval)
+        self.state[term] = (next_check, hit_rate, checks)
+        self.store.save_schedule(term, next_check, hit_rate, checks)
+        heapq.heappush(self.queue, (next_check, term))
+        return next_check
+
+    def run(self, load_terms, stop=None, sync_seconds=SYNC_SECONDS):
+        """
+        Checks due queries until `stop` is set.
+
+        Args:
+            load_terms: Zero-argument function returning the saved queries;
+                called every sync_seconds to pick up new ones.
+            stop: threading.Event that ends the loop.
+        """
+        stop = stop or threading.Event()
+        next_sync = self.clock()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while not stop.is_set():
+                now = self.clock()
+                if now >= next_sync:
+                    added = self.sync_terms(load_terms())
+                    if added:
+                        print(f"🗓️ Scheduled {added} new queries ({len(self.state)} in total)")
+                    next_sync = now + sync_seconds
+
+                for term in self.pop_due(now, self.workers - len(running)):
+                    running[pool.submit(self.check, term)] = term
+
+                # With every worker busy, a query already due can't start until one finishes
+                due_in = self.seconds_until_due(now) if len(running) < self.workers else None
+                wait_for = min(t for t in (due_in, next_sync - now) if t is not None)
+                if not running:
+                    stop.wait(max(wait_for, 0))
+                    continue
+                done, _ = wait(running, timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish(running.pop(future), future)
+            # Let checks in flight finish so their results are recorded
+            for future in wait(running).done:
+                self._finish(running.pop(future), future)
+
+    def _finish(self, term, future):
+        try:
+            new_ids = future.result()
+        except Exception as e:
+            print(f"⚠️ Check failed for '{term}': {e}")
+            new_ids = None
+        next_check = self.complete(term, new_ids, self.clock())
+        if new_ids:
+            print(f"✅ Topic: {term} — {len(new_ids)} new papers: {', '.join(new_ids)}")
+        print(f"   ⏭️ Next check of '{term}' at {datetime.fromtimestamp(next_check):%Y-%m-%d %H:%M}")
+
 
-    ids = results.get("IdList", [])
-    return ids
+def run_daemon():
+    store = WatchStore(DB_PATH, watcher=REFRESH_DAEMON)
+    scheduler = RefreshScheduler(store)
+    print(f"🛰️ Watching saved queries with {scheduler.workers} workers "
+          f"at up to {WATCH_NCBI_RATE:g} NCBI requests/sec (Ctrl-C to stop)")
+    stop = threading.Event()
+    try:
+        scheduler.run(lambda: get_saved_queries(DB_PATH), stop)
+    except KeyboardInterrupt:
+        stop.set()
+    finally:
+        store.close()
 
 def main(days):
-    queries = get_saved_queries()
+    queries = get_saved_queries(DB_PATH)
     if not queries:
         print("⚠️  No saved queries found in the database.")
         return
@@ -78,6 +244,10 @@ def main(days):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Check PubMed for new papers for saved queries.")
     parser.add_argument("--days", type=int, default=30, help="Number of days to look back for new papers (default: 30)")
+    parser.add_argument("--daemon", action="store_true", help="Keep running and re-check each query on an adaptive schedule")
     args = parser.parse_args()
 
-    main(args.days)
+    if args.daemon:
+        run_daemon()
+    else:
+        main(args.days)
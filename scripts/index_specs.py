@@ -0,0 +1,92 @@
+"""
+Index Specs
+
+Maps the index types offered by build_index.py (Flat, HNSW, IVF-Flat) onto
+FAISS index-factory strings and creates the matching index. Any other FAISS
+factory string (e.g. "IVF4096,PQ32") is passed through unchanged.
+"""
+
+import math
+
+import faiss
+import numpy as np
+
+# Search settings used when none are given; FAISS's own defaults (nprobe=1,
+# efSearch=16) trade away too much recall for our library sizes
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+
+def resolve_index_spec(spec: str, n_vectors: int) -> str:
+    """
+    Turns a friendly spec name into a FAISS factory string.
+
+    Args:
+        spec: "Flat", "HNSW", "IVF"/"IVF-Flat", or a raw factory string.
+        n_vectors: Expected library size, used to pick the IVF list count.
+
+    Returns:
+        A string accepted by faiss.index_factory.
+    """
+    name = spec.strip().upper().replace("_", "-")
+    if name == "FLAT":
+        return "Flat"
+    if name == "HNSW":
+        return "HNSW32"
+    if name in ("IVF", "IVF-FLAT"):
+        # ~4*sqrt(n) lists, but keep at least 39 training points per list
+        nlist = max(1, min(int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // 39))
+        return f"IVF{nlist},Flat"
+    return spec
+
+
+def make_index(factory_string: str, dim: int, nprobe: int = None, ef_search: int = None):
+    """
+    Creates an empty (possibly untrained) L2 index and applies search settings.
+
+    Args:
+        factory_string: Output of resolve_index_spec.
+        dim: Embedding dimension.
+        nprobe: IVF lists probed per query (stored in the index file).
+        ef_search: HNSW candidate list size per query (stored in the index file).
+    """
+    index = faiss.index_factory(dim, factory_string, faiss.METRIC_L2)
+    set_search_params(index, nprobe=nprobe or DEFAULT_NPROBE, ef_search=ef_search or DEFAULT_EF_SEARCH)
+    return index
+
+
+def set_search_params(index, nprobe: int = None, ef_search: int = None) -> None:
+    """Applies nprobe / efSearch to an index if it has those knobs."""
+    if nprobe:
+        try:
+            ivf = faiss.extract_index_ivf(index)
+            ivf.nprobe = min(nprobe, ivf.nlist)
+        except RuntimeError:
+            pass
+    if ef_search and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+def training_sample_size(index) -> int:
+    """Number of vectors to train on, or 0 if no training is needed."""
+    if index.is_trained:
+        return 0
+    try:
+        return 50 * faiss.extract_index_ivf(index).nlist
+    except RuntimeError:
+        return 10000
+
+
+def training_rows(index, n_vectors: int, seed: int = 0) -> np.ndarray:
+    """
+    Picks the rows an untrained index is trained on.
+
+    The rows are a random sample rather than the first ones, because libraries
+    and exports are ordered (by date added, by collection) and IVF centroids
+    learned from one end of the library fit the rest of it poorly.
+
+    Returns:
+        Sorted row numbers, empty if the index needs no training.
+    """
+    size = min(training_sample_size(index), n_vectors)
+    return np.sort(np.random.default_rng(seed).choice(n_vectors, size=size, replace=False))
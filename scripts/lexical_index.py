@@ -0,0 +1,140 @@
+"""
+Lexical Index
+
+Local BM25 index over each paper's title, authors, year and keywords, built
+next to the FAISS index by build_index.py and update_index.py. Searching it
+needs no embedding call, so exact lookups of a known title or author answer
+in milliseconds offline.
+
+The index is a sorted vocabulary plus CSR postings (document rows and term
+frequencies per term) saved with np.savez; query terms are found by binary
+search and scored with one bincount per query.
+"""
+
+import re
+
+import numpy as np
+
+from utils import replace_atomically
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or the to with without".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens, without stopwords."""
+    return [t for t in re.findall(r"[^\W_]+", text.lower()) if t not in STOPWORDS]
+
+
+def record_text(record: dict) -> str:
+    """The fields of a metadata record that are indexed."""
+    return " ".join(str(record.get(field, "")) for field in ("title", "authors", "year", "keywords"))
+
+
+def write_lexical_index(path, records) -> None:
+    """
+    Builds the BM25 index for metadata records and writes it atomically.
+
+    Args:
+        path: Destination file (.npz).
+        records: Metadata records with a "faiss_id" each.
+    """
+    doc_tokens = [tokenize(record_text(r)) for r in records]
+    doc_len = np.array([len(tokens) for tokens in doc_tokens], dtype=np.float32)
+    all_tokens = np.array([t for tokens in doc_tokens for t in tokens], dtype=str)
+    token_docs = np.repeat(np.arange(len(records), dtype=np.int64), doc_len.astype(np.int64))
+
+    terms, term_of_token = np.unique(all_tokens, return_inverse=True)
+    # One posting per (term, doc) pair, sorted by term then doc
+    pairs, tf = np.unique(term_of_token * max(len(records), 1) + token_docs, return_counts=True)
+    posting_terms, posting_docs = np.divmod(pairs, max(len(records), 1))
+    term_starts = np.searchsorted(posting_terms, np.arange(len(terms) + 1))
+
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                terms=terms,
+                term_starts=term_starts.astype(np.int64),
+                posting_docs=posting_docs.astype(np.int32),
+                posting_tf=tf.astype(np.float32),
+                doc_len=doc_len,
+                doc_ids=np.array([r["faiss_id"] for r in records], dtype=np.int64),
+            )
+
+    replace_atomically(path, write)
+
+
+class LexicalIndex:
+    """In-memory BM25 index loaded from a file written by write_lexical_index."""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.terms = data["terms"]
+            self.term_starts = data["term_starts"]
+            self.posting_docs = data["posting_docs"]
+            self.posting_tf = data["posting_tf"]
+            self.doc_len = data["doc_len"]
+            self.doc_ids = data["doc_ids"]
+        n_docs = len(self.doc_ids)
+        self.avg_len = float(self.doc_len.mean()) if n_docs else 0.0
+        df = np.diff(self.term_starts).astype(np.float32)
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def score(self, query: str):
+        """
+        BM25 scores of every document for a query.
+
+        Returns:
+            tuple: (scores per document, number of distinct query terms each
+            document contains, number of distinct query terms)
+        """
+        n_docs = len(self.doc_ids)
+        query_terms = np.unique(np.array(tokenize(query), dtype=str))
+        if n_docs == 0 or len(query_terms) == 0 or len(self.terms) == 0:
+            return np.zeros(n_docs, dtype=np.float32), np.zeros(n_docs, dtype=np.int64), len(query_terms)
+
+        pos = np.minimum(np.searchsorted(self.terms, query_terms), len(self.terms) - 1)
+        found = pos[self.terms[pos] == query_terms]
+        starts, ends = self.term_starts[found], self.term_starts[found + 1]
+        postings = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)]) if len(found) else np.array([], dtype=np.int64)
+
+        docs = self.posting_docs[postings]
+        tf = self.posting_tf[postings]
+        idf = np.repeat(self.idf[found], ends - starts)
+        norm = K1 * (1 - B + B * self.doc_len[docs] / max(self.avg_len, 1e-9))
+        scores = np.bincount(docs, weights=idf * tf * (K1 + 1) / (tf + norm), minlength=n_docs)
+        matched = np.bincount(docs, minlength=n_docs)
+        return scores.astype(np.float32), matched, len(query_terms)
+
+    def search(self, query: str, k: int, margin: float = 1.5):
+        """
+        Top-k documents for a query.
+
+        Args:
+            query: Free text.
+            k: Documents to return; only documents matching a term count.
+            margin: How far the best document must outscore the runner-up
+                to count as confident.
+
+        Returns:
+            tuple: (scores, paper FAISS ids, confident), where confident is
+            True when the best document contains every query term (at least
+            two) and beats the runner-up by `margin`.
+        """
+        scores, matched, n_terms = self.score(query)
+        hits = np.flatnonzero(scores > 0)
+        top = hits[np.argsort(-scores[hits], kind="stable")[:max(k, 2)]]
+        confident = (
+            len(top) > 0 and n_terms >= 2 and matched[top[0]] == n_terms
+            and (len(top) == 1 or scores[top[0]] >= margin * scores[top[1]])
+        )
+        return scores[top[:k]], self.doc_ids[top[:k]], bool(confident)
@@ -0,0 +1,171 @@
+"""
+LLM Response Cache
+
+Persistent cache for deterministic (temperature 0) chat completions, such as
+turning a question into a PubMed Boolean string or suggesting refined
+queries. Entries are keyed by model, a hash of the prompt template and the
+rendered prompt, expire after LLM_CACHE_TTL_DAYS, and the least recently
+used ones are evicted once the file passes LLM_CACHE_MAX_MB.
+
+Hit/miss counts and the API time saved are kept on disk; print them with:
+    python scripts/llm_cache.py
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from utils import CACHE_DIR, LLM_CACHE_TTL_DAYS, LLM_CACHE_MAX_MB
+
+CACHE_PATH = CACHE_DIR / "llm.sqlite"
+
+
+def cache_key(model: str, template: str, prompt: str, params: dict = None) -> str:
+    """Hash of everything that determines a temperature-0 completion."""
+    template_hash = hashlib.sha256(template.encode("utf-8")).hexdigest()
+    payload = json.dumps([model, template_hash, prompt, params or {}], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """SQLite-backed TTL + LRU cache of completion texts, safe to share between threads."""
+
+    def __init__(self, path=CACHE_PATH, ttl_seconds: float = LLM_CACHE_TTL_DAYS * 86400,
+                 max_bytes: int = LLM_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                api_seconds REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_completions_last_used ON completions(last_used);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def _bump(self, **increments) -> None:
+        self._conn.executemany(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            list(increments.items()),
+        )
+
+    def get(self, key: str):
+        """Returns the cached response text, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, api_seconds, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[2] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                row = None
+            if row:
+                self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+                self._bump(hits=1, saved_seconds=row[1])
+            else:
+                self._bump(misses=1)
+            self._conn.commit()
+        return row[0] if row else None
+
+    def put(self, key: str, model: str, response: str, api_seconds: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, response, api_seconds, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, api_seconds, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drops expired entries, then least recently used ones while over max_bytes."""
+        self._conn.execute("DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(LENGTH(response)), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - int(self.max_bytes * 0.9)
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, LENGTH(response) FROM completions ORDER BY last_used"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM completions WHERE key = ?", doomed)
+
+    def stats(self) -> dict:
+        """Lifetime hit/miss counts, hit rate and seconds of API time saved."""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM counters"))
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        hits, misses = int(counters.get("hits", 0)), int(counters.get("misses", 0))
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "saved_seconds": counters.get("saved_seconds", 0.0),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    """Returns the process-wide LLM cache, opening it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def cached_completion(model: str, template: str, prompt: str, call, params: dict = None) -> str:
+    """
+    Returns a cached completion for (model, template, prompt, params), or runs
+    `call()` to get one and stores it.
+
+    Only use this for deterministic, temperature-0 requests.
+
+    Args:
+        model: Chat model name.
+        template: Prompt template the prompt was rendered from.
+        prompt: Rendered prompt text.
+        call: Zero-argument function performing the API call and returning text.
+        params: Any other request settings that affect the output (system
+            message, max_tokens, ...).
+    """
+    cache = get_llm_cache()
+    key = cache_key(model, template, prompt, params)
+    response = cache.get(key)
+    if response is not None:
+        return response
+
+    started = time.perf_counter()
+    response = call()
+    cache.put(key, model, response, time.perf_counter() - started)
+    return response
+
+
+if __name__ == "__main__":
+    stats = get_llm_cache().stats()
+    print(f"🗃️ LLM cache: {stats['entries']} entries, {stats['hits']} hits / {stats['misses']} misses "
+          f"({stats['hit_rate']:.0%} hit rate), {stats['saved_seconds']:.1f}s of API time saved")
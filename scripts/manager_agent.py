@@ -13,75 +13,42 @@ from openai import OpenAI
 from dotenv import load_dotenv
 from pathlib import Path
 import os
-import sqlite3
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from query_zotero import query_zotero_library
+from query_zotero import query_zotero_library, ZOTERO_INDEX
 from query_pubmed import query_pubmed, iterative_pubmed_search
 
 from utils import load_prompt
+from concurrency import service_slot
+from llm_cache import get_llm_cache
+from db import DB_PATH, log_query, save_results, save_result_items, log_metrics, load_spans
+from tracing import trace, span, traced, record, in_context, stage_breakdown
+from answer_cache import get_answer_cache
+from query_client import get_query_client
 
 ROOT = Path(__file__).resolve().parents[1]
 load_dotenv(ROOT / ".env")
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-from utils import CHAT_MODEL_SYNTHESIS
+from utils import CHAT_MODEL_SYNTHESIS, ANSWER_CACHE
 
-DB_PATH = ROOT / "queries.db"
 
-
-def log_query(query: str, db_path=DB_PATH):
-    """
-    Logs the user query into the SQLite database and returns the inserted query's ID.
-    """
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS query_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            query_text TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    c.execute("INSERT INTO query_log (query_text, timestamp) VALUES (?, ?)", (query, datetime.now()))
-    query_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    return query_id
-
-def save_results(query_id: int, source: str, content: str, db_path=DB_PATH):
+def _synthesis_messages(query, zotero_results, pubmed_results):
     """
-    Saves the results content for a given query and source into the SQLite database.
+    Builds the chat messages for synthesis from /prompts/synthesis.md
     """
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS query_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            query_id INTEGER NOT NULL,
-            source TEXT NOT NULL,
-            content TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(query_id) REFERENCES query_log(id)
-        )
-    """)
-    c.execute(
-        "INSERT INTO query_results (query_id, source, content) VALUES (?, ?, ?)",
-        (query_id, source, content)
-    )
-    conn.commit()
-    conn.close()
+    def library_note(d):
+        if "in_library" not in d:
+            return ""
+        return f"Already in Zotero library: {'yes (' + d['zotero_key'] + ')' if d['in_library'] else 'no'}\n"
 
-
-def synthesize(query, zotero_results, pubmed_results):
-    """
-    Synthesizes results using a prompt from /prompts/synthesis.md
-    """
     def format_docs(docs):
         return "\n\n".join([
             f"Title: {d.get('title', 'Untitled')}\n"
             f"Authors: {d.get('authors', 'Unknown')}\n"
             f"Year: {d.get('year', 'n.d.')}\n"
+            f"{library_note(d)}"
             f"Abstract: {d.get('abstract', '[No abstract available]')}"
             for d in docs
         ])
@@ -92,54 +59,205 @@ def synthesize(query, zotero_results, pubmed_results):
         zotero_docs=format_docs(zotero_results),
         pubmed_docs=format_docs(pubmed_results)
     )
+    return [
+        {"role": "system", "content": "You are a biomedical research assistant."},
+        {"role": "user", "content": prompt}
+    ]
 
-    response = client.chat.completions.create(
-        model=CHAT_MODEL_SYNTHESIS,
-        messages=[
-            {"role": "system", "content": "You are a biomedical research assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
+
+def synthesize(query, zotero_results, pubmed_results):
+    """
+    Synthesizes results using a prompt from /prompts/synthesis.md
+    """
+    with service_slot("openai_synthesis"):
+        response = client.chat.completions.create(
+            model=CHAT_MODEL_SYNTHESIS,
+            messages=_synthesis_messages(query, zotero_results, pubmed_results)
+        )
     return response.choices[0].message.content
 
 
+def synthesize_stream(query, zotero_results, pubmed_results, query_id: int = None, timings: dict = None,
+                      db_path=DB_PATH):
+    """
+    Streaming variant of synthesize(): yields the answer text as tokens arrive.
+
+    Args:
+        query_id: If given, time-to-first-token and total time are logged to
+            the query_metrics table once the stream finishes.
+        timings: Optional dict that receives "ttft_seconds" and "total_seconds".
+
+    Yields:
+        str: Successive pieces of the answer.
+    """
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+    usage = None
+    try:
+        with service_slot("openai_synthesis"):
+            stream = client.chat.completions.create(
+                model=CHAT_MODEL_SYNTHESIS,
+                messages=_synthesis_messages(query, zotero_results, pubmed_results),
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    usage = getattr(chunk, "usage", None) or usage  # the last chunk carries the token counts
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    timings.setdefault("ttft_seconds", time.perf_counter() - started)
+                    yield delta
+    except GeneratorExit:
+        # The reader stopped early (client disconnected, Streamlit rerun)
+        record("synthesis", time.perf_counter() - started, status="cancelled", model=CHAT_MODEL_SYNTHESIS)
+        raise
+    except Exception as e:
+        record("synthesis", time.perf_counter() - started, status="error", model=CHAT_MODEL_SYNTHESIS,
+               error=f"{type(e).__name__}: {e}")
+        raise
+    timings["total_seconds"] = time.perf_counter() - started
+
+    # Recorded after the fact: a span can't stay open across the yields above
+    synthesis = record("synthesis", timings["total_seconds"], model=CHAT_MODEL_SYNTHESIS,
+                       ttft_ms=timings.get("ttft_seconds", 0) * 1000)
+    if usage is not None:
+        synthesis.add_usage(CHAT_MODEL_SYNTHESIS, usage.prompt_tokens, usage.completion_tokens)
+
+    if query_id is not None:
+        metrics = {"synthesis_seconds": timings["total_seconds"]}
+        if "ttft_seconds" in timings:
+            metrics["synthesis_ttft_seconds"] = timings["ttft_seconds"]
+        log_metrics(query_id, metrics, db_path=db_path)
+
+
+@traced("library_check")
+def flag_library_papers(papers):
+    """
+    Marks each PubMed paper with "in_library" and the matching "zotero_key"
+    (or None), using the precomputed library key index.
+    """
+    try:
+        keys = ZOTERO_INDEX.library_matches(papers)
+    except (FileNotFoundError, RuntimeError) as e:  # no index built yet
+        print(f"⚠️ Cannot check PubMed results against the library: {e}")
+        return papers
+    for paper, key in zip(papers, keys):
+        paper["in_library"] = key is not None
+        paper["zotero_key"] = key
+    return papers
+
+
+@traced("sources")
+def gather_sources(query: str, k: int = 5, max_results: int = 5, iterative: bool = True):
+    """
+    Queries the Zotero library and PubMed at the same time.
+
+    The two branches are independent, so the wall time is that of the slower
+    one rather than their sum. Per-service limits in concurrency.py still cap
+    how many OpenAI / NCBI requests are in flight.
+
+    Args:
+        query: User question.
+        k: Number of Zotero papers.
+        max_results: PubMed articles per search.
+        iterative: Use iterative_pubmed_search (with refined queries) instead
+            of a single query_pubmed call.
+
+    Returns:
+        tuple: (zotero_results, pubmed_results), with each PubMed result
+        flagged by flag_library_papers.
+    """
+    pubmed_search = iterative_pubmed_search if iterative else query_pubmed
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        # in_context: the branches' spans are recorded under this call's span
+        zotero_future = pool.submit(in_context(query_zotero_library), query, k=k)
+        pubmed_future = pool.submit(in_context(pubmed_search), query, max_results=max_results)
+        zotero_results, pubmed_results = zotero_future.result(), pubmed_future.result()
+    return zotero_results, flag_library_papers(pubmed_results)
+
+
+def lookup_answer(query: str, query_id: int, force_refresh: bool = False):
+    """
+    Checks the semantic answer cache for a near-identical earlier question
+    and logs the outcome against query_id.
+
+    Args:
+        query: User question.
+        query_id: ID the question was logged under.
+        force_refresh: Skip the cache and answer from scratch.
+
+    Returns:
+        answer_cache.CachedAnswer, or None when the question must be answered
+        from scratch (miss, forced refresh, cache disabled or unavailable).
+    """
+    if not ANSWER_CACHE:
+        return None
+    cache = get_answer_cache()
+    hit = None
+    if not force_refresh:
+        try:
+            with span("answer_cache.lookup") as s:
+                hit = cache.lookup(query)
+                s.set(hit=hit is not None)
+        except Exception as e:
+            print(f"⚠️ Answer cache unavailable: {e}")
+    cache.record(query_id, hit, forced=force_refresh)
+    return hit
+
+
 if __name__ == "__main__":
     import sys
 
-    if len(sys.argv) < 2:
-        print("Usage: python scripts/manager_agent.py 'your research question'")
+    args = sys.argv[1:]
+    force_refresh = "--refresh" in args
+    query = " ".join(a for a in args if a != "--refresh")
+    if not query:
+        print("Usage: python scripts/manager_agent.py [--refresh] 'your research question'")
         exit()
 
-    query = " ".join(sys.argv[1:])
-
     # Log the query and get its unique ID
     query_id = log_query(query)
 
-    print("🔍 Querying Zotero library...")
-    zotero_results = query_zotero_library(query, k=5)
-    zotero_text = "\n\n".join([
-        f"Title: {d.get('title', 'Untitled')}\n"
-        f"Authors: {d.get('authors', 'Unknown')}\n"
-        f"Year: {d.get('year', 'n.d.')}\n"
-        f"Abstract: {d.get('abstract', '[No abstract available]')}"
-        for d in zotero_results
-    ])
-    save_results(query_id, "zotero", zotero_text)
-
-    print("🔎 Querying PubMed...")
-    pubmed_results = iterative_pubmed_search(query, max_results=5)
-    pubmed_text = "\n\n".join([
-        f"Title: {d.get('title', 'Untitled')}\n"
-        f"Authors: {d.get('authors', 'Unknown')}\n"
-        f"Year: {d.get('year', 'n.d.')}\n"
-        f"Abstract: {d.get('abstract', '[No abstract available]')}"
-        for d in pubmed_results
-    ])
-    save_results(query_id, "pubmed", pubmed_text)
-
-    print("🧠 Synthesizing answer with GPT-4...")
-    answer = synthesize(query, zotero_results, pubmed_results)
+    # Stage timings, tokens and cost are saved under query_id (see tracing.py)
+    with trace(query_id):
+        hit = lookup_answer(query, query_id, force_refresh=force_refresh)
+    if hit:
+        print(f"♻️ Answer from a similar question asked {hit.asked_at:%Y-%m-%d %H:%M} "
+              f"(similarity {hit.similarity:.2f}): {hit.query}")
+        print("   Run with --refresh for a new answer.")
+        print("\n=== Synthesized Answer ===\n")
+        print(hit.answer)
+        print(f"\n⏱️ Saved about {hit.saved_seconds:.0f}s")
+        exit()
+
+    # Runs on the query server when one is up (index already loaded), else in this process
+    client = get_query_client()
+    started = time.perf_counter()
+    with trace(query_id):
+        print("🔍 Querying Zotero library and PubMed in parallel...")
+        zotero_results, pubmed_results = client.gather_sources(query, k=5, max_results=5, query_id=query_id)
+        if client.last_used_server:
+            print(f"🛰️ Answered by the query server at {client.base_url}")
+        save_result_items(query_id, "zotero", zotero_results)
+        save_result_items(query_id, "pubmed", pubmed_results)
+
+        print("🧠 Synthesizing answer with GPT-4...")
+        print("\n=== Synthesized Answer ===\n")
+        timings = {}
+        pieces = []
+        for piece in client.synthesize_stream(query, zotero_results, pubmed_results, query_id=query_id, timings=timings):
+            print(piece, end="", flush=True)
+            pieces.append(piece)
+    answer = "".join(pieces)
     save_results(query_id, "synthesis", answer)
+    log_metrics(query_id, {"pipeline_seconds": time.perf_counter() - started})
+    print(f"\n\n⏱️ First token after {timings.get('ttft_seconds', 0):.1f}s, done in {timings['total_seconds']:.1f}s")
+    stages = stage_breakdown(load_spans(query_id))
+    print("   " + ", ".join(f"{r['stage']} {r['ms']:.0f} ms" for r in stages))
+    print(f"💵 Estimated cost: ${sum(r['cost_usd'] for r in stages):.4f}")
 
-    print("\n=== Synthesized Answer ===\n")
-    print(answer)
+    cache_stats = get_llm_cache().stats()
+    print(f"\n🗃️ LLM cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+          f"({cache_stats['hit_rate']:.0%}), {cache_stats['saved_seconds']:.1f}s saved so far")
@@ -0,0 +1,171 @@
+"""
+Metadata Store
+
+Compact on-disk format for the per-paper metadata that sits next to the
+FAISS index. Records are stored as UTF-8 JSON blobs behind an offset table,
+and the file is memory-mapped, so looking up FAISS row i decodes only row i
+and opening the store costs the same whatever the library size.
+
+Version 2 stores can also carry the FAISS id of every row (for indexes
+wrapped in IndexIDMap2), kept sorted so search results map back to rows
+with a binary search instead of a dict built at load time.
+
+File layout (little-endian):
+    8 bytes    magic b"ZOTMETA\\0"
+    uint32     length of the JSON header
+    ...        JSON header: {"version", "count", "offsets_at", "ids_at", "data_at", "attrs"}
+    uint64[n+1] record offsets relative to data_at (8-byte aligned)
+    int64[n]   FAISS ids in ascending order (only if ids_at is set)
+    int64[n]   row of each sorted id (only if ids_at is set)
+    ...        concatenated JSON records
+"""
+
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from utils import replace_atomically
+
+MAGIC = b"ZOTMETA\0"
+FORMAT_VERSION = 2
+
+
+def _align(n: int, to: int = 8) -> int:
+    return (n + to - 1) // to * to
+
+
+def write_meta_store(path, records, attrs=None, ids=None) -> None:
+    """
+    Writes metadata records to `path`, replacing any existing file atomically.
+
+    Args:
+        path: Destination file.
+        records: Iterable of JSON-serialisable dicts; record i describes FAISS
+            row i, or the vector with id ids[i] when ids are given.
+        attrs: Optional dict of store-wide attributes kept in the header.
+        ids: Optional sequence of unique FAISS ids, one per record.
+    """
+    replace_atomically(path, meta_store_writer(records, attrs=attrs, ids=ids))
+
+
+def meta_store_writer(records, attrs=None, ids=None):
+    """
+    Encodes a metadata store (see write_meta_store) without writing it yet.
+
+    Returns:
+        Callable write(path), e.g. for utils.replace_together.
+    """
+    blobs = [json.dumps(r, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for r in records]
+    offsets = np.zeros(len(blobs) + 1, dtype="<u8")
+    np.cumsum([len(b) for b in blobs], out=offsets[1:])
+
+    id_columns = b""
+    if ids is not None:
+        ids = np.asarray(ids, dtype="<i8")
+        if len(ids) != len(blobs):
+            raise ValueError(f"Got {len(ids)} ids for {len(blobs)} records.")
+        order = np.argsort(ids, kind="stable").astype("<i8")
+        sorted_ids = ids[order]
+        if len(sorted_ids) > 1 and (sorted_ids[1:] == sorted_ids[:-1]).any():
+            raise ValueError("FAISS ids must be unique.")
+        id_columns = sorted_ids.tobytes() + order.tobytes()
+
+    # Header size depends on the positions it records, so settle them first
+    header = {"version": FORMAT_VERSION, "count": len(blobs), "offsets_at": 0,
+              "ids_at": None, "data_at": 0, "attrs": attrs or {}}
+    while True:
+        header_bytes = json.dumps(header).encode("utf-8")
+        offsets_at = _align(len(MAGIC) + 4 + len(header_bytes))
+        ids_at = offsets_at + offsets.nbytes if ids is not None else None
+        data_at = offsets_at + offsets.nbytes + len(id_columns)
+        if (header["offsets_at"], header["ids_at"], header["data_at"]) == (offsets_at, ids_at, data_at):
+            break
+        header.update(offsets_at=offsets_at, ids_at=ids_at, data_at=data_at)
+
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header_bytes)))
+            f.write(header_bytes)
+            f.write(b"\0" * (offsets_at - f.tell()))
+            f.write(offsets.tobytes())
+            f.write(id_columns)
+            for blob in blobs:
+                f.write(blob)
+
+    return write
+
+
+class MetaStore:
+    """
+    Read-only, memory-mapped view of a metadata file written by write_meta_store.
+
+    Supports len(), store[i] and iteration; rows are decoded on access, and
+    rows_for_ids() maps FAISS search labels to rows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a metadata store; rebuild the index.")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (header_len,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self._mm[start:start + header_len])
+        if header["version"] > FORMAT_VERSION:
+            raise ValueError(f"{path} was written by a newer version (format {header['version']}).")
+
+        self.attrs = header["attrs"]
+        self._count = header["count"]
+        self._data_at = header["data_at"]
+        self._offsets = np.frombuffer(self._mm, dtype="<u8", count=self._count + 1, offset=header["offsets_at"])
+        ids_at = header.get("ids_at")
+        if ids_at is None:
+            self._sorted_ids = self._id_rows = None
+        else:
+            self._sorted_ids = np.frombuffer(self._mm, dtype="<i8", count=self._count, offset=ids_at)
+            self._id_rows = np.frombuffer(self._mm, dtype="<i8", count=self._count, offset=ids_at + 8 * self._count)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def ids(self):
+        """The FAISS ids of all rows in ascending order, or None for stores written without ids."""
+        return self._sorted_ids
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(f"metadata row {i} out of range")
+        begin = self._data_at + int(self._offsets[i])
+        end = self._data_at + int(self._offsets[i + 1])
+        return json.loads(self._mm[begin:end])
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def rows_for_ids(self, labels) -> np.ndarray:
+        """
+        Maps FAISS search labels to row numbers.
+
+        Args:
+            labels: Array of FAISS ids, as returned by index.search.
+
+        Returns:
+            int64 array of the same shape; -1 where the label is -1 or unknown.
+            Stores written without ids treat labels as row numbers.
+        """
+        labels = np.asarray(labels, dtype=np.int64)
+        if self._sorted_ids is None:
+            return np.where((labels >= 0) & (labels < self._count), labels, -1)
+        if self._count == 0:
+            return np.full(labels.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._sorted_ids, labels), self._count - 1)
+        return np.where(self._sorted_ids[pos] == labels, self._id_rows[pos], -1)
@@ -0,0 +1,116 @@
+"""
+PubMed XML Parser
+
+Streams PubmedArticleSet XML (efetch output) with `iterparse`, yielding one
+compact record per article and detaching each article from the root once it
+is parsed, so memory stays flat no matter how many articles a response holds.
+"""
+
+import io
+from xml.etree import ElementTree as ET
+
+PUBMED_URL = "https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+
+
+def _text(elem) -> str:
+    """All text inside an element, including nested markup such as <i> or <sup>."""
+    if elem is None:
+        return ""
+    return "".join(elem.itertext()).strip()
+
+
+def _year(journal) -> str:
+    pub_date = journal.find("JournalIssue/PubDate") if journal is not None else None
+    if pub_date is None:
+        return "n.d."
+    year = pub_date.findtext("Year")
+    if year:
+        return year
+    # Some records only carry a free-text date such as "2019 Nov-Dec"
+    medline_date = pub_date.findtext("MedlineDate", "")
+    return medline_date[:4] if medline_date[:4].isdigit() else "n.d."
+
+
+def _doi(article, pubmed_data) -> str:
+    if article is not None:
+        for loc in article.iterfind("ELocationID"):
+            if loc.get("EIdType") == "doi":
+                return _text(loc)
+    if pubmed_data is not None:
+        for article_id in pubmed_data.iterfind("ArticleIdList/ArticleId"):
+            if article_id.get("IdType") == "doi":
+                return _text(article_id)
+    return ""
+
+
+def parse_article(elem) -> dict:
+    """
+    Converts one <PubmedArticle> element into a record.
+
+    Returns:
+        dict with keys: pmid, doi, title, abstract, abstract_sections
+        (list of {label, text}), authors, year, journal, mesh_terms, url, raw.
+    """
+    citation = elem.find("MedlineCitation")
+    if citation is None:
+        citation = ET.Element("MedlineCitation")
+    article = citation.find("Article")
+    if article is None:
+        article = ET.Element("Article")
+    journal = article.find("Journal")
+
+    pmid = citation.findtext("PMID", "").strip()
+    title = _text(article.find("ArticleTitle")) or "No title"
+
+    sections = [
+        {"label": section.get("Label", ""), "text": _text(section)}
+        for section in article.iterfind("Abstract/AbstractText")
+    ]
+    abstract = "\n".join(
+        f"{s['label']}: {s['text']}" if s["label"] else s["text"] for s in sections
+    ) or "[No abstract available]"
+
+    authors = []
+    for author in article.iterfind("AuthorList/Author"):
+        name = f"{author.findtext('ForeName', '')} {author.findtext('LastName', '')}".strip()
+        authors.append(name or author.findtext("CollectiveName", "").strip())
+    authors = ", ".join(a for a in authors if a)
+
+    year = _year(journal)
+    mesh_terms = [_text(d) for d in citation.iterfind("MeshHeadingList/MeshHeading/DescriptorName")]
+
+    return {
+        "pmid": pmid,
+        "doi": _doi(article, elem.find("PubmedData")),
+        "title": title,
+        "abstract": abstract,
+        "abstract_sections": sections,
+        "authors": authors,
+        "year": year,
+        "journal": _text(journal.find("Title")) if journal is not None else "",
+        "mesh_terms": mesh_terms,
+        "url": PUBMED_URL.format(pmid=pmid) if pmid else "#",
+        "raw": f"Title: {title}\nAuthors: {authors}\nYear: {year}\nAbstract: {abstract}",
+    }
+
+
+def iter_pubmed_articles(source):
+    """
+    Yields article records from efetch XML without building the whole tree.
+
+    Args:
+        source: Raw XML bytes, a path, or a binary file-like object (e.g. a
+            streamed HTTP response body).
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    root = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if root is None:
+            root = elem  # the PubmedArticleSet
+        elif event == "end" and elem.tag == "PubmedArticle":
+            yield parse_article(elem)
+            # Drop the finished article (and any sibling before it) from the set, or
+            # every parsed article would stay attached to the root
+            root.clear()
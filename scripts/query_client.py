@@ -0,0 +1,202 @@
+"""
+Query Client
+
+Thin client for query_server.py, used by the app and the CLI. Each call goes
+to the server at QUERY_SERVER_URL when one is running, so the index, HTTP
+pools and caches are loaded once per host; otherwise the same function runs
+in-process (manager_agent / query_zotero are only imported then).
+
+A server that refuses a connection is not retried for SERVER_RETRY_SECONDS,
+so a missing server costs one failed connect rather than one per call.
+
+The client is shared by every thread (e.g. Streamlit sessions), so where a
+call was answered and the index stats it returned are kept per thread, as
+is the HTTP session (requests.Session is not thread-safe).
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from utils import QUERY_SERVER_URL, SEARCH_MODE
+
+SERVER_RETRY_SECONDS = 30
+CONNECT_TIMEOUT = 0.5
+READ_TIMEOUT = 300
+
+
+class QueryClient:
+    """Calls the local query server, or the in-process pipeline when it is not running."""
+
+    def __init__(self, base_url: str = QUERY_SERVER_URL):
+        self.base_url = (base_url or "").rstrip("/")
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        """This thread's HTTP session, created on first use."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    @property
+    def last_used_server(self) -> bool:
+        """True if this thread's last call was answered by the query server."""
+        return getattr(self._local, "used_server", False)
+
+    @property
+    def last_index_stats(self):
+        """Zotero index stats returned with this thread's last call, or None if it did not search the index."""
+        return getattr(self._local, "index_stats", None)
+
+    def _record(self, used_server: bool, index_stats: dict = None) -> None:
+        self._local.used_server = used_server
+        self._local.index_stats = index_stats
+
+    def _server_up(self) -> bool:
+        with self._lock:
+            return bool(self.base_url) and time.monotonic() >= self._down_until
+
+    def _mark_down(self) -> None:
+        with self._lock:
+            self._down_until = time.monotonic() + SERVER_RETRY_SECONDS
+
+    def _post(self, endpoint: str, payload: dict, stream: bool = False):
+        """
+        POSTs to the server.
+
+        Returns:
+            The response, or None if the server is not reachable.
+        """
+        if not self._server_up():
+            return None
+        try:
+            response = self.session.post(f"{self.base_url}{endpoint}", json=payload, stream=stream,
+                                         timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        except requests.ConnectionError:
+            self._mark_down()
+            return None
+        if response.status_code >= 400:
+            try:
+                message = response.json().get("error", response.text)
+            except ValueError:
+                message = response.text
+            raise RuntimeError(f"Query server {endpoint} failed ({response.status_code}): {message}")
+        return response
+
+    def health(self):
+        """Server status dict, or None if no server is running."""
+        if not self._server_up():
+            return None
+        try:
+            return self.session.get(f"{self.base_url}/health", timeout=(CONNECT_TIMEOUT, 5)).json()
+        except requests.ConnectionError:
+            self._mark_down()
+            return None
+
+    def search(self, queries, k: int = 5, mode: str = SEARCH_MODE) -> list[list[dict]]:
+        """Zotero search for several queries (see query_zotero.query_zotero_library_batch)."""
+        queries = list(queries)
+        response = self._post("/search", {"queries": queries, "k": k, "mode": mode})
+        if response is not None:
+            data = response.json()
+            self._record(True, data.get("index"))
+            return data["results"]
+        from query_zotero import query_zotero_library_batch, ZOTERO_INDEX
+        results = query_zotero_library_batch(queries, k=k, mode=mode)
+        self._record(False, ZOTERO_INDEX.stats())
+        return results
+
+    def pubmed(self, query: str, max_results: int = 5, iterative: bool = True) -> list[dict]:
+        """PubMed search (see query_pubmed)."""
+        response = self._post("/pubmed", {"query": query, "max_results": max_results, "iterative": iterative})
+        self._record(response is not None)
+        if response is not None:
+            return response.json()["results"]
+        from query_pubmed import query_pubmed, iterative_pubmed_search
+        search = iterative_pubmed_search if iterative else query_pubmed
+        return search(query, max_results=max_results)
+
+    def gather_sources(self, query: str, k: int = 5, max_results: int = 5, iterative: bool = True,
+                       query_id: int = None):
+        """
+        Zotero and PubMed results for a question (see manager_agent.gather_sources).
+        The server saves its trace spans under query_id.
+        """
+        payload = {"query": query, "k": k, "max_results": max_results, "iterative": iterative, "query_id": query_id}
+        response = self._post("/sources", payload)
+        if response is not None:
+            data = response.json()
+            self._record(True, data.get("index"))
+            return data["zotero"], data["pubmed"]
+        from manager_agent import gather_sources
+        from query_zotero import ZOTERO_INDEX
+        results = gather_sources(query, k=k, max_results=max_results, iterative=iterative)
+        self._record(False, ZOTERO_INDEX.stats())
+        return results
+
+    def lookup_answer(self, query: str, query_id: int, force_refresh: bool = False):
+        """
+        Stored answer to a near-identical earlier question, with the outcome
+        logged against query_id (see manager_agent.lookup_answer).
+
+        Returns:
+            answer_cache.CachedAnswer, or None when the question must be answered from scratch.
+        """
+        payload = {"query": query, "query_id": query_id, "force_refresh": force_refresh}
+        response = self._post("/answer", payload)
+        self._record(response is not None)
+        if response is None:
+            from manager_agent import lookup_answer
+            return lookup_answer(query, query_id, force_refresh=force_refresh)
+        hit = response.json()["hit"]
+        if hit is None:
+            return None
+        from answer_cache import CachedAnswer
+        return CachedAnswer(**{**hit, "asked_at": datetime.fromisoformat(hit["asked_at"])})
+
+    def synthesize_stream(self, query, zotero_results, pubmed_results, query_id: int = None, timings: dict = None):
+        """
+        Streams the synthesized answer (see manager_agent.synthesize_stream).
+
+        Yields:
+            str: Successive pieces of the answer.
+        """
+        timings = {} if timings is None else timings
+        payload = {"query": query, "zotero": zotero_results, "pubmed": pubmed_results, "query_id": query_id}
+        response = self._post("/synthesize", payload, stream=True)
+        self._record(response is not None)
+        if response is None:
+            from manager_agent import synthesize_stream
+            yield from synthesize_stream(query, zotero_results, pubmed_results, query_id=query_id, timings=timings)
+            return
+        with response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                message = json.loads(line)
+                if "text" in message:
+                    yield message["text"]
+                elif "timings" in message:
+                    timings.update(message["timings"])
+                elif "error" in message:
+                    raise RuntimeError(f"Query server synthesis failed: {message['error']}")
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_query_client() -> QueryClient:
+    """Returns the process-wide query client."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = QueryClient()
+        return _client
@@ -5,14 +5,18 @@ Uses GPT-4 to convert a natural language query into a PubMed-compatible search s
 and retrieves top article metadata from PubMed via E-utilities.
 """
 
-import requests
-from xml.etree import ElementTree as ET
 from openai import OpenAI
 from dotenv import load_dotenv
 from pathlib import Path
 import os
 
-from utils import load_prompt, deduplicate_papers
+from utils import load_prompt
+from dedup import deduplicate_papers
+from concurrency import service_slot, parallel_map
+from eutils import get_eutils_client
+from pubmed_parser import iter_pubmed_articles
+from llm_cache import cached_completion
+from tracing import span, traced
 
 # Setup environment and OpenAI client
 ROOT = Path(__file__).resolve().parents[1]
@@ -21,6 +25,44 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 from utils import CHAT_MODEL_PUBMED
 
+REFINEMENT_TEMPLATE = """
+    The user asked: {natural_query}
+
+    Here are the top PubMed results:
+    {paper_summaries}
+
+    Suggest up to 3 improved or alternate PubMed Boolean queries
+    that could capture additional relevant papers not in this list.
+    Only output the Boolean queries, one per line.
+    """
+
+
+def _chat(system: str, template: str, prompt: str, max_tokens: int, stage: str = "openai.chat") -> str:
+    """
+    Runs a temperature-0 chat completion through the LLM response cache, so the
+    same prompt is only ever sent to the API once. Traced as `stage`.
+    """
+    with span(stage, model=CHAT_MODEL_PUBMED, cached=True) as s:
+        def call():
+            s.set(cached=False)
+            with service_slot("openai"):
+                response = client.chat.completions.create(
+                    model=CHAT_MODEL_PUBMED,
+                    messages=[
+                        {"role": "system", "content": system},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.0,
+                    max_tokens=max_tokens,
+                )
+            if getattr(response, "usage", None) is not None:
+                s.add_usage(CHAT_MODEL_PUBMED, response.usage.prompt_tokens, response.usage.completion_tokens)
+            return response.choices[0].message.content
+
+        params = {"system": system, "max_tokens": max_tokens}
+        return cached_completion(CHAT_MODEL_PUBMED, template, prompt, call, params=params)
+
+
 def convert_to_pubmed_query(natural_query: str) -> str:
     """
     Converts a natural language question to a PubMed-compatible search string
@@ -28,19 +70,10 @@ def convert_to_pubmed_query(natural_query: str) -> str:
     """
     template = load_prompt("pubmed_search.md")
     prompt = template.format(natural_query=natural_query)
-
-    response = client.chat.completions.create(
-        model=CHAT_MODEL_PUBMED,
-        messages=[
-            {"role": "system", "content": "You are a PubMed expert."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.0,
-        max_tokens=200,
-    )
-    return response.choices[0].message.content.strip()
+    return _chat("You are a PubMed expert.", template, prompt, max_tokens=200, stage="pubmed.convert_query").strip()
 
 
+@traced("pubmed.search")
 def query_pubmed(natural_query: str, max_results: int = 5) -> list[dict]:
     """
     Queries PubMed with a GPT-generated search string and returns metadata of articles.
@@ -50,56 +83,29 @@ def query_pubmed(natural_query: str, max_results: int = 5) -> list[dict]:
         max_results: Number of articles to fetch.
 
     Returns:
-        List of article metadata dicts with keys: title, abstract, authors, year, raw.
+        List of article metadata dicts with keys: pmid, doi, title, abstract,
+        abstract_sections, authors, year, journal, mesh_terms, url, raw.
     """
     search_term = convert_to_pubmed_query(natural_query)
     print(f"🔍 PubMed search term: {search_term}")
 
-    search_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-    fetch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+    eutils = get_eutils_client()
 
     # Step 1: Search article IDs
-    search_params = {
-        "db": "pubmed",
-        "term": search_term,
-        "retmode": "xml",
-        "retmax": max_results,
-    }
-    search_resp = requests.get(search_url, params=search_params)
-    ids = ET.fromstring(search_resp.content).findall(".//Id")
-    id_list = [id.text for id in ids]
+    id_list = eutils.esearch(search_term, retmax=max_results)["ids"]
 
     if not id_list:
         return []
 
-    # Step 2: Fetch article metadata
-    fetch_params = {
-        "db": "pubmed",
-        "id": ",".join(id_list),
-        "retmode": "xml",
-        "rettype": "abstract",
-    }
-    fetch_resp = requests.get(fetch_url, params=fetch_params)
-    root = ET.fromstring(fetch_resp.content)
-
-    results = []
-    for article in root.findall(".//PubmedArticle"):
-        title = article.findtext(".//ArticleTitle", default="No title")
-        abstract = article.findtext(".//AbstractText", default="[No abstract available]")
-        authors = [
-            f"{a.findtext('ForeName', '')} {a.findtext('LastName', '')}".strip()
-            for a in article.findall(".//Author")
-        ]
-        year = article.findtext(".//PubDate/Year", "n.d.")
-        results.append({
-            "title": title.strip(),
-            "abstract": abstract.strip(),
-            "authors": ", ".join(authors),
-            "year": year,
-            "raw": f"Title: {title}\nAuthors: {', '.join(authors)}\nYear: {year}\nAbstract: {abstract}"
-        })
-    return results
+    # Step 2: Fetch article metadata, parsing the response as it streams in
+    response = eutils.efetch(id_list, rettype="abstract", retmode="xml", stream=True)
+    try:
+        with span("pubmed.parse", ids=len(id_list)):
+            return list(iter_pubmed_articles(response.raw))
+    finally:
+        response.close()
 
+@traced("pubmed.iterative_search")
 def iterative_pubmed_search(natural_query: str, max_results: int = 5, top_n_for_refinement: int = 5) -> list[dict]:
     """
     Expands the PubMed search by generating alternate Boolean queries from the initial results.
@@ -116,39 +122,21 @@ def iterative_pubmed_search(natural_query: str, max_results: int = 5, top_n_for_
         for doc in initial_results
     )
 
-    refinement_prompt = f"""
-    The user asked: {natural_query}
-
-    Here are the top PubMed results:
-    {paper_summaries}
-
-    Suggest up to 3 improved or alternate PubMed Boolean queries
-    that could capture additional relevant papers not in this list.
-    Only output the Boolean queries, one per line.
-    """
+    refinement_prompt = REFINEMENT_TEMPLATE.format(natural_query=natural_query, paper_summaries=paper_summaries)
 
     # Step 3: Get refined queries from GPT
-    response = client.chat.completions.create(
-        model=CHAT_MODEL_PUBMED,
-        messages=[
-            {"role": "system", "content": "You are a PubMed search expert."},
-            {"role": "user", "content": refinement_prompt}
-        ],
-        temperature=0.0,
-        max_tokens=300,
-    )
-
+    refined_text = _chat("You are a PubMed search expert.", REFINEMENT_TEMPLATE, refinement_prompt, max_tokens=300,
+                         stage="pubmed.refine")
     refined_queries = [
-        q.strip() for q in response.choices[0].message.content.split("\n") if q.strip()
+        q.strip() for q in refined_text.split("\n") if q.strip()
     ]
 
-    # Step 4: Run each refined query
+    # Step 4: Run the refined queries concurrently (service limits still apply per call)
     all_results = initial_results.copy()
-    for q in refined_queries:
-        more_results = query_pubmed(q, max_results=max_results)
+    for more_results in parallel_map(lambda q: query_pubmed(q, max_results=max_results), refined_queries):
         all_results.extend(more_results)
 
-    # Step 5: Deduplicate by title/DOI
+    # Step 5: Merge duplicates by PMID, DOI and (near-identical) title
     all_results = deduplicate_papers(all_results)
 
     return all_results
@@ -157,8 +145,10 @@ def iterative_pubmed_search(natural_query: str, max_results: int = 5, top_n_for_
 if __name__ == "__main__":
     import sys
 
+    from query_client import get_query_client
+
     query = " ".join(sys.argv[1:]) if len(sys.argv) > 1 else "Does calcium affect cholesterol?"
-    papers = query_pubmed(query, max_results=5)
+    papers = get_query_client().pubmed(query, max_results=5, iterative=False)
     for p in papers:
         print(f"\n📄 {p['title']} ({p['year']}) — {p['authors']}")
         print(f"{p['abstract']}\n")
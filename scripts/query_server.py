@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Local Query Server
+
+Keeps the Zotero FAISS index and metadata, the OpenAI and NCBI HTTP pools,
+the tiktoken encoder and the caches resident in one process, so the
+Streamlit app and the CLI scripts don't each pay for loading them. Clients
+go through query_client.py, which falls back to working in-process when no
+server is running.
+
+Endpoints (JSON in, JSON out; one thread per request):
+    GET  /health       index load/search stats
+    POST /search       {"queries": [...], "k": 5, "mode": "semantic"} -> {"results": [[paper, ...], ...]}
+    POST /pubmed       {"query": "...", "max_results": 5, "iterative": true} -> {"results": [...]}
+    POST /sources      {"query": "...", "k": 5, "max_results": 5, "iterative": true, "query_id": 7}
+                       -> {"zotero": [...], "pubmed": [...]}
+    POST /answer       {"query": "...", "query_id": 7, "force_refresh": false}
+                       -> {"hit": {cached answer} or null}
+    POST /synthesize   {"query": "...", "zotero": [...], "pubmed": [...], "query_id": 7}
+                       -> NDJSON stream: {"text": "..."} lines, then {"timings": {...}}
+
+/sources and /synthesize save their trace spans under query_id when one is
+given (see tracing.py). /answer looks the question up in the semantic answer
+cache and logs the hit or miss against query_id.
+
+Usage:
+    python scripts/query_server.py [--host 127.0.0.1] [--port 8765]
+"""
+
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from query_zotero import query_zotero_library_batch, ZOTERO_INDEX, SEARCH_MODES
+from query_pubmed import query_pubmed, iterative_pubmed_search
+from manager_agent import gather_sources, lookup_answer, synthesize_stream
+from embedding_pipeline import get_encoding
+from tracing import trace
+from utils import QUERY_SERVER_URL, SEARCH_MODE
+
+
+def to_json(value) -> bytes:
+    """JSON-encodes results, turning NumPy scalars into plain numbers."""
+    return json.dumps(value, default=lambda o: o.item() if hasattr(o, "item") else str(o)).encode("utf-8")
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    server_version = "ResearchAssistant/1.0"
+
+    def log_message(self, format, *args):
+        pass  # request lines are printed by _log instead
+
+    def _log(self, status, started):
+        print(f"{self.command} {self.path} {status} {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def _send_json(self, status: int, payload) -> None:
+        body = to_json(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        started = time.perf_counter()
+        if urlsplit(self.path).path == "/health":
+            self._send_json(200, {"status": "ok", "index": ZOTERO_INDEX.stats()})
+            self._log(200, started)
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            self._log(404, started)
+
+    def do_POST(self):
+        started = time.perf_counter()
+        route = {
+            "/search": self._search,
+            "/pubmed": self._pubmed,
+            "/sources": self._sources,
+            "/answer": self._answer,
+            "/synthesize": self._synthesize,
+        }.get(urlsplit(self.path).path)
+        if route is None:
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            self._log(404, started)
+            return
+        try:
+            request = self._read_json()
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            self._log(400, started)
+            return
+        try:
+            route(request)
+            status = 200
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+            status = 400
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            status = 500
+        self._log(status, started)
+
+    def _search(self, request):
+        queries = request["queries"] if "queries" in request else [request["query"]]
+        mode = request.get("mode", SEARCH_MODE)
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown mode {mode!r}; use one of {', '.join(SEARCH_MODES)}.")
+        results = query_zotero_library_batch(queries, k=int(request.get("k", 5)), mode=mode)
+        self._send_json(200, {"results": results, "index": ZOTERO_INDEX.stats()})
+
+    def _pubmed(self, request):
+        search = iterative_pubmed_search if request.get("iterative", True) else query_pubmed
+        results = search(request["query"], max_results=int(request.get("max_results", 5)))
+        self._send_json(200, {"results": results})
+
+    def _sources(self, request):
+        with trace(request.get("query_id")):
+            zotero, pubmed = gather_sources(
+                request["query"],
+                k=int(request.get("k", 5)),
+                max_results=int(request.get("max_results", 5)),
+                iterative=request.get("iterative", True),
+            )
+        self._send_json(200, {"zotero": zotero, "pubmed": pubmed, "index": ZOTERO_INDEX.stats()})
+
+    def _answer(self, request):
+        with trace(request["query_id"]):
+            hit = lookup_answer(request["query"], int(request["query_id"]),
+                                force_refresh=bool(request.get("force_refresh", False)))
+        if hit is not None:
+            hit = {**hit._asdict(), "asked_at": hit.asked_at.isoformat()}
+        self._send_json(200, {"hit": hit})
+
+    def _synthesize(self, request):
+        timings = {}
+        pieces = synthesize_stream(
+            request["query"], request.get("zotero", []), request.get("pubmed", []),
+            query_id=request.get("query_id"), timings=timings,
+        )
+        # No Content-Length: the answer is streamed and the connection closed at the end
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            with trace(request.get("query_id")):
+                for piece in pieces:
+                    self.wfile.write(to_json({"text": piece}) + b"\n")
+                    self.wfile.flush()
+            self.wfile.write(to_json({"timings": timings}) + b"\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client went away
+        except Exception as e:
+            self.wfile.write(to_json({"error": f"{type(e).__name__}: {e}"}) + b"\n")
+
+
+def make_server(host: str, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    return server
+
+
+def warm_up() -> None:
+    """Loads everything the first request would otherwise wait for."""
+    started = time.perf_counter()
+    try:
+        ZOTERO_INDEX.get()
+    except Exception as e:
+        print(f"⚠️ Zotero index not loaded: {e}")
+    try:
+        get_encoding()
+    except Exception as e:
+        print(f"⚠️ Tokenizer not loaded: {e}")
+    print(f"🔥 Warmed up in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    default = urlsplit(QUERY_SERVER_URL or "http://127.0.0.1:8765")
+    parser = argparse.ArgumentParser(description="Serve Zotero, PubMed and synthesis requests from one resident process.")
+    parser.add_argument("--host", default=default.hostname or "127.0.0.1")
+    parser.add_argument("--port", type=int, default=default.port or 8765)
+    args = parser.parse_args()
+
+    warm_up()
+    server = make_server(args.host, args.port)
+    print(f"🛰️ Query server listening on http://{args.host}:{args.port} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
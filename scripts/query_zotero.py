@@ -2,80 +2,357 @@
 Zotero Search Agent
 
 Loads a local FAISS index of a Zotero library and retrieves the top-k
-most relevant papers based on semantic similarity.
+most relevant papers based on semantic similarity. The index is loaded once
+per process and reloaded only when build_index.py or update_index.py
+writes a new one. If an abstract/keyword chunk index was built, its hits
+are merged with the title hits per paper (see chunk_index.py).
 """
 
-import pickle
+import threading
+import time
+from typing import NamedTuple, Optional
 import faiss
 import numpy as np
 from pathlib import Path
-from openai import OpenAI
 from dotenv import load_dotenv
-import tiktoken
-import os
 
-from utils import load_prompt
+from utils import load_prompt, CHUNK_AGGREGATE, SEARCH_MODE, LEXICAL_CONFIDENT_MARGIN
 
-# Setup environment and OpenAI client
+# Setup environment
 ROOT = Path(__file__).resolve().parents[1]
 load_dotenv(ROOT / ".env")
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-from utils import EMBEDDING_MODEL
-ENC = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+from embedding_pipeline import embed_texts
+from embedding_backends import get_embedding_backend
+from meta_store import MetaStore
+from chunk_index import search_papers
+from lexical_index import LexicalIndex
+from dedup import LibraryKeys
+from tracing import span, traced
 
 # Load Zotero search prompt (optional, for explainability or further steps)
 # zotero_search_prompt = load_prompt("zotero_search.md")  # currently unused
 
 
+def get_embeddings(texts) -> np.ndarray:
+    """
+    Embeds several texts in as few API requests as the batch limits allow,
+    reading through the persistent embedding cache.
+
+    Returns:
+        float32 array of shape (len(texts), dim).
+    """
+    return embed_texts(list(texts))
+
+
 def get_embedding(text: str) -> list[float]:
     """
-    Gets the OpenAI embedding vector for a given text.
+    Gets the OpenAI embedding vector for a given text, reading through the
+    persistent embedding cache so repeated queries skip the API call.
     """
-    response = client.embeddings.create(
-        input=[text],
-        model=EMBEDDING_MODEL
-    )
-    return response.data[0].embedding
+    return get_embeddings([text])[0].tolist()
+
+
+INDEX_PATH = ROOT / "zotero.index"
+META_PATH = ROOT / "zotero_meta.bin"
+# Optional indexes, next to the main index
+CHUNK_INDEX_NAME = "zotero_chunks.index"
+LEXICAL_INDEX_NAME = "zotero_lexical.npz"
+LIBRARY_KEYS_NAME = "zotero_keys.npz"
 
+SEARCH_MODES = ("semantic", "lexical", "hybrid")
+# Reciprocal-rank fusion constant: a paper at rank r in a list scores 1 / (RRF_K + r)
+RRF_K = 60
 
-def load_zotero():
+
+def load_zotero(index_path=INDEX_PATH, meta_path=META_PATH):
     """
-    Loads the FAISS index and metadata from disk.
+    Loads the FAISS index and opens the memory-mapped metadata store.
 
     Returns:
-        tuple: (faiss.IndexFlatL2, metadata list)
+        tuple: (FAISS index, MetaStore mapping FAISS ids to records)
     """
-    index_path = ROOT / "zotero.index"
-    meta_path = ROOT / "zotero_meta.pkl"
+    if not Path(meta_path).exists() and (Path(meta_path).parent / "zotero_meta.pkl").exists():
+        raise FileNotFoundError(f"{meta_path} not found; run scripts/update_index.py once to convert zotero_meta.pkl.")
     index = faiss.read_index(str(index_path))
-    with open(meta_path, "rb") as f:
-        metadata = pickle.load(f)
+    metadata = MetaStore(meta_path)
     return index, metadata
 
 
-def query_zotero_library(query: str, k: int = 5) -> list[dict]:
+def index_matches_metadata(index, metadata) -> bool:
+    """
+    True if the index holds exactly the vectors the metadata store describes:
+    the same count and, for stable-id indexes, the same FAISS ids. Tells a
+    matching index/metadata pair from one caught halfway through a swap.
+    """
+    if index.ntotal != len(metadata):
+        return False
+    if metadata.ids is None or not isinstance(index, faiss.IndexIDMap):
+        return True
+    return np.array_equal(np.sort(faiss.vector_to_array(index.id_map)), metadata.ids)
+
+
+class _Loaded(NamedTuple):
+    index: faiss.Index
+    metadata: MetaStore
+    chunks: Optional[faiss.Index]
+    lexical: Optional[LexicalIndex]
+    keys: Optional[LibraryKeys]
+    stamp: tuple
+
+
+class ZoteroIndex:
+    """
+    Process-wide handle on the Zotero FAISS index and its metadata.
+
+    The files are loaded on first use and kept in memory. Every search checks
+    the files' modification stamps and, if an index build has replaced them,
+    loads the new pair and swaps it in as a single reference, so concurrent
+    searches see either the old or the new index, never a mix. The chunk and
+    lexical indexes and the library key file next to the main index are
+    optional and loaded if present.
+    """
+
+    def __init__(self, index_path=INDEX_PATH, meta_path=META_PATH, chunk_path=None, lexical_path=None,
+                 keys_path=None):
+        self.index_path = index_path
+        self.meta_path = meta_path
+        self.chunk_path = chunk_path or Path(index_path).with_name(CHUNK_INDEX_NAME)
+        self.lexical_path = lexical_path or Path(index_path).with_name(LEXICAL_INDEX_NAME)
+        self.keys_path = keys_path or Path(index_path).with_name(LIBRARY_KEYS_NAME)
+        self.loads = 0
+        self.load_seconds = None
+        self.last_search_seconds = None
+        self.lexical_shortcuts = 0  # hybrid queries answered without an embedding call
+        self._state = None
+        self._lock = threading.Lock()
+
+    def _stamp(self):
+        def stat(path):
+            st = Path(path).stat()
+            return st.st_mtime_ns, st.st_size
+
+        try:
+            stamp = (stat(self.index_path), stat(self.meta_path))
+        except FileNotFoundError:
+            return None  # let load_zotero report what is missing
+        for optional in (self.chunk_path, self.lexical_path, self.keys_path):
+            try:
+                stamp += (stat(optional),)
+            except FileNotFoundError:
+                stamp += (None,)
+        return stamp
+
+    @traced("zotero.load_index")
+    def _load(self, stamp, attempts=5):
+        """Loads the files, retrying if a writer replaces them mid-load."""
+        for _ in range(attempts):
+            started = time.perf_counter()
+            index, metadata = load_zotero(self.index_path, self.meta_path)
+            chunks = faiss.read_index(str(self.chunk_path)) if stamp and stamp[2] else None
+            lexical = LexicalIndex(self.lexical_path) if stamp and stamp[3] else None
+            keys = LibraryKeys(self.keys_path) if stamp and stamp[4] else None
+            new_stamp = self._stamp()
+            if new_stamp == stamp and index_matches_metadata(index, metadata):
+                self.load_seconds = time.perf_counter() - started
+                self.loads += 1
+                self._state = _Loaded(index, metadata, chunks, lexical, keys, stamp)
+                return
+            # The writers rename the index just before the metadata; wait for the pair
+            stamp = new_stamp
+            time.sleep(0.1)
+        raise RuntimeError(f"{self.index_path} and {self.meta_path} do not match; rebuild the index.")
+
+    def _current(self) -> _Loaded:
+        stamp = self._stamp()
+        state = self._state
+        if state is None or state.stamp != stamp:
+            with self._lock:
+                if self._state is None or self._state.stamp != stamp:
+                    self._load(stamp)
+                state = self._state
+        return state
+
+    def get(self):
+        """
+        Returns the current (index, metadata), reloading it if the files changed.
+        """
+        state = self._current()
+        return state.index, state.metadata
+
+    def search(self, vectors: np.ndarray, k: int, how: str = CHUNK_AGGREGATE):
+        """
+        Finds the top-k papers for each query vector and records how long it took.
+
+        Args:
+            vectors: (n_queries, dim) float32 query embeddings.
+            k: Papers per query.
+            how: How chunk hits are combined per paper ("max" or "sum").
+
+        Returns:
+            tuple: (similarities, FAISS ids, metadata store the ids refer to)
+        """
+        state = self._current()
+        started = time.perf_counter()
+        with span("zotero.faiss_search", queries=len(vectors), k=k, vectors=state.index.ntotal):
+            scores, I = search_papers(state.index, state.chunks, vectors, k, how)
+        self.last_search_seconds = time.perf_counter() - started
+        return scores, I, state.metadata
+
+    def lexical_search(self, queries, k: int, margin: float = LEXICAL_CONFIDENT_MARGIN):
+        """
+        BM25 search of titles, authors, year and keywords; no embedding call.
+
+        Returns:
+            tuple: (list of (FAISS ids, confident) per query, metadata store)
+        """
+        state = self._current()
+        if state.lexical is None:
+            raise FileNotFoundError(f"{self.lexical_path} not found; run scripts/update_index.py to build it.")
+        started = time.perf_counter()
+        with span("zotero.lexical_search", queries=len(queries), k=k):
+            results = [state.lexical.search(query, k, margin)[1:] for query in queries]
+        self.last_search_seconds = time.perf_counter() - started
+        return results, state.metadata
+
+    def library_matches(self, papers) -> list:
+        """
+        Citation key of the library entry matching each paper (by PMID, DOI or
+        title; see dedup.LibraryKeys), or None. No embedding call.
+        """
+        state = self._current()
+        if state.keys is None:
+            raise FileNotFoundError(f"{self.keys_path} not found; run scripts/update_index.py to build it.")
+        return state.keys.match(papers)
+
+    def stats(self) -> dict:
+        """Load and search timings, for display in the app or CLI."""
+        return {
+            "loads": self.loads,
+            "load_seconds": self.load_seconds,
+            "last_search_seconds": self.last_search_seconds,
+            "lexical_shortcuts": self.lexical_shortcuts,
+        }
+
+
+ZOTERO_INDEX = ZoteroIndex()
+
+
+def rrf_fuse(rankings, k: int, rrf_k: int = RRF_K) -> np.ndarray:
     """
-    Searches the Zotero FAISS index for the top-k most relevant entries.
+    Reciprocal-rank fusion of several ranked id lists (-1 entries are ignored).
+
+    Returns:
+        The top-k fused ids, best first.
+    """
+    ids = np.concatenate([np.asarray(r, dtype=np.int64) for r in rankings])
+    ranks = np.concatenate([np.arange(1, len(r) + 1) for r in rankings])
+    valid = ids >= 0
+    unique_ids, inverse = np.unique(ids[valid], return_inverse=True)
+    scores = np.bincount(inverse, weights=1.0 / (rrf_k + ranks[valid]), minlength=len(unique_ids))
+    return unique_ids[np.argsort(-scores, kind="stable")[:k]]
+
+
+def check_embedding_model(metadata) -> None:
+    """Raises RuntimeError if the index was built with another embedding backend or model."""
+    built_with = metadata.attrs.get("embedding_model")
+    current = get_embedding_backend().name
+    if built_with and built_with != current:
+        raise RuntimeError(f"The Zotero index was built with {built_with} but EMBEDDING_BACKEND gives {current}; "
+                           f"rebuild it with scripts/build_index.py or switch back.")
+
+
+def _semantic_ids(queries, k: int):
+    check_embedding_model(ZOTERO_INDEX.get()[1])
+    with span("zotero.embed_query", queries=len(queries)):
+        vectors = np.ascontiguousarray(get_embeddings(queries), dtype=np.float32)
+    _, I, metadata = ZOTERO_INDEX.search(vectors, k)
+    return list(I), metadata
+
+
+@traced("zotero.search")
+def query_zotero_library_batch(queries, k: int = 5, mode: str = SEARCH_MODE) -> list[list[dict]]:
+    """
+    Searches the Zotero index for many queries at once: one embeddings call
+    (per batch-size limit) and one FAISS search over the query matrix.
+
+    Args:
+        queries: Sequence of question strings.
+        k: Number of papers to retrieve per query.
+        mode: "semantic" (embeddings), "lexical" (local BM25, no API call) or
+            "hybrid" (reciprocal-rank fusion of both; queries whose lexical
+            hit is confident, e.g. an exact title, skip the embedding call).
+
+    Returns:
+        One list of metadata dicts per query, in input order.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}; use one of {', '.join(SEARCH_MODES)}.")
+    queries = list(queries)
+    if not queries:
+        return []
+
+    if mode == "semantic":
+        ranked, metadata = _semantic_ids(queries, k)
+    elif mode == "lexical":
+        lexical, metadata = ZOTERO_INDEX.lexical_search(queries, k)
+        ranked = [ids for ids, _ in lexical]
+    else:
+        # Fetch deeper lists than k so fusion has overlap to work with
+        lexical, metadata = ZOTERO_INDEX.lexical_search(queries, 2 * k)
+        ranked = [ids[:k] if confident else None for ids, confident in lexical]
+        pending = [i for i, ids in enumerate(ranked) if ids is None]
+        ZOTERO_INDEX.lexical_shortcuts += len(queries) - len(pending)
+        if pending:
+            semantic, metadata = _semantic_ids([queries[i] for i in pending], 2 * k)
+            for i, semantic_ids in zip(pending, semantic):
+                ranked[i] = rrf_fuse([lexical[i][0], semantic_ids], k)
+
+    id_matrix = np.full((len(queries), k), -1, dtype=np.int64)
+    for i, ids in enumerate(ranked):
+        id_matrix[i, :len(ids)] = ids[:k]
+    with span("zotero.decode_metadata"):
+        rows = metadata.rows_for_ids(id_matrix)
+        # Decode each distinct paper once; FAISS pads with -1 when the library has fewer than k papers
+        decoded = {row: metadata[row] for row in np.unique(rows[rows >= 0]).tolist()}
+    return [[dict(decoded[row]) for row in query_rows.tolist() if row >= 0] for query_rows in rows]
+
+
+def query_zotero_library(query: str, k: int = 5, mode: str = SEARCH_MODE) -> list[dict]:
+    """
+    Searches the Zotero library for the top-k most relevant entries.
 
     Args:
         query: User input question.
         k: Number of papers to retrieve.
+        mode: "semantic", "lexical" or "hybrid" (see query_zotero_library_batch).
 
     Returns:
         List of metadata dicts for the most relevant papers.
     """
-    index, metadata = load_zotero()
-    emb = get_embedding(query)
-    D, I = index.search(np.array([emb], dtype=np.float32), k)
-    return [metadata[i] for i in I[0]]
+    return query_zotero_library_batch([query], k, mode)[0]
 
 
 if __name__ == "__main__":
-    import sys
+    import argparse
 
-    query = " ".join(sys.argv[1:]) if len(sys.argv) > 1 else "What is the effect of calcium on cholesterol?"
-    results = query_zotero_library(query, k=5)
+    parser = argparse.ArgumentParser(description="Search the local Zotero index.")
+    parser.add_argument("query", nargs="*", help="Question or title to look up")
+    parser.add_argument("-k", type=int, default=5, help="Papers to retrieve")
+    parser.add_argument("--mode", choices=SEARCH_MODES, default=SEARCH_MODE,
+                        help="semantic (embeddings), lexical (local BM25) or hybrid (default: %(default)s)")
+    args = parser.parse_args()
+
+    from query_client import get_query_client
+
+    query = " ".join(args.query) or "What is the effect of calcium on cholesterol?"
+    # Uses the query server's resident index when one is running
+    client = get_query_client()
+    results = client.search([query], k=args.k, mode=args.mode)[0]
     for r in results:
         print(f"\n📄 {r.get('title', 'Untitled')} ({r.get('year', 'n.d.')}) — {r.get('authors', 'Unknown')}")
-        print(f"{r.get('abstract', '[No abstract available]')}\n")
+        print(f"{r.get('abstract') or '[No abstract available]'}\n")
+
+    stats = client.last_index_stats
+    where = "query server" if client.last_used_server else "this process"
+    print(f"⏱️ ({where}) Index load: {stats['load_seconds'] * 1000:.1f} ms, search: {stats['last_search_seconds'] * 1000:.2f} ms")
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Local Stand-ins for OpenAI and NCBI
+
+One local HTTP server that answers the OpenAI embeddings and chat
+completions endpoints and the E-utilities esearch/epost/efetch endpoints
+with synthetic but correctly shaped responses, so the whole pipeline can
+be run and benchmarked without network access or API keys. Point the
+clients at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+    EUTILS_BASE_URL=http://127.0.0.1:<port>/entrez/eutils
+
+Each service has a StubProfile: a fixed delay before every response plus
+random jitter, and the fraction of requests answered with an error
+(500 for OpenAI, 503 for NCBI) to exercise the clients' retries.
+
+- Embeddings are deterministic unit vectors seeded by the text, so the
+  embedding cache and index sizes behave as with the real API (but the
+  similarities carry no meaning).
+- Chat completions return a Boolean search string, three refined queries
+  (for the refinement prompt) or, when streamed, an answer of
+  `answer_words` words with `token_interval` seconds between chunks.
+- esearch returns PMIDs derived from the term; efetch returns efetch-shaped
+  PubMed XML for any ID list or history-server result set.
+
+Usage:
+    python scripts/stub_services.py --port 8766 --openai-latency 0.3 --error-rate 0.05
+"""
+
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from benchmark_pubmed_parser import fixture_article
+
+ANSWER_WORDS = ("Calcium intake was associated with lower LDL cholesterol in several cohorts, "
+                "while randomized trials in mice and humans reported smaller effects.").split()
+
+
+class StubProfile(NamedTuple):
+    latency: float = 0.0  # seconds before every response
+    jitter: float = 0.0  # extra random delay, uniform in [0, jitter)
+    error_rate: float = 0.0  # fraction of requests answered with an error
+
+
+def _seed(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "StubServices/1.0"
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    disable_nagle_algorithm = True  # headers and body are separate writes; don't let them wait on ACKs
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _params(self) -> dict:
+        """Query string and (for POST) form or JSON body, as one dict."""
+        split = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(split.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length)
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params.update(json.loads(body))
+            else:
+                params.update({k: v[-1] for k, v in parse_qs(body.decode("utf-8")).items()})
+        return params
+
+    def _route(self):
+        stub = self.server.stub
+        path = urlsplit(self.path).path
+        params = self._params()  # read the body even for unknown paths, to keep the connection usable
+        routes = {
+            "/v1/embeddings": ("openai", self._embeddings),
+            "/v1/chat/completions": ("openai", self._chat),
+            "/entrez/eutils/esearch.fcgi": ("ncbi", self._esearch),
+            "/entrez/eutils/epost.fcgi": ("ncbi", self._epost),
+            "/entrez/eutils/efetch.fcgi": ("ncbi", self._efetch),
+        }
+        if path not in routes:
+            self._send(404, json.dumps({"error": f"Unknown endpoint {path}"}).encode())
+            return
+        service, handler = routes[path]
+        stub.count(path.rsplit("/", 1)[-1])
+        if stub.delay(service):
+            stub.count("errors")
+            if service == "openai":
+                body = {"error": {"message": "Injected stub error", "type": "server_error"}}
+                self._send(500, json.dumps(body).encode())
+            else:
+                self._send(503, b"<ERROR>Injected stub error</ERROR>", "text/xml")
+            return
+        handler(params)
+
+    do_GET = _route
+    do_POST = _route
+
+    # --- OpenAI ---
+
+    def _embeddings(self, params):
+        texts = params["input"]
+        texts = [texts] if isinstance(texts, str) else texts
+        vectors = self.server.stub.embed([str(t) for t in texts])
+        if params.get("encoding_format") == "base64":
+            encoded = [base64.b64encode(v.astype("<f4").tobytes()).decode("ascii") for v in vectors]
+        else:
+            encoded = vectors.tolist()
+        tokens = sum(len(str(t).split()) for t in texts)
+        self._send(200, json.dumps({
+            "object": "list",
+            "model": params.get("model", "stub"),
+            "data": [{"object": "embedding", "index": i, "embedding": e} for i, e in enumerate(encoded)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }).encode())
+
+    def _chat(self, params):
+        stub = self.server.stub
+        prompt = params["messages"][-1]["content"]
+        model = params.get("model", "stub")
+        created = int(time.time())
+        if not params.get("stream"):
+            self._send(200, json.dumps({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": stub.reply(prompt)}}],
+                "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": 20, "total_tokens": 20},
+            }).encode())
+            return
+
+        # Server-sent events, one chunk per word, then [DONE]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish=None):
+            chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            self.wfile.write(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+            self.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            for i in range(stub.answer_words):
+                if i and stub.token_interval:
+                    time.sleep(stub.token_interval)
+                event({"content": ANSWER_WORDS[i % len(ANSWER_WORDS)] + " "})
+            event({}, "stop")
+            if (params.get("stream_options") or {}).get("include_usage"):
+                # Like the real API: a final chunk with no choices carries the token counts
+                usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": stub.answer_words,
+                         "total_tokens": len(prompt.split()) + stub.answer_words}
+                chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [], "usage": usage}
+                self.wfile.write(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    # --- E-utilities ---
+
+    def _esearch(self, params):
+        stub = self.server.stub
+        retmax = int(params.get("retmax", 20))
+        ids = stub.search_ids(params.get("term", ""), retmax)
+        history = ""
+        if params.get("usehistory") == "y":
+            webenv, query_key = stub.store_history(stub.search_ids(params.get("term", ""), stub.pubmed_hits))
+            history = f"<WebEnv>{webenv}</WebEnv><QueryKey>{query_key}</QueryKey>"
+        id_list = "".join(f"<Id>{pmid}</Id>" for pmid in ids)
+        body = (f'<?xml version="1.0" ?><eSearchResult><Count>{stub.pubmed_hits}</Count>'
+                f"<RetMax>{len(ids)}</RetMax><RetStart>0</RetStart>{history}"
+                f"<IdList>{id_list}</IdList><QueryTranslation>{escape(params.get('term', ''))}</QueryTranslation>"
+                f"</eSearchResult>")
+        self._send(200, body.encode(), "text/xml")
+
+    def _epost(self, params):
+        ids = [pmid for pmid in params.get("id", "").split(",") if pmid]
+        webenv, query_key = self.server.stub.store_history(ids, params.get("WebEnv"))
+        body = f'<?xml version="1.0" ?><ePostResult><QueryKey>{query_key}</QueryKey><WebEnv>{webenv}</WebEnv></ePostResult>'
+        self._send(200, body.encode(), "text/xml")
+
+    def _efetch(self, params):
+        stub = self.server.stub
+        if params.get("id"):
+            ids = params["id"].split(",")
+        else:
+            ids = stub.history_ids(params.get("WebEnv"), params.get("query_key"))
+            start = int(params.get("retstart", 0))
+            ids = ids[start:start + int(params.get("retmax", 20))]
+        rng = random.Random(len(ids))
+        articles = "".join(fixture_article(rng, int(pmid)) for pmid in ids if pmid.isdigit())
+        body = f'<?xml version="1.0" ?>\n<PubmedArticleSet>\n{articles}</PubmedArticleSet>\n'
+        self._send(200, body.encode("utf-8"), "text/xml")
+
+
+class StubServices:
+    """
+    The stand-in OpenAI and E-utilities endpoints, served from a background thread.
+
+    Use as a context manager, or call start() and stop(). `requests` counts
+    the requests per endpoint and the injected errors.
+    """
+
+    def __init__(self, openai: StubProfile = StubProfile(), ncbi: StubProfile = StubProfile(), dim: int = 1536,
+                 answer_words: int = 150, token_interval: float = 0.0, pubmed_hits: int = 10000,
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+        self.profiles = {"openai": openai, "ncbi": ncbi}
+        self.dim = dim
+        self.answer_words = answer_words
+        self.token_interval = token_interval
+        self.pubmed_hits = pubmed_hits
+        self.requests = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._history = {}  # (WebEnv, query_key) -> PMIDs
+        self._server = ThreadingHTTPServer((host, port), StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    @property
+    def eutils_url(self) -> str:
+        return f"{self.base_url}/entrez/eutils"
+
+    def start(self) -> "StubServices":
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self) -> None:
+        """Serves in the calling thread until interrupted."""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.requests[name] += 1
+
+    def delay(self, service: str) -> bool:
+        """Sleeps for the service's latency; returns True if this request should fail."""
+        profile = self.profiles[service]
+        with self._lock:
+            jitter = self._rng.random() * profile.jitter
+            fail = self._rng.random() < profile.error_rate
+        if profile.latency + jitter:
+            time.sleep(profile.latency + jitter)
+        return fail
+
+    def embed(self, texts) -> np.ndarray:
+        vectors = np.stack([np.random.default_rng(_seed(t)).standard_normal(self.dim, dtype=np.float32)
+                            for t in texts]) if texts else np.zeros((0, self.dim), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def reply(self, prompt: str) -> str:
+        """Non-streamed chat answer: refined queries for the refinement prompt, else one search string."""
+        words = [w for w in prompt.split() if w.isalpha() and len(w) > 5][:3] or ["calcium"]
+        query = " AND ".join(f"{w.lower()}[tiab]" for w in words)
+        if "alternate PubMed Boolean queries" in prompt:
+            return "\n".join(f"({query}) AND {year}[dp]" for year in (2022, 2023, 2024))
+        return query
+
+    def search_ids(self, term: str, retmax: int) -> list[str]:
+        base = 10000000 + _seed(term) % 20000000
+        return [str(base + i) for i in range(min(retmax, self.pubmed_hits))]
+
+    def store_history(self, ids, webenv: str = None):
+        with self._lock:
+            webenv = webenv or f"STUB_WEBENV_{len(self._history)}"
+            query_key = str(1 + sum(1 for env, _ in self._history if env == webenv))
+            self._history[webenv, query_key] = list(ids)
+        return webenv, query_key
+
+    def history_ids(self, webenv: str, query_key: str) -> list[str]:
+        with self._lock:
+            return self._history.get((webenv, query_key), [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve local stand-ins for the OpenAI and NCBI E-utilities APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--openai-latency", type=float, default=0.0, help="Seconds before each OpenAI response")
+    parser.add_argument("--ncbi-latency", type=float, default=0.0, help="Seconds before each E-utilities response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimension")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="Seconds between streamed answer chunks")
+    args = parser.parse_args()
+
+    stub = StubServices(
+        openai=StubProfile(args.openai_latency, args.jitter, args.error_rate),
+        ncbi=StubProfile(args.ncbi_latency, args.jitter, args.error_rate),
+        dim=args.dim, token_interval=args.token_interval, host=args.host, port=args.port,
+    )
+    print(f"🧪 Stub services on {stub.base_url}")
+    print(f"   OPENAI_BASE_URL={stub.openai_url}")
+    print(f"   EUTILS_BASE_URL={stub.eutils_url}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
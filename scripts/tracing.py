@@ -0,0 +1,284 @@
+"""
+Tracing
+
+Lightweight spans around the pipeline's stages and external calls, so a slow
+or expensive answer can be broken down into embedding, FAISS search,
+esearch/efetch, query conversion and synthesis.
+
+    with trace(query_id):                    # collects the spans below
+        with span("zotero.search", k=5) as s:
+            ...
+            s.add_usage(model, prompt_tokens, completion_tokens)
+
+- Spans nest through contextvars. Work handed to a thread pool keeps its
+  parent if it is wrapped with in_context() (concurrency.parallel_map and
+  the pipeline's own pools do this).
+- Each span records its start, duration, status (ok/error/cancelled) and
+  attributes.
+  OpenAI calls also record token counts and a cost estimated from
+  MODEL_PRICES.
+- When the trace ends, its spans are written to the spans table of
+  queries.db under the query ID. If TRACE_EXPORT names a file, they are
+  also appended to it as JSON lines.
+- Outside a trace, spans are timed but not kept.
+
+Stage breakdown (p50/p95 per stage) of recent queries:
+    python scripts/tracing.py [--queries 200] [--query-id 42] [--export spans.jsonl]
+"""
+
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+import numpy as np
+
+from db import DB_PATH, save_spans, load_spans, recent_spans
+from utils import TRACE_EXPORT
+
+# Estimated USD per million (input, output) tokens; the longest matching prefix of the model name wins
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+
+_trace = ContextVar("trace", default=None)
+_parent = ContextVar("span_parent", default=None)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int = 0):
+    """Estimated USD cost of a call, or None for a model without a known price."""
+    matches = [prefix for prefix in MODEL_PRICES if (model or "").startswith(prefix)]
+    if not matches:
+        return None
+    input_price, output_price = MODEL_PRICES[max(matches, key=len)]
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+
+
+class Span:
+    """One timed stage; token counts and cost add up over add_usage calls."""
+
+    def __init__(self, name: str, parent_id: str = None, attrs: dict = None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attrs = dict(attrs or {})
+        self.status = "ok"
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.cost_usd = None
+        self._started = time.perf_counter()
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def add_usage(self, model: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        """Adds the tokens of one API call and their estimated cost."""
+        prompt_tokens, completion_tokens = int(prompt_tokens or 0), int(completion_tokens or 0)
+        self.prompt_tokens = (self.prompt_tokens or 0) + prompt_tokens
+        self.completion_tokens = (self.completion_tokens or 0) + completion_tokens
+        self.attrs.setdefault("model", model)
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        if cost is not None:
+            self.cost_usd = (self.cost_usd or 0.0) + cost
+
+    def finish(self, seconds: float = None) -> None:
+        if seconds is None:
+            seconds = time.perf_counter() - self._started
+        self.duration_ms = seconds * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": self.cost_usd,
+            "attrs": self.attrs,
+        }
+
+
+class Trace:
+    """The spans finished while a trace() block was active, from any thread."""
+
+    def __init__(self, query_id: int = None):
+        self.query_id = query_id
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Times the block as a span, nested under the current span.
+
+    Yields:
+        Span: call set() / add_usage() on it to record attributes and tokens.
+    """
+    current = Span(name, _parent.get(), attrs)
+    token = _parent.set(current.span_id)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.finish()
+        _parent.reset(token)
+        trace_ = _trace.get()
+        if trace_ is not None:
+            trace_.add(current)
+
+
+def traced(name: str):
+    """Decorator: runs every call of the function inside span(name)."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record(name: str, seconds: float, status: str = "ok", **attrs) -> Span:
+    """
+    Records a span that has already finished, under the current span. For
+    stages that can't be wrapped in a with block, such as a generator that
+    yields between its start and end.
+    """
+    finished = Span(name, _parent.get(), attrs)
+    finished.status = status
+    finished.started_at -= seconds
+    finished.finish(seconds)
+    trace_ = _trace.get()
+    if trace_ is not None:
+        trace_.add(finished)
+    return finished
+
+
+def in_context(func):
+    """Wraps func to run in a copy of the current context (trace and parent span), e.g. in a worker thread."""
+    context = copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+def export_jsonl(path, query_id: int, spans) -> None:
+    """Appends spans to a JSON-lines file, one object per span."""
+    with open(path, "a", encoding="utf-8") as f:
+        for s in spans:
+            f.write(json.dumps({"query_id": query_id, **s}, default=str) + "\n")
+
+
+@contextmanager
+def trace(query_id: int = None, db_path=DB_PATH, export=TRACE_EXPORT):
+    """
+    Collects the spans finished inside the block (including in wrapped worker
+    threads) and, at the end, saves them under query_id and exports them.
+
+    Yields:
+        Trace: its spans so far.
+    """
+    current = Trace(query_id)
+    trace_token, parent_token = _trace.set(current), _parent.set(None)
+    try:
+        yield current
+    finally:
+        _trace.reset(trace_token)
+        _parent.reset(parent_token)
+        spans = [s.to_dict() for s in current.spans]
+        if query_id is not None and spans:
+            try:
+                save_spans(query_id, spans, db_path=db_path)
+            except Exception as e:  # telemetry must never fail the query
+                print(f"⚠️ Could not save trace spans: {e}")
+        if export and spans:
+            try:
+                export_jsonl(export, query_id, spans)
+            except OSError as e:
+                print(f"⚠️ Could not export trace spans to {export}: {e}")
+
+
+def stage_breakdown(spans) -> list[dict]:
+    """Per-stage totals for one query: calls, time, tokens and cost, in order of first start."""
+    stages = {}
+    for s in sorted(spans, key=lambda s: s["started_at"]):
+        row = stages.setdefault(s["name"], {"stage": s["name"], "calls": 0, "ms": 0.0, "tokens": 0, "cost_usd": 0.0,
+                                            "errors": 0})
+        row["calls"] += 1
+        row["ms"] += s["duration_ms"]
+        row["tokens"] += (s["prompt_tokens"] or 0) + (s["completion_tokens"] or 0)
+        row["cost_usd"] += s["cost_usd"] or 0.0
+        row["errors"] += s["status"] == "error"
+    return list(stages.values())
+
+
+def stage_percentiles(spans) -> list[dict]:
+    """p50/p95 duration and mean cost per stage over many queries, slowest p95 first."""
+    durations, costs = {}, {}
+    for s in spans:
+        durations.setdefault(s["name"], []).append(s["duration_ms"])
+        costs.setdefault(s["name"], []).append(s["cost_usd"] or 0.0)
+    rows = [
+        {
+            "stage": name,
+            "calls": len(ms),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "mean_cost_usd": float(np.mean(costs[name])),
+        }
+        for name, ms in durations.items()
+    ]
+    return sorted(rows, key=lambda r: -r["p95_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show per-stage timings and cost from the spans in queries.db.")
+    parser.add_argument("--queries", type=int, default=100, help="Recent traced queries to summarize")
+    parser.add_argument("--query-id", type=int, help="Show the stage breakdown of one query")
+    parser.add_argument("--export", help="Write the selected spans to this JSON-lines file")
+    args = parser.parse_args()
+
+    if args.query_id is not None:
+        spans = load_spans(args.query_id)
+        print(f"\n⏱️ Query {args.query_id}")
+        print(f"{'stage':<28}{'calls':>6}{'ms':>10}{'tokens':>9}{'cost $':>10}")
+        for r in stage_breakdown(spans):
+            print(f"{r['stage']:<28}{r['calls']:>6}{r['ms']:>10.1f}{r['tokens']:>9}{r['cost_usd']:>10.5f}")
+    else:
+        spans = recent_spans(args.queries)
+        print(f"\n📈 {len({s['query_id'] for s in spans})} recent queries")
+        print(f"{'stage':<28}{'calls':>6}{'p50 ms':>10}{'p95 ms':>10}{'mean $':>10}")
+        for r in stage_percentiles(spans):
+            print(f"{r['stage']:<28}{r['calls']:>6}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['mean_cost_usd']:>10.5f}")
+
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as f:
+            for s in spans:
+                f.write(json.dumps(s, default=str) + "\n")
+        print(f"\n💾 {len(spans)} spans written to {args.export}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,74 +2,185 @@ import os
 import faiss
 import pickle
 import numpy as np
-from dotenv import load_dotenv
-from openai import OpenAI
 from pybtex.database import parse_file
-from tqdm import tqdm
 
-# Load env vars and OpenAI client
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+from embedding_pipeline import embed_into_index
+from embedding_backends import get_embedding_backend
+from chunk_index import chunk_rows, chunk_ids_for_papers
+from lexical_index import write_lexical_index
+from dedup import write_library_keys
+from bib_entries import entry_id, entry_record, entry_text, format_authors, text_hash, check_unique_ids
+from meta_store import MetaStore, meta_store_writer
+from utils import replace_together
 
 # File paths
 BIB_FILE = "library.bib"
 INDEX_FILE = "zotero.index"
-META_FILE = "zotero_meta.pkl"
+META_FILE = "zotero_meta.bin"
+CHUNK_INDEX_FILE = "zotero_chunks.index"
+LEXICAL_INDEX_FILE = "zotero_lexical.npz"
+LIBRARY_KEYS_FILE = "zotero_keys.npz"
+LEGACY_META_FILE = "zotero_meta.pkl"
 
-def embed(text: str) -> list[float]:
-    """Generate an OpenAI embedding for a string of text."""
-    response = client.embeddings.create(
-        input=[text],
-        model=EMBEDDING_MODEL
-    )
-    return response.data[0].embedding
-
-def load_existing_keys(meta_file):
-    if not os.path.exists(meta_file):
-        return set(), []
+def load_legacy_metadata(meta_file):
+    """Reads the old pickled metadata list, flattening pybtex authors."""
     with open(meta_file, "rb") as f:
         metadata = pickle.load(f)
+    for m in metadata:
+        if not isinstance(m["authors"], str):
+            m["authors"] = format_authors(m["authors"])
+    return metadata
+
+def load_existing_keys(meta_file):
+    """Returns (citation keys, metadata records, store attrs) of the current index."""
+    if os.path.exists(meta_file):
+        store = MetaStore(meta_file)
+        metadata, attrs = list(store), store.attrs
+    elif os.path.exists(LEGACY_META_FILE):
+        print(f"♻️ Converting {LEGACY_META_FILE} to {meta_file}")
+        metadata, attrs = load_legacy_metadata(LEGACY_META_FILE), {}
+    else:
+        return set(), [], {}
     keys = set(m["id"] for m in metadata)
-    return keys, metadata
+    return keys, metadata, attrs
+
+def stored_text_hash(record):
+    """Hash of the text a stored record was embedded from (older records only kept the title)."""
+    return record.get("text_hash") or text_hash(record.get("title") or "No title")
+
+def upgrade_to_id_map(index, metadata):
+    """
+    Wraps an index from before stable ids (row i = metadata[i]) in an
+    IndexIDMap2, reusing its stored vectors instead of re-embedding.
+
+    Returns None if the index cannot give its vectors back (e.g. IVF).
+    """
+    try:
+        vectors = index.reconstruct_n(0, index.ntotal)
+    except RuntimeError:
+        return None
+    inner = faiss.clone_index(index)
+    inner.reset()
+    upgraded = faiss.IndexIDMap2(inner)
+    upgraded.add_with_ids(vectors, np.array([entry_id(m["id"]) for m in metadata], dtype=np.int64))
+    return upgraded
+
+def remove_from_index(index, ids):
+    """
+    Removes vectors by id. Indexes that cannot delete in place (HNSW) are
+    rebuilt from the vectors they keep, which costs no embedding calls.
+    """
+    ids = np.asarray(sorted(ids), dtype=np.int64)
+    if len(ids) == 0:
+        return index
+    try:
+        index.remove_ids(ids)
+        return index
+    except RuntimeError:
+        pass
+    print("♻️ Index type cannot delete in place; rebuilding it from the stored vectors")
+    # Row j of the wrapped index holds the vector for id_map[j]
+    all_ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(all_ids, ids)
+    vectors = faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal)[keep]
+    rebuilt = faiss.clone_index(index)  # same type, training and search settings
+    rebuilt.reset()
+    if keep.any():
+        rebuilt.add_with_ids(vectors, all_ids[keep])
+    return rebuilt
+
+def update_chunk_index(entries, records, metadata):
+    """
+    Re-chunks papers whose abstract or keywords changed, if a chunk index was built.
+
+    Returns:
+        The updated chunk index, or None if there is none.
+    """
+    if not os.path.exists(CHUNK_INDEX_FILE):
+        return None
+    old_hashes = {m["faiss_id"]: m.get("chunks_hash") for m in metadata if "faiss_id" in m}
+    stale = {r["faiss_id"] for r in records if old_hashes.get(r["faiss_id"]) != r["chunks_hash"]}
+    stale |= old_hashes.keys() - {r["faiss_id"] for r in records}
+    if not stale:
+        return None
+
+    chunk_index = faiss.read_index(CHUNK_INDEX_FILE)
+    chunk_index = remove_from_index(chunk_index, chunk_ids_for_papers(chunk_index, stale))
+    todo = [(entry, r["faiss_id"]) for entry, r in zip(entries, records) if r["faiss_id"] in stale]
+    texts, ids = chunk_rows([entry for entry, _ in todo], [faiss_id for _, faiss_id in todo])
+    return embed_into_index(texts, index=chunk_index, ids=ids, desc="📈 Indexing new and edited chunks")
 
 def main():
     print("🔍 Loading existing metadata...")
-    existing_keys, metadata = load_existing_keys(META_FILE)
+    _, metadata, attrs = load_existing_keys(META_FILE)
 
     print("📚 Loading current Zotero library...")
     bib_data = parse_file(BIB_FILE)
     entries = list(bib_data.entries.values())
     print(f"Parsed {len(entries)} total entries from library.bib")
-    print(f"First 5 keys: {[e.key for e in entries[:5]]}")
 
-    new_entries = [e for e in entries if e.key not in existing_keys]
-    print(f"➕ {len(new_entries)} new entries found.")
+    records = [entry_record(entry) for entry in entries]
+    check_unique_ids(records)
 
-    if not new_entries:
+    old_hashes = {entry_id(m["id"]): stored_text_hash(m) for m in metadata}
+    new_hashes = {r["faiss_id"]: r["text_hash"] for r in records}
+    removed = old_hashes.keys() - new_hashes.keys()
+    changed = {i for i in old_hashes.keys() & new_hashes.keys() if old_hashes[i] != new_hashes[i]}
+    added = new_hashes.keys() - old_hashes.keys()
+    print(f"➕ {len(added)} new, ✏️ {len(changed)} edited, ➖ {len(removed)} removed entries found.")
+
+    # Also catches metadata-only edits (authors, year) and stores written before stable ids
+    if records == metadata and all(os.path.exists(f) for f in (META_FILE, LEXICAL_INDEX_FILE, LIBRARY_KEYS_FILE)):
         print("✅ No updates needed.")
         return
 
+    # Vectors from another backend or model would not be comparable with the stored ones
+    embedding_model = get_embedding_backend().name
+    if attrs.get("embedding_model", embedding_model) != embedding_model:
+        print(f"❌ The index was built with {attrs['embedding_model']} but the current backend is "
+              f"{embedding_model}; run scripts/build_index.py to rebuild it.")
+        return
+
     print("🔧 Loading existing FAISS index...")
     index = faiss.read_index(INDEX_FILE)
+    if not isinstance(index, faiss.IndexIDMap):
+        print("♻️ Upgrading index to stable entry ids")
+        index = upgrade_to_id_map(index, metadata)
+        if index is None:
+            print("❌ This index cannot be upgraded in place; run scripts/build_index.py "
+                  "(cached embeddings make the rebuild quick).")
+            return
+
+    # Drop deleted entries and the old vectors of edited ones, then embed only what changed
+    index = remove_from_index(index, removed | changed)
+    todo = [(entry, r["faiss_id"]) for entry, r in zip(entries, records) if r["faiss_id"] in added | changed]
+    index = embed_into_index(
+        [entry_text(entry) for entry, _ in todo],
+        index=index,
+        ids=[faiss_id for _, faiss_id in todo],
+        desc="📈 Indexing new and edited entries",
+    )
+
+    chunk_index = update_chunk_index(entries, records, metadata)
 
-    for entry in tqdm(new_entries, desc="📈 Indexing new entries"):
-        title = entry.fields.get("title", "")
-        emb = embed(title)
-        index.add(np.array([emb], dtype=np.float32))
-        metadata.append({
-            "title": title,
-            "authors": entry.persons.get("author", []),
-            "year": entry.fields.get("year", ""),
-            "id": entry.key
-        })
+    # Metadata is rewritten from library.bib, so edits to authors or year are picked up too
+    attrs = {**attrs, "embedding_model": embedding_model}
 
     # Save updated index and metadata
-    faiss.write_index(index, INDEX_FILE)
-    with open(META_FILE, "wb") as f:
-        pickle.dump(metadata, f)
+    # Each file is swapped in atomically so a running app never reads a partial file
+    # The BM25 index is rebuilt from the records: no API calls, about 1.5s per 100k papers
+    write_lexical_index(LEXICAL_INDEX_FILE, records)
+    write_library_keys(LIBRARY_KEYS_FILE, records)
+    # The index and its metadata are written in full before either is renamed into place
+    writes = {}
+    if chunk_index is not None:
+        writes[CHUNK_INDEX_FILE] = lambda path: faiss.write_index(chunk_index, path)
+    writes[INDEX_FILE] = lambda path: faiss.write_index(index, path)
+    writes[META_FILE] = meta_store_writer(records, ids=[r["faiss_id"] for r in records], attrs=attrs)
+    replace_together(writes)
 
-    print(f"✅ Updated index and metadata with {len(new_entries)} new entries.")
+    print(f"✅ Updated index: {len(added)} added, {len(changed)} re-embedded, {len(removed)} removed "
+          f"({index.ntotal} entries).")
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,11 @@
 from pathlib import Path
+from dotenv import load_dotenv
 
-PROMPT_DIR = Path(__file__).resolve().parents[1] / "prompts"
+ROOT = Path(__file__).resolve().parents[1]
+PROMPT_DIR = ROOT / "prompts"
+
+# Load .env before reading any settings below, whichever script imports us first
+load_dotenv(ROOT / ".env")
 
 def load_prompt(name):
     """
@@ -12,21 +17,125 @@ def load_prompt(name):
     
 def deduplicate_papers(papers):
     """
-    Deduplicate list of paper dicts by exact title match (case insensitive).
-    Returns list with duplicates removed, preserving order.
+    Merges duplicate paper dicts (by PMID, DOI or near-identical title),
+    preserving order. Kept for older imports; see dedup.deduplicate_papers.
     """
-    seen_titles = set()
-    unique_papers = []
-    for paper in papers:
-        title = paper.get("title", "").lower()
-        if title and title not in seen_titles:
-            seen_titles.add(title)
-            unique_papers.append(paper)
-    return unique_papers
+    from dedup import deduplicate_papers as merge_duplicates
+    return merge_duplicates(papers)
 
 import os
 
+
+def _fsync(path) -> None:
+    """Flushes a written file to disk, so a crash after the rename can't leave it empty."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def replace_atomically(path, write):
+    """
+    Writes a file via `write(tmp_path)` and renames it over `path`, so readers
+    only ever see the old or the new file, never a partial one.
+    """
+    replace_together({path: write})
+
+
+def replace_together(writes: dict):
+    """
+    Replaces several files that belong together, e.g. an index and its metadata.
+
+    Every file is written to a temporary path first and only then are all of
+    them renamed into place, back to back. A failed write leaves every old
+    file untouched, and readers can see a mix of old and new files only for
+    the moment between two renames (ZoteroIndex checks the pair and retries).
+
+    Args:
+        writes: Dict of path -> write(tmp_path); files are renamed in this order.
+    """
+    tmp_paths = {path: f"{path}.tmp-{os.getpid()}" for path in writes}
+    try:
+        for path, write in writes.items():
+            write(tmp_paths[path])
+            _fsync(tmp_paths[path])
+        for path, tmp_path in tmp_paths.items():
+            os.replace(tmp_path, path)
+    finally:
+        for tmp_path in tmp_paths.values():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
 # Load model choices from .env, with fallbacks
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 CHAT_MODEL_PUBMED = os.getenv("CHAT_MODEL_PUBMED", "gpt-3.5-turbo")
 CHAT_MODEL_SYNTHESIS = os.getenv("CHAT_MODEL_SYNTHESIS", "gpt-4o")
+
+# Embedding backend: "openai" (EMBEDDING_MODEL) or "local" (offline hashed n-grams, see embedding_backends.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai").lower()
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "768"))
+
+# Embedding batch settings (token budget per request, inputs per request, requests in flight)
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "50000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "1000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+# FAISS index type built by build_index.py (Flat, HNSW, IVF-Flat or a FAISS factory string)
+INDEX_SPEC = os.getenv("INDEX_SPEC", "Flat")
+
+# build_index.py saves the partial index every this many embedded entries, so an
+# interrupted build can continue with --resume (0 disables checkpoints)
+INDEX_CHECKPOINT_EVERY = int(os.getenv("INDEX_CHECKPOINT_EVERY", "5000"))
+
+# Optional abstract/keyword chunk index (see chunk_index.py): words per chunk and
+# how chunk hits are combined into a paper score ("max" or "sum")
+INDEX_CHUNKS = os.getenv("INDEX_CHUNKS", "false").lower() in ("1", "true", "yes")
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", "120"))
+CHUNK_AGGREGATE = os.getenv("CHUNK_AGGREGATE", "max")
+
+# Zotero search mode: semantic (embeddings), lexical (local BM25) or hybrid (both,
+# fused by rank); hybrid skips the embedding call when the best lexical hit
+# contains every query term and outscores the runner-up by this factor
+SEARCH_MODE = os.getenv("SEARCH_MODE", "semantic")
+LEXICAL_CONFIDENT_MARGIN = float(os.getenv("LEXICAL_CONFIDENT_MARGIN", "1.5"))
+
+# Requests in flight per external service (see concurrency.py)
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "4"))
+NCBI_CONCURRENCY = int(os.getenv("NCBI_CONCURRENCY", "3"))
+# Synthesis calls stream for many seconds, so they get their own OpenAI slots
+# instead of starving the short query refinement calls
+OPENAI_SYNTHESIS_CONCURRENCY = int(os.getenv("OPENAI_SYNTHESIS_CONCURRENCY", "4"))
+
+# NCBI E-utilities; an API key raises the rate limit from 3 to 10 requests/sec
+EUTILS_BASE_URL = os.getenv("EUTILS_BASE_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+NCBI_API_KEY = os.getenv("NCBI_API_KEY")
+NCBI_EMAIL = os.getenv("EMAIL_USER") or os.getenv("EMAIL_FROM") or "researchassistant@example.com"
+
+# Local query server (see query_server.py) used by the app and CLI when it is running;
+# set QUERY_SERVER_URL to an empty string to always work in-process
+QUERY_SERVER_URL = os.getenv("QUERY_SERVER_URL", "http://127.0.0.1:8765")
+
+# Semantic answer cache (see answer_cache.py): a question whose embedding is at least
+# this cosine-similar to one answered within the TTL gets the stored answer back
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_DAYS = float(os.getenv("ANSWER_CACHE_TTL_DAYS", "7"))
+
+# find_new_papers.py --daemon: each query is re-checked between these intervals depending
+# on how often it has turned up new papers, by this many workers, sharing this many
+# NCBI requests/sec (the rest of the NCBI limit stays free for interactive searches)
+WATCH_MIN_INTERVAL_HOURS = float(os.getenv("WATCH_MIN_INTERVAL_HOURS", "6"))
+WATCH_MAX_INTERVAL_DAYS = float(os.getenv("WATCH_MAX_INTERVAL_DAYS", "14"))
+WATCH_WORKERS = int(os.getenv("WATCH_WORKERS", "2"))
+WATCH_NCBI_RATE = float(os.getenv("WATCH_NCBI_RATE", "1"))
+
+# Tracing (see tracing.py): spans are always stored in queries.db; set this to a file
+# path to also append every finished trace to it as JSON lines
+TRACE_EXPORT = os.getenv("TRACE_EXPORT") or None
+
+# On-disk caches (embedding vectors, ...) live here
+CACHE_DIR = Path(os.getenv("CACHE_DIR", ROOT / ".cache"))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "2048"))
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "64"))
@@ -1,32 +1,32 @@
+"""
+PubMed Watcher
+
+Re-runs recent queries from query_log against PubMed and reports articles
+not seen before. Seen PMIDs and the date each term was last searched live in
+queries.db (see watch_store.py), so a term is only searched for records
+entered into PubMed since its previous run. Searches run concurrently
+(bounded by NCBI_CONCURRENCY and the E-utilities rate limit); the new PMIDs
+from all terms are de-duplicated, posted once to the NCBI history server,
+and fetched back in large efetch batches that are parsed into structured
+records as they stream in.
+"""
+
 import os
-import json
-import sqlite3
-from datetime import datetime
+from datetime import date, datetime
 from dotenv import load_dotenv
-from Bio import Entrez
 
 load_dotenv()
 
-from pathlib import Path
-
-ROOT = Path(__file__).resolve().parents[1]
-DB_PATH = ROOT / "queries.db"
+from eutils import get_eutils_client
+from pubmed_parser import iter_pubmed_articles
+from concurrency import parallel_map
+from utils import NCBI_CONCURRENCY
+from watch_store import WatchStore, WATCH_PUBMED
+from db import DB_PATH, recent_queries
 
-ENTREZ_EMAIL = os.getenv("EMAIL_USER")  # Required by NCBI
-CACHE_FILE = "pubmed_cache.json"
+CACHE_FILE = "pubmed_cache.json"  # legacy seen-PMID file, imported into WatchStore
 MAX_RESULTS = 10  # Limit per search term
-
-Entrez.email = ENTREZ_EMAIL
-
-def load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_cache(cache):
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f)
+FETCH_BATCH = 500  # records per efetch call from the history server
 
 def get_recent_queries(db_path=DB_PATH, limit=20):
     """
@@ -36,87 +36,131 @@ def get_recent_queries(db_path=DB_PATH, limit=20):
         print(f"Warning: {db_path} not found. No queries loaded.")
         return []
 
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("""
-        SELECT DISTINCT query_text FROM query_log
-        ORDER BY timestamp DESC
-        LIMIT ?
-    """, (limit,))
-    rows = c.fetchall()
-    conn.close()
-    return [r[0] for r in rows]
-
-def search_pubmed(term):
+    return recent_queries(limit, db_path=db_path)
+
+def search_pubmed(term, since=None, until=None):
     """
     Search PubMed for the given term, returning a list of PMIDs.
+
+    Args:
+        term: Search term.
+        since: If given, only records entered (EDAT) on or after this date.
+        until: Last entry date of the range (default: today).
+
+    Returns:
+        list of PMIDs, or None if the search failed.
     """
+    params = {}
+    if since is not None:
+        until = until or date.today()
+        params = {"datetype": "edat", "mindate": since.strftime("%Y/%m/%d"), "maxdate": until.strftime("%Y/%m/%d")}
     try:
-        handle = Entrez.esearch(
-            db="pubmed",
-            term=term,
-            retmax=MAX_RESULTS,
-            sort="most+recent"
-        )
-        record = Entrez.read(handle)
-        handle.close()
-        return record["IdList"]
+        return get_eutils_client().esearch(term, retmax=MAX_RESULTS, sort="most+recent", **params)["ids"]
     except Exception as e:
         print(f"Error searching PubMed for '{term}': {e}")
-        return []
+        return None
+
+def search_all(terms, store, today=None):
+    """
+    Searches every term concurrently, each from its watermark onwards.
 
-def fetch_details(pmid_list):
+    Returns:
+        dict mapping each term to its PMIDs (None if the search failed).
+    """
+    today = today or date.today()
+    # EDAT has day resolution, so the watermark day is searched again; seen PMIDs filter the overlap
+    windows = [(term, store.watermark(term)) for term in terms]
+    results = parallel_map(lambda tw: search_pubmed(tw[0], since=tw[1], until=today), windows,
+                           max_workers=NCBI_CONCURRENCY)
+    return dict(zip(terms, results))
+
+def fetch_records(pmids):
     """
-    Fetch detailed Medline data for a list of PMIDs.
+    Fetches PubMed records for many PMIDs: one epost to the history server,
+    then efetch batches of FETCH_BATCH parsed as they stream in.
+
+    Returns:
+        dict mapping PMID to its parsed record (see pubmed_parser.parse_article).
     """
-    if not pmid_list:
-        return ""
+    if not pmids:
+        return {}
 
+    eutils = get_eutils_client()
     try:
-        handle = Entrez.efetch(
-            db="pubmed",
-            id=pmid_list,
-            rettype="medline",
-            retmode="text"
-        )
-        result = handle.read()
-        handle.close()
-        return result
+        history = eutils.epost(pmids)
     except Exception as e:
-        print(f"Error fetching details from PubMed: {e}")
-        return ""
+        print(f"Error posting PMIDs to the PubMed history server: {e}")
+        return {}
+
+    records = {}
+    for start in range(0, len(pmids), FETCH_BATCH):
+        try:
+            response = eutils.efetch(webenv=history["webenv"], query_key=history["query_key"],
+                                     retstart=start, retmax=FETCH_BATCH, stream=True)
+            try:
+                for record in iter_pubmed_articles(response.raw):
+                    records[record["pmid"]] = record
+            finally:
+                response.close()
+        except Exception as e:
+            print(f"Error fetching PubMed records {start}-{start + FETCH_BATCH}: {e}")
+    return records
 
 def main():
     print(f"📅 PubMed Watcher started at {datetime.now()}")
-    cache = load_cache()
-    new_items = []
-
-    search_terms = get_recent_queries()
+    search_terms = get_recent_queries(DB_PATH)
     if not search_terms:
         print("No recent queries found to search PubMed.")
         return
 
-    for term in search_terms:
-        print(f"🔍 Searching PubMed for: {term}")
-        ids = search_pubmed(term)
-        seen_ids = set(cache.get(term, []))
-        new_ids = [pid for pid in ids if pid not in seen_ids]
-
+    today = date.today()
+    store = WatchStore(DB_PATH, watcher=WATCH_PUBMED)
+    migrated = store.import_json_cache(CACHE_FILE)
+    if migrated:
+        print(f"♻️ Imported {migrated} seen PMIDs from {CACHE_FILE}")
+
+    print(f"🔍 Searching PubMed for {len(search_terms)} terms...")
+    new_ids_by_term = {}
+    searched = []
+    for term, ids in search_all(search_terms, store, today).items():
+        if ids is None:
+            continue  # keep the old watermark so the next run covers this window again
+        searched.append(term)
+        new_ids = store.filter_new(term, ids)
         if new_ids:
             print(f"🆕 Found {len(new_ids)} new results for: {term}")
-            details = fetch_details(new_ids)
-            new_items.append((term, new_ids, details))
-            cache[term] = list(set(cache.get(term, []) + new_ids))
+            new_ids_by_term[term] = new_ids
         else:
             print(f"✅ No new results for: {term}")
 
-    save_cache(cache)
-
-    if new_items:
-        print("\n=== New PubMed Articles Found ===\n")
-        for term, ids, details in new_items:
+    # Terms often overlap, so each article is fetched once however many terms found it
+    unique_ids = list(dict.fromkeys(pid for ids in new_ids_by_term.values() for pid in ids))
+    records = fetch_records(unique_ids)
+    # Only papers that were actually fetched (and so reported) count as seen; a term with
+    # records that failed to fetch keeps its watermark so the next run finds them again
+    incomplete = set()
+    for term, new_ids in new_ids_by_term.items():
+        fetched = [pid for pid in new_ids if pid in records]
+        store.mark_seen(term, fetched, today)
+        if len(fetched) < len(new_ids):
+            incomplete.add(term)
+    for term in searched:
+        if term not in incomplete:
+            store.set_watermark(term, today)
+    store.close()
+
+    if new_ids_by_term:
+        print(f"\n=== {len(unique_ids)} New PubMed Articles Found ===\n")
+        for term, ids in new_ids_by_term.items():
             print(f"🔹 Search Term: {term}")
-            print(details)
+            for pid in ids:
+                record = records.get(pid)
+                if record is None:
+                    print(f"  • PMID {pid} (details unavailable; retried next run)")
+                    continue
+                print(f"  • {record['title']} ({record['year']}) — {record['journal']}")
+                print(f"    {record['authors']}")
+                print(f"    {record['url']}")
             print("----")
     else:
         print("📭 No new PubMed articles found this time.")
@@ -0,0 +1,126 @@
+"""
+Watch Store
+
+Record of what the PubMed watchers have already reported, kept in queries.db
+next to the query log (the tables are created by db.py):
+
+- seen_pmids: one row per (watcher, term, pmid) with the date it was first
+  seen, keyed by (watcher, term, pmid) so membership checks and inserts are
+  index lookups rather than a rewrite of the whole history.
+- watch_watermarks: the date each watcher last searched each term
+  successfully, so its next search asks PubMed only for records entered
+  since then (EDAT).
+- watch_schedule: when find_new_papers.py --daemon next checks each term,
+  and the term's recent hit rate, so the daemon resumes where it stopped.
+
+watch_pubmed.py and the find_new_papers.py daemon each report new papers on
+their own, so each keeps its own seen PMIDs and watermarks (WATCH_PUBMED,
+REFRESH_DAEMON): a paper one of them reported is still new to the other.
+
+The old pubmed_cache.json (a list of PMIDs per term) is imported once and
+renamed to pubmed_cache.json.migrated.
+"""
+
+import json
+import os
+from datetime import date, datetime
+
+from db import get_connection, close_connection, transaction
+
+# Watcher names; the db.py migration that added the watcher column uses the same strings
+WATCH_PUBMED = "watch_pubmed"
+REFRESH_DAEMON = "refresh_daemon"
+
+
+class WatchStore:
+    """One watcher's seen PMIDs and watermarks, and the daemon schedule; each thread uses its own connection."""
+
+    def __init__(self, path, watcher: str = WATCH_PUBMED):
+        self.path = path
+        self.watcher = watcher
+        get_connection(path)  # creates or migrates the schema
+
+    @property
+    def _conn(self):
+        return get_connection(self.path)
+
+    def close(self) -> None:
+        """Closes the calling thread's connection."""
+        close_connection(self.path)
+
+    def filter_new(self, term: str, pmids) -> list:
+        """The PMIDs not yet seen for a term, in their original order."""
+        pmids = list(pmids)
+        if not pmids:
+            return []
+        # Chunked to stay under SQLite's bound-parameter limit
+        seen = set()
+        for start in range(0, len(pmids), 500):
+            batch = pmids[start:start + 500]
+            seen.update(pmid for (pmid,) in self._conn.execute(
+                f"SELECT pmid FROM seen_pmids WHERE watcher = ? AND term = ? AND pmid IN ({','.join('?' * len(batch))})",
+                [self.watcher, term, *batch],
+            ))
+        return [pmid for pmid in pmids if pmid not in seen]
+
+    def mark_seen(self, term: str, pmids, seen_on: date = None) -> None:
+        """Records PMIDs as seen for a term; ones already recorded keep their first_seen date."""
+        seen_on = (seen_on or date.today()).isoformat()
+        with transaction(self.path) as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO seen_pmids (watcher, term, pmid, first_seen) VALUES (?, ?, ?, ?)",
+                [(self.watcher, term, pmid, seen_on) for pmid in pmids],
+            )
+
+    def watermark(self, term: str):
+        """Date of the last successful search for a term, or None if it was never searched."""
+        row = self._conn.execute(
+            "SELECT last_checked FROM watch_watermarks WHERE watcher = ? AND term = ?", (self.watcher, term)
+        ).fetchone()
+        return date.fromisoformat(row[0]) if row else None
+
+    def set_watermark(self, term: str, checked_on: date) -> None:
+        self._conn.execute(
+            "INSERT INTO watch_watermarks (watcher, term, last_checked) VALUES (?, ?, ?) "
+            "ON CONFLICT(watcher, term) DO UPDATE SET last_checked = excluded.last_checked",
+            (self.watcher, term, checked_on.isoformat()),
+        )
+
+    def load_schedule(self) -> dict:
+        """Returns {term: (next_check timestamp, hit_rate, checks)} for every scheduled term."""
+        rows = self._conn.execute("SELECT term, next_check, hit_rate, checks FROM watch_schedule").fetchall()
+        return {term: (next_check, hit_rate, checks) for term, next_check, hit_rate, checks in rows}
+
+    def save_schedule(self, term: str, next_check: float, hit_rate: float, checks: int) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO watch_schedule (term, next_check, hit_rate, checks) VALUES (?, ?, ?, ?)",
+            (term, next_check, hit_rate, checks),
+        )
+
+    def seen_count(self, term: str = None) -> int:
+        if term is None:
+            return self._conn.execute("SELECT COUNT(*) FROM seen_pmids WHERE watcher = ?", (self.watcher,)).fetchone()[0]
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM seen_pmids WHERE watcher = ? AND term = ?", (self.watcher, term)
+        ).fetchone()[0]
+
+    def import_json_cache(self, cache_file) -> int:
+        """
+        Imports a legacy pubmed_cache.json ({term: [pmids]}) and renames it
+        so it is not imported again.
+
+        Returns:
+            Number of (term, pmid) pairs read from the file.
+        """
+        if not os.path.exists(cache_file):
+            return 0
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+        first_seen = datetime.fromtimestamp(os.path.getmtime(cache_file)).date().isoformat()
+        rows = [(self.watcher, term, str(pmid), first_seen) for term, pmids in cache.items() for pmid in pmids]
+        with transaction(self.path) as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO seen_pmids (watcher, term, pmid, first_seen) VALUES (?, ?, ?, ?)", rows
+            )
+        os.replace(cache_file, f"{cache_file}.migrated")
+        return len(rows)
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep on-disk caches out of the project folder while testing
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="research-assistant-cache-"))
@@ -0,0 +1,97 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import db
+from answer_cache import AnswerCache
+from embedding_backends import HashingEmbeddingBackend
+from manager_agent import lookup_answer
+
+QUESTION = "Does dietary calcium lower LDL cholesterol in adults?"
+
+
+class TestAnswerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = Path(self.tmp.name) / "queries.db"
+        self.addCleanup(db.close_connection, self.db_path)
+        # Character n-gram vectors: near-identical wording gives near-identical vectors
+        self.embed = patch("answer_cache.embed_texts", side_effect=HashingEmbeddingBackend().embed)
+        self.mock_embed = self.embed.start()
+        self.addCleanup(self.embed.stop)
+        self.cache = AnswerCache(self.db_path, threshold=0.9)
+
+    def answer(self, question, text="Calcium modestly lowers LDL.", seconds=12.0):
+        query_id = db.log_query(question, db_path=self.db_path)
+        db.save_result_items(query_id, "zotero", [{"id": "smith2020", "title": "Calcium and LDL"}], db_path=self.db_path)
+        db.save_result_items(query_id, "pubmed", [{"pmid": "1", "title": "A trial"}], db_path=self.db_path)
+        db.save_results(query_id, "synthesis", text, db_path=self.db_path)
+        db.log_metrics(query_id, {"pipeline_seconds": seconds}, db_path=self.db_path)
+        return query_id
+
+    def test_near_identical_question_returns_stored_answer(self):
+        source_id = self.answer(QUESTION)
+        hit = self.cache.lookup("does dietary calcium lower LDL cholesterol in adults")
+        self.assertIsNotNone(hit)
+        self.assertEqual(hit.query_id, source_id)
+        self.assertEqual(hit.answer, "Calcium modestly lowers LDL.")
+        self.assertEqual(hit.zotero[0]["id"], "smith2020")
+        self.assertEqual(hit.pubmed[0]["pmid"], "1")
+        self.assertEqual(hit.saved_seconds, 12.0)
+        self.assertGreaterEqual(hit.similarity, 0.9)
+
+        self.assertIsNone(self.cache.lookup("Which gut bacteria produce butyrate in mice?"))
+
+    def test_empty_history_needs_no_embedding(self):
+        self.assertIsNone(self.cache.lookup(QUESTION))
+        self.mock_embed.assert_not_called()
+
+    def test_answers_saved_later_are_picked_up_and_old_ones_expire(self):
+        self.assertIsNone(self.cache.lookup(QUESTION))
+        self.answer(QUESTION)
+        self.assertIsNotNone(self.cache.lookup(QUESTION))
+        self.assertIsNotNone(self.cache.lookup(QUESTION))
+        # The past question is embedded once; each lookup embeds only the new question
+        self.assertEqual(sum(len(c.args[0]) for c in self.mock_embed.call_args_list), 3)
+
+        self.cache.ttl_seconds = -1
+        self.assertIsNone(self.cache.lookup(QUESTION))
+
+    def test_embedding_runs_outside_the_lock(self):
+        self.answer(QUESTION)
+        embed = HashingEmbeddingBackend().embed
+        held = []
+
+        def checking_embed(texts):
+            held.append(self.cache._lock.locked())
+            return embed(texts)
+
+        self.mock_embed.side_effect = checking_embed
+        self.assertIsNotNone(self.cache.lookup(QUESTION))
+        self.assertEqual(held, [False, False])
+
+    def test_outcomes_are_logged_as_query_metrics(self):
+        self.answer(QUESTION, seconds=20.0)
+        with patch("manager_agent.get_answer_cache", return_value=self.cache):
+            new_id = db.log_query(QUESTION, db_path=self.db_path)
+            self.assertIsNotNone(lookup_answer(QUESTION, new_id))
+            other_id = db.log_query("Butyrate and colitis", db_path=self.db_path)
+            self.assertIsNone(lookup_answer("Butyrate and colitis", other_id))
+            forced_id = db.log_query(QUESTION, db_path=self.db_path)
+            self.assertIsNone(lookup_answer(QUESTION, forced_id, force_refresh=True))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["bypassed"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+        self.assertEqual(stats["saved_seconds"], 20.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import unittest
+
+import numpy as np
+
+from benchmark_index import benchmark, split_queries, synthetic_vectors
+
+
+class TestBenchmarkIndex(unittest.TestCase):
+
+    def test_queries_are_held_out_of_the_index(self):
+        vectors = synthetic_vectors(500, 16)
+        indexed, queries = split_queries(vectors, 50)
+        self.assertEqual((len(indexed), len(queries)), (450, 50))
+        self.assertFalse(set(map(bytes, queries)) & set(map(bytes, indexed)))
+        self.assertEqual(len(split_queries(vectors[:10], 50)[1]), 5)
+
+    def test_exact_index_has_full_recall(self):
+        results = benchmark(synthetic_vectors(500, 16), ["Flat", "IVF2,Flat"], k=5, n_queries=20)
+        self.assertEqual([r["n_vectors"] for r in results], [480, 480])
+        self.assertEqual(results[0]["recall@5"], 1.0)
+        self.assertTrue(np.isfinite(results[1]["p99_ms"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
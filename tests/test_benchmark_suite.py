@@ -0,0 +1,105 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import requests
+from openai import OpenAI
+
+from stub_services import StubServices, StubProfile
+from benchmark_suite import check_tokenizer, compare_results, metric_direction, parse_sizes
+from eutils import EutilsClient
+from pubmed_parser import iter_pubmed_articles
+from test_embedding_pipeline import ByteEncoding
+
+
+class TestStubServices(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubServices(dim=8, answer_words=4).start()
+        self.addCleanup(self.stub.stop)
+        self.openai = OpenAI(api_key="sk-test", base_url=self.stub.openai_url, max_retries=0)
+        self.eutils = EutilsClient(base_url=self.stub.eutils_url, rate=1000, max_retries=0)
+
+    def test_embeddings_are_deterministic_unit_vectors(self):
+        first = self.openai.embeddings.create(input=["calcium", "cholesterol"], model="text-embedding-3-small")
+        again = self.openai.embeddings.create(input=["calcium"], model="text-embedding-3-small")
+        vectors = np.array([d.embedding for d in first.data])
+        self.assertEqual(vectors.shape, (2, 8))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, rtol=1e-5)
+        np.testing.assert_allclose(again.data[0].embedding, vectors[0], rtol=1e-6)
+
+    def test_chat_answers_and_streams(self):
+        messages = [{"role": "user", "content": "Does calcium lower cholesterol?"}]
+        reply = self.openai.chat.completions.create(model="gpt-4", messages=messages)
+        self.assertIn("[tiab]", reply.choices[0].message.content)
+
+        stream = self.openai.chat.completions.create(model="gpt-4", messages=messages, stream=True)
+        text = "".join(c.choices[0].delta.content or "" for c in stream if c.choices)
+        self.assertEqual(len(text.split()), 4)
+
+    def test_esearch_and_efetch_by_ids_and_history(self):
+        search = self.eutils.esearch("calcium[tiab]", retmax=250, usehistory=True)
+        self.assertEqual(len(search["ids"]), 250)
+        self.assertEqual(search["ids"], self.eutils.esearch("calcium[tiab]", retmax=250)["ids"])
+
+        response = self.eutils.efetch(search["ids"], stream=True)  # over POST_ID_THRESHOLD: sent as a POST
+        articles = list(iter_pubmed_articles(response.raw))
+        self.assertEqual([a["pmid"] for a in articles], search["ids"])
+
+        body = self.eutils.efetch(webenv=search["webenv"], query_key=search["query_key"], retstart=10, retmax=5)
+        self.assertEqual(body.count(b"<PubmedArticle>"), 5)
+
+    def test_injected_errors_and_latency(self):
+        self.stub.profiles["ncbi"] = StubProfile(latency=0.05, error_rate=1.0)
+        with self.assertRaises(requests.HTTPError):
+            self.eutils.esearch("calcium")
+        self.assertEqual(self.stub.requests["errors"], 1)
+        self.assertEqual(self.stub.requests["esearch.fcgi"], 1)
+
+
+class TestCompareResults(unittest.TestCase):
+
+    def test_flags_worse_timings_and_throughput_only(self):
+        run = {"commit": "abc", "timestamp": "t"}
+        before = {"run": run, "results": {
+            "query_zotero/1000": {"vectors": 1000, "p50_ms": 10.0, "p95_ms": 20.0},
+            "build_index/1000": {"entries_per_sec": 500.0},
+        }}
+        after = {"run": run, "results": {
+            "query_zotero/1000": {"vectors": 2000, "p50_ms": 10.5, "p95_ms": 30.0},
+            "build_index/1000": {"entries_per_sec": 1000.0},
+            "manager_agent": {"p50_ms": 900.0},
+        }}
+        rows = {(r["benchmark"], r["metric"]): r for r in compare_results(before, after, threshold=10)}
+        self.assertEqual(set(rows), {("query_zotero/1000", "p50_ms"), ("query_zotero/1000", "p95_ms"),
+                                     ("build_index/1000", "entries_per_sec")})
+        self.assertFalse(rows["query_zotero/1000", "p50_ms"]["regression"])
+        self.assertTrue(rows["query_zotero/1000", "p95_ms"]["regression"])
+        self.assertFalse(rows["build_index/1000", "entries_per_sec"]["regression"])
+        self.assertAlmostEqual(rows["build_index/1000", "entries_per_sec"]["change_pct"], 100.0)
+
+    def test_metric_direction_and_sizes(self):
+        self.assertEqual(metric_direction("articles_per_sec"), 1)
+        self.assertEqual(metric_direction("first_token_p95_ms"), -1)
+        self.assertEqual(metric_direction("failures"), 0)
+        self.assertEqual(parse_sizes("1k, 2.5k,1M,300"), [1000, 2500, 1000000, 300])
+
+
+class TestCheckTokenizer(unittest.TestCase):
+
+    def test_reports_missing_encoding(self):
+        offline = requests.ConnectionError("Failed to resolve 'openaipublic.blob.core.windows.net'")
+        with patch("embedding_pipeline.get_encoding", side_effect=offline):
+            with self.assertRaises(SystemExit) as raised:
+                check_tokenizer()
+        self.assertIn("tiktoken.encoding_for_model", str(raised.exception))
+
+        with patch("embedding_pipeline.get_encoding", return_value=ByteEncoding()):
+            check_tokenizer()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import unittest
+
+import faiss
+import numpy as np
+
+from chunk_index import CHUNK_BITS, aggregate_by_paper, search_papers
+
+
+def unit(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+class TestChunkIndex(unittest.TestCase):
+
+    def test_aggregation_matches_python_loop(self):
+        rng = np.random.default_rng(0)
+        scores = rng.random((3, 40)).astype(np.float32)
+        papers = rng.integers(-1, 8, size=(3, 40))
+        for how, combine in (("max", max), ("sum", sum)):
+            top_scores, top_ids = aggregate_by_paper(scores, papers, k=4, how=how)
+            for q in range(3):
+                per_paper = {}
+                for s, p in zip(scores[q], papers[q]):
+                    if p >= 0:
+                        per_paper.setdefault(p, []).append(s)
+                expected = sorted(((combine(v), p) for p, v in per_paper.items()), reverse=True)[:4]
+                np.testing.assert_allclose(top_scores[q], [s for s, _ in expected], rtol=1e-5)
+                self.assertEqual(set(top_ids[q]), {p for _, p in expected})
+
+    def test_abstract_chunks_find_papers_titles_miss(self):
+        dim = 8
+        titles = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+        titles.add_with_ids(unit(np.eye(dim)[:4] + 0.1), np.array([10, 11, 12, 13]))
+
+        # Paper 12 has many near-duplicate chunks close to the query; paper 13 one exact chunk
+        chunks = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+        query = unit([np.eye(dim)[6]])
+        near = unit(np.eye(dim)[6] + 0.05 * np.eye(dim)[7] * np.arange(1, 31)[:, None])
+        chunks.add_with_ids(near, (12 << CHUNK_BITS) | np.arange(30))
+        chunks.add_with_ids(unit([np.eye(dim)[6] + 0.01 * np.eye(dim)[5]]), np.array([13 << CHUNK_BITS]))
+
+        scores, ids = search_papers(titles, chunks, query, k=3)
+        self.assertEqual(ids[0][:2].tolist(), [13, 12])
+        self.assertEqual(len(set(ids[0].tolist())), 3)
+        self.assertTrue(np.all(np.diff(scores[0]) <= 0))
+
+        # Without a chunk index only the titles are searched
+        _, title_only = search_papers(titles, None, query, k=3)
+        self.assertNotIn(13, title_only[0][:1].tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import db
+
+
+class TestQueryDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = Path(self.tmp.name) / "queries.db"
+        self.addCleanup(db.close_connection, self.db_path)
+
+    def test_schema_is_migrated_once_and_connections_are_reused(self):
+        conn = db.get_connection(self.db_path)
+        self.assertIs(db.get_connection(self.db_path), conn)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], len(db.MIGRATIONS))
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertTrue({"idx_query_log_text", "idx_query_log_timestamp", "idx_result_items_query_id"} <= indexes)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(db.get_connection(self.db_path)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_upgrades_database_from_before_migrations(self):
+        legacy = sqlite3.connect(self.db_path)
+        legacy.execute("CREATE TABLE query_log (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                       "query_text TEXT NOT NULL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+        legacy.execute("INSERT INTO query_log (query_text) VALUES ('old question')")
+        legacy.commit()
+        legacy.close()
+
+        self.assertEqual(db.recent_queries(db_path=self.db_path), ["old question"])
+        db.save_result_items(1, "zotero", [{"title": "A"}], db_path=self.db_path)
+
+    def test_structured_results_and_metrics(self):
+        query_id = db.log_query("calcium and LDL", db_path=self.db_path)
+        db.save_result_items(query_id, "pubmed", [{"pmid": "2", "title": "B"}, {"pmid": "1", "title": "A"}],
+                             db_path=self.db_path)
+        db.save_result_items(query_id, "zotero", [{"id": "smith2020", "faiss_id": 7}], db_path=self.db_path)
+        db.save_results(query_id, "synthesis", "Calcium lowers LDL.", db_path=self.db_path)
+        db.log_metrics(query_id, {"synthesis_seconds": 2.5, "synthesis_ttft_seconds": 0.4}, db_path=self.db_path)
+
+        pubmed = db.load_result_items(query_id, "pubmed", db_path=self.db_path)
+        self.assertEqual([p["pmid"] for p in pubmed], ["2", "1"])
+        self.assertEqual(len(db.load_result_items(query_id, db_path=self.db_path)), 3)
+        conn = db.get_connection(self.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM query_metrics WHERE query_id = ?", (query_id,)).fetchone()[0], 2)
+
+    def test_failed_transaction_is_rolled_back(self):
+        query_id = db.log_query("q", db_path=self.db_path)
+        with self.assertRaises(RuntimeError):
+            with db.transaction(self.db_path) as conn:
+                conn.execute("INSERT INTO result_items (query_id, source, rank, item) VALUES (?, 'pubmed', 0, '{}')",
+                             (query_id,))
+                raise RuntimeError("crash mid-write")
+        self.assertEqual(db.load_result_items(query_id, db_path=self.db_path), [])
+
+    def test_recent_queries_are_distinct_newest_first(self):
+        for text in ("a", "b", "a", "c"):
+            db.log_query(text, db_path=self.db_path)
+        self.assertEqual(db.recent_queries(db_path=self.db_path), ["c", "a", "b"])
+        self.assertEqual(db.recent_queries(2, db_path=self.db_path), ["c", "a"])
+
+    def test_concurrent_writers(self):
+        def write(n):
+            for i in range(20):
+                query_id = db.log_query(f"thread {n} query {i}", db_path=self.db_path)
+                db.save_result_items(query_id, "zotero", [{"rank": r} for r in range(5)], db_path=self.db_path)
+            db.close_connection(self.db_path)
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        conn = db.get_connection(self.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM result_items").fetchone()[0], 4 * 20 * 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
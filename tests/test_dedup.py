@@ -0,0 +1,133 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from pybtex.database import parse_string
+
+from bib_entries import entry_pmid, entry_record
+from dedup import (BANDS, LibraryKeys, deduplicate_papers, key_hashes, normalize_title, title_similarity,
+                   write_library_keys)
+
+TITLE = "Dietary calcium intake and LDL cholesterol in postmenopausal women"
+
+
+class TestDeduplicatePapers(unittest.TestCase):
+
+    def test_merges_on_pmid_doi_and_title_and_fills_fields(self):
+        papers = [
+            {"title": "Paper A", "pmid": "1", "abstract": ""},
+            {"title": "Paper B", "doi": "10.1/b"},
+            {"title": "Paper A (copy)", "pmid": "1", "abstract": "Filled in"},
+            {"title": "Paper B, again", "doi": "https://doi.org/10.1/B"},
+            {"title": "paper a."},
+        ]
+        result = deduplicate_papers(papers)
+        self.assertEqual([p["title"] for p in result], ["Paper A", "Paper B"])
+        self.assertEqual(result[0]["abstract"], "Filled in")
+
+    def test_merges_near_identical_titles(self):
+        papers = [
+            {"title": TITLE, "pmid": "1"},
+            {"title": "Dietary calcium intake and LDL-cholesterol in post-menopausal women", "doi": "10.1/x"},
+            {"title": "Dietary calcium intake and LDL cholesterol in postmenopausal wmen"},
+            {"title": "Vitamin D receptor signalling in mouse adipose tissue"},
+        ]
+        result = deduplicate_papers(papers)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[0]["doi"], "10.1/x")
+
+    def test_compares_with_every_paper_in_a_bucket(self):
+        papers = [
+            {"title": "Vitamin D receptor signalling in mouse adipose tissue"},
+            {"title": TITLE},
+            {"title": "Dietary calcium intake and LDL cholesterol in postmenopausal wmen"},
+        ]
+        # All three share one band key; the third only resembles the second
+        with patch("dedup.title_bands", return_value=np.full((3, BANDS), 7, dtype=np.uint64)):
+            self.assertEqual(len(deduplicate_papers(papers)), 2)
+            with patch("dedup.MAX_CANDIDATES", 1):
+                self.assertEqual(len(deduplicate_papers(papers)), 3)
+
+    def test_keeps_papers_with_conflicting_ids(self):
+        papers = [{"title": TITLE, "pmid": "1"}, {"title": TITLE, "pmid": "2"}]
+        self.assertEqual(len(deduplicate_papers(papers)), 2)
+
+    def test_title_normalization(self):
+        self.assertEqual(normalize_title("Café <i>in vivo</i>: LDL!"), "cafe in vivo ldl")
+        self.assertEqual(title_similarity("abcdefgh", "abcdefgh"), 1.0)
+        self.assertLess(title_similarity(normalize_title(TITLE), "vitamin d receptor signalling"), 0.1)
+
+
+class TestLibraryKeys(unittest.TestCase):
+
+    def test_matches_by_id_and_title(self):
+        records = [
+            {"id": "smith2020", "title": TITLE, "pmid": "111", "doi": ""},
+            {"id": "lee2021", "title": "Vitamin D in mice", "pmid": "", "doi": "10.1/lee"},
+            {"id": "short", "title": "LDL", "pmid": "", "doi": ""},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "zotero_keys.npz"
+            write_library_keys(path, records)
+            keys = LibraryKeys(path)
+
+        papers = [
+            {"title": "Something else entirely", "pmid": "111"},
+            {"title": "Other", "doi": "doi:10.1/LEE"},
+            {"title": "Dietary calcium intake and LDL-cholesterol in post-menopausal women."},
+            {"title": "ldl"},
+            {"title": TITLE, "pmid": "999"},  # same title, different paper
+            {"title": "Sodium and blood pressure in rats"},
+        ]
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(keys.match(papers), ["smith2020", "lee2021", "smith2020", "short", None, None])
+
+    def test_keys_are_hashed_and_memory_mapped(self):
+        records = [
+            {"id": "smith2020", "title": TITLE, "pmid": "111", "doi": ""},
+            {"id": "lee2021", "title": "Vitamin D in mice", "pmid": "", "doi": "10.1/lee"},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "zotero_keys.npz"
+            write_library_keys(path, records)
+            keys = LibraryKeys(path)
+            self.assertEqual(keys.exact_hashes.dtype, np.uint64)
+            self.assertFalse(keys.titles.data.flags.writeable)
+            self.assertEqual(keys.titles[0], normalize_title(TITLE))
+
+            # Every key hashes alike: matches are still confirmed against the stored row
+            with patch("dedup.key_hashes", side_effect=lambda k: np.zeros(len(k), dtype=np.uint64)):
+                write_library_keys(path, records)
+                keys = LibraryKeys(path)
+                self.assertEqual(keys.match([{"title": "x", "doi": "10.1/LEE"}, {"title": "y", "pmid": "5"}]),
+                                 ["lee2021", None])
+        self.assertEqual(len(set(key_hashes(["pmid:1", "doi:1", "title:1"]))), 3)
+
+    def test_empty_library(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "zotero_keys.npz"
+            write_library_keys(path, [])
+            self.assertEqual(LibraryKeys(path).match([{"title": TITLE}]), [None])
+
+
+class TestEntryIds(unittest.TestCase):
+
+    def test_reads_pmid_and_doi(self):
+        bib = parse_string("""
+@article{a, title = {A}, pmid = {123}, doi = {10.1/a}}
+@article{b, title = {B}, extra = {PMID: 456\nPMCID: PMC1}}
+@article{c, title = {C}}
+""", "bibtex")
+        self.assertEqual([entry_pmid(e) for e in bib.entries.values()], ["123", "456", ""])
+        record = entry_record(bib.entries["a"])
+        self.assertEqual((record["pmid"], record["doi"]), ("123", "10.1/a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
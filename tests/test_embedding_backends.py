@@ -0,0 +1,58 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from embedding_backends import HashingEmbeddingBackend, get_embedding_backend
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import embed_texts
+
+
+class TestHashingEmbeddingBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = HashingEmbeddingBackend(dim=256)
+
+    def test_vectors_are_unit_length_and_batch_independent(self):
+        texts = ["Calcium and cholesterol", "Vitamin D in mice", "", "Ünïcode títle"]
+        vectors = self.backend.embed(texts)
+        self.assertEqual(vectors.shape, (4, 256))
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_allclose(np.linalg.norm(vectors[[0, 1, 3]], axis=1), 1.0, rtol=1e-5)
+        # A text embeds the same alone or in a batch (no n-grams leak across texts)
+        np.testing.assert_allclose(self.backend.embed([texts[1]])[0], vectors[1], rtol=1e-6)
+
+    def test_similar_texts_are_closer(self):
+        a, b, c = self.backend.embed([
+            "Effect of dietary calcium on plasma cholesterol",
+            "Dietary calcium and plasma cholesterol levels",
+            "Insulin signalling in adipose tissue",
+        ])
+        self.assertGreater(a @ b, a @ c)
+
+    def test_selected_by_configuration_and_bypasses_cache(self):
+        cache = EmbeddingCache(Path(tempfile.mkdtemp()) / "embeddings.sqlite")
+        with patch("embedding_backends.EMBEDDING_BACKEND", "local"), \
+             patch("embedding_backends._backend", None), \
+             patch("embedding_pipeline.get_embedding_cache", return_value=cache), \
+             patch("embedding_backends.openai_client") as mock_client:
+            backend = get_embedding_backend()
+            self.assertTrue(backend.name.startswith("local-hash-"))
+            vectors = embed_texts(["Calcium and cholesterol", "Vitamin D in mice"])
+        mock_client.assert_not_called()
+        self.assertEqual(vectors.shape[0], 2)
+        self.assertEqual(cache.misses, 0)
+
+        with patch("embedding_backends.EMBEDDING_BACKEND", "word2vec"), patch("embedding_backends._backend", None):
+            with self.assertRaises(ValueError):
+                get_embedding_backend()
+
+
+if __name__ == "__main__":
+    unittest.main()
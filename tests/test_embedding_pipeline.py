@@ -0,0 +1,142 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+
+import embedding_pipeline
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import iter_token_batches, embed_into_index
+from index_specs import resolve_index_spec, make_index
+
+
+def fake_embeddings(input, model):
+    """Returns 2-d vectors derived from the text so order can be checked."""
+    # Reverse the order to check results are re-sorted by their index
+    data = [
+        MagicMock(index=i, embedding=[float(len(text)), float(sum(map(ord, text)) % 97)])
+        for i, text in enumerate(input)
+    ]
+    return MagicMock(data=list(reversed(data)))
+
+
+class ByteEncoding:
+    """Stand-in for the tiktoken encoding, one token per UTF-8 byte, so tests need no BPE download."""
+
+    def encode_ordinary(self, text):
+        return list(text.encode("utf-8"))
+
+    def decode(self, tokens):
+        return bytes(tokens).decode("utf-8", errors="ignore")
+
+
+def patch_encoding():
+    """Replaces the tokenizer used for batching embedding requests with ByteEncoding."""
+    return patch("embedding_pipeline.get_encoding", return_value=ByteEncoding())
+
+
+def patch_embeddings_api():
+    """Replaces the OpenAI client used by the embedding backend with a fake one."""
+    fake_client = MagicMock()
+    fake_client.embeddings.create.side_effect = fake_embeddings
+    return patch("embedding_backends.openai_client", return_value=fake_client)
+
+
+class TestEmbeddingPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = EmbeddingCache(Path(self.tmp.name) / "embeddings.sqlite")
+        patcher = patch("embedding_pipeline.get_embedding_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        api = patch_embeddings_api()
+        self.mock_create = api.start().return_value.embeddings.create
+        self.addCleanup(api.stop)
+        encoding = patch_encoding()
+        encoding.start()
+        self.addCleanup(encoding.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_batches_respect_token_and_item_limits(self):
+        texts = ["calcium and cholesterol"] * 10
+        per_text = len(embedding_pipeline.get_encoding().encode_ordinary(texts[0]))
+
+        batches = list(iter_token_batches(texts, max_tokens=per_text * 3, max_items=100))
+        self.assertEqual([len(b) for _, b in batches], [3, 3, 3, 1])
+        self.assertEqual([s for s, _ in batches], [0, 3, 6, 9])
+
+        batches = list(iter_token_batches(texts, max_tokens=10**6, max_items=4))
+        self.assertEqual([len(b) for _, b in batches], [4, 4, 2])
+
+    def test_embed_into_index_keeps_input_order(self):
+        texts = [f"paper {'x' * i}" for i in range(25)]
+        with patch("embedding_pipeline.EMBEDDING_BATCH_SIZE", 4):
+            index = embed_into_index(texts)
+
+        self.assertEqual(index.ntotal, 25)
+        self.assertEqual(self.mock_create.call_count, 7)
+        # First component is the text length, so rows must follow input order
+        lengths = [index.reconstruct(i)[0] for i in range(25)]
+        self.assertEqual(lengths, [float(len(t)) for t in texts])
+
+    def test_rebuild_reads_through_cache(self):
+        texts = ["Calcium and cholesterol", "Vitamin D in mice", "Calcium and cholesterol"]
+        first = embed_into_index(texts)
+        calls = self.mock_create.call_count
+
+        second = embed_into_index(texts)
+        self.assertEqual(self.mock_create.call_count, calls)  # nothing re-embedded
+        np.testing.assert_array_equal(first.reconstruct_n(0, 3), second.reconstruct_n(0, 3))
+
+        # Adding one new title only embeds that title
+        embed_into_index(texts + ["Insulin signalling"])
+        self.assertEqual(self.mock_create.call_count, calls + 1)
+        self.assertEqual(self.mock_create.call_args.kwargs["input"], ["Insulin signalling"])
+
+    def test_untrained_index_is_trained_before_adding(self):
+        self.assertEqual(resolve_index_spec("hnsw", 1000), "HNSW32")
+        factory_string = resolve_index_spec("IVF-Flat", 200)
+        self.assertEqual(factory_string, "IVF5,Flat")
+
+        texts = [f"Paper number {i} {'y' * (i % 13)}" for i in range(200)]
+        with patch("embedding_pipeline.EMBEDDING_BATCH_SIZE", 16):
+            index = embed_into_index(texts, index_factory=lambda dim: make_index(factory_string, dim))
+        self.assertTrue(index.is_trained)
+        self.assertEqual(index.ntotal, 200)
+
+    def test_index_is_trained_on_a_random_sample(self):
+        texts = [f"Paper number {i}" for i in range(200)]
+        trained_on = []
+
+        def train(index, vectors):
+            trained_on.append(vectors)
+            index.train(vectors)
+
+        with patch("embedding_pipeline._train", side_effect=train):
+            index = embed_into_index(texts, index_factory=lambda dim: make_index("IVF2,Flat", dim))
+        self.assertEqual(index.ntotal, 200)
+        # IVF2 trains on 100 vectors; lengths grow with the paper number, so a sample of
+        # the first 100 papers would never include a three-digit one
+        lengths = trained_on[0][:, 0]
+        self.assertEqual(len(lengths), 100)
+        self.assertIn(float(len("Paper number 100")), lengths)
+
+    def test_cache_evicts_least_recently_used(self):
+        vector = np.ones(256, dtype=np.float32)  # 1 KiB each
+        cache = EmbeddingCache(Path(self.tmp.name) / "small.sqlite", max_bytes=3 * 1024)
+        cache.put_many("m", ["a", "b", "c"], [vector] * 3)
+        cache.get_many("m", ["a"])  # "a" is now more recent than "b"
+        cache.put_many("m", ["d"], [vector])
+
+        # Over the cap: trims to 90% by dropping the two least recently used
+        self.assertEqual(sorted(cache.get_many("m", ["a", "b", "c", "d"])), [0, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from eutils import EutilsClient, TokenBucket
+
+
+def response(status, body=b"", headers=None):
+    return MagicMock(status_code=status, content=body, headers=headers or {})
+
+
+class TestEutilsClient(unittest.TestCase):
+
+    def test_token_bucket_spaces_requests(self):
+        bucket = TokenBucket(rate=20)
+        started = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        # First request is immediate, the other four wait 1/20 s each
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+    def test_retries_throttled_requests_and_sends_api_key(self):
+        client = EutilsClient(api_key="secret", rate=1000)
+        esearch_xml = b"""
+        <eSearchResult>
+            <Count>42</Count><QueryKey>1</QueryKey><WebEnv>MCID_abc</WebEnv>
+            <IdList><Id>111</Id><Id>222</Id></IdList>
+        </eSearchResult>
+        """
+        client.session.get = MagicMock(side_effect=[
+            response(429, headers={"Retry-After": "0"}),
+            response(200, esearch_xml),
+        ])
+
+        result = client.esearch("calcium", retmax=2, usehistory=True)
+        self.assertEqual(result, {"ids": ["111", "222"], "count": 42, "webenv": "MCID_abc", "query_key": "1"})
+        self.assertEqual(client.session.get.call_count, 2)
+        params = client.session.get.call_args.kwargs["params"]
+        self.assertEqual((params["api_key"], params["usehistory"]), ("secret", "y"))
+
+    def test_long_id_lists_are_posted(self):
+        client = EutilsClient(rate=1000)
+        client.session.post = MagicMock(return_value=response(200, b"<PubmedArticleSet/>"))
+        client.efetch([str(i) for i in range(500)])
+        data = client.session.post.call_args.kwargs["data"]
+        self.assertEqual(len(data["id"].split(",")), 500)
+
+    def test_rate_depends_on_api_key(self):
+        self.assertEqual(EutilsClient(api_key=None).limiter.rate, 3)
+        self.assertEqual(EutilsClient(api_key="secret").limiter.rate, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import watch_pubmed
+from find_new_papers import RefreshScheduler, refresh_interval
+from test_watch_pubmed import FakeEutils
+from watch_store import WatchStore, REFRESH_DAEMON
+
+HOUR, DAY = 3600, 86400
+
+
+class TestRefreshScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = Path(self.tmp.name) / "queries.db"
+        self.store = WatchStore(self.db_path, watcher=REFRESH_DAEMON)
+        self.addCleanup(self.store.close)
+        self.now = 1_000_000.0
+
+    def scheduler(self, **kwargs):
+        return RefreshScheduler(self.store, min_interval=6 * HOUR, max_interval=14 * DAY,
+                                rate=1000, clock=lambda: self.now, **kwargs)
+
+    def test_interval_spans_min_to_max(self):
+        self.assertAlmostEqual(refresh_interval(1.0, 6 * HOUR, 14 * DAY), 6 * HOUR)
+        self.assertAlmostEqual(refresh_interval(0.0, 6 * HOUR, 14 * DAY), 14 * DAY)
+        self.assertLess(refresh_interval(0.7, 6 * HOUR, 14 * DAY), refresh_interval(0.3, 6 * HOUR, 14 * DAY))
+
+    def test_active_queries_are_checked_more_often_than_dormant_ones(self):
+        scheduler = self.scheduler()
+        self.assertEqual(scheduler.sync_terms(["hot", "dead"]), 2)
+        self.assertEqual(scheduler.sync_terms(["hot", "dead"]), 0)
+        self.assertEqual(sorted(scheduler.pop_due(self.now, limit=10)), ["dead", "hot"])
+
+        for _ in range(5):
+            hot_next = scheduler.complete("hot", ["1"], self.now)
+            dead_next = scheduler.complete("dead", [], self.now)
+        self.assertLess(hot_next - self.now, 12 * HOUR)
+        self.assertGreater(dead_next - self.now, 5 * DAY)
+        # A failed check is retried soon and does not move the hit rate
+        rate_before = scheduler.state["dead"][1]
+        self.assertEqual(scheduler.complete("dead", None, self.now), self.now + 6 * HOUR)
+        self.assertEqual(scheduler.state["dead"][1], rate_before)
+
+    def test_queue_order_and_schedule_survive_restart(self):
+        scheduler = self.scheduler()
+        scheduler.sync_terms(["a", "b", "c"])
+        due = scheduler.pop_due(self.now, limit=3)
+        scheduler.complete(due[0], ["1"], self.now)
+        scheduler.complete(due[1], [], self.now)
+        scheduler.complete(due[2], [], self.now + 10)
+
+        restarted = self.scheduler()
+        self.assertEqual(restarted.state, scheduler.state)
+        self.assertEqual(restarted.pop_due(self.now + 30 * DAY, limit=3), [due[0], due[1], due[2]])
+        self.assertEqual(restarted.pop_due(self.now + 30 * DAY, limit=3), [])
+
+    def test_daemon_and_watch_pubmed_each_report_new_papers(self):
+        scheduler = self.scheduler()
+        scheduler.sync_terms(["calcium"])
+        with patch("find_new_papers.search_pubmed_since", return_value=["1", "2"]):
+            self.assertEqual(scheduler.check("calcium"), ["1", "2"])
+
+        # watch_pubmed.py still reports the papers the daemon has seen, and vice versa
+        fake = FakeEutils({"calcium": ["1", "2", "3"]})
+        with patch("watch_pubmed.DB_PATH", self.db_path), \
+             patch("watch_pubmed.CACHE_FILE", os.path.join(self.tmp.name, "pubmed_cache.json")), \
+             patch("watch_pubmed.get_recent_queries", return_value=["calcium"]), \
+             patch("watch_pubmed.get_eutils_client", return_value=fake), \
+             patch("builtins.print"):
+            watch_pubmed.main()
+        self.assertEqual(fake.posted, [["1", "2", "3"]])
+
+        with patch("find_new_papers.search_pubmed_since", return_value=["1", "2", "3"]):
+            self.assertEqual(scheduler.check("calcium"), ["3"])
+
+    def test_run_checks_due_queries_with_bounded_workers(self):
+        results = {"calcium": ["1", "2"], "cholesterol": ["2"], "mice": []}
+        stop = threading.Event()
+        calls = []
+        in_flight, peak = [0], [0]
+        lock = threading.Lock()
+
+        def fake_search(term, since, max_results=10):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            threading.Event().wait(0.02)
+            with lock:
+                in_flight[0] -= 1
+                calls.append(term)
+                if len(calls) == len(results):
+                    stop.set()
+            return results[term]
+
+        scheduler = RefreshScheduler(self.store, workers=2, rate=1000)
+        with patch("find_new_papers.search_pubmed_since", side_effect=fake_search), patch("builtins.print"):
+            scheduler.run(lambda: list(results), stop)
+
+        self.assertEqual(sorted(calls), sorted(results))
+        self.assertLessEqual(peak[0], 2)
+        self.assertEqual(self.store.filter_new("calcium", ["1", "2", "3"]), ["3"])
+        self.assertIsNotNone(self.store.watermark("mice"))
+        self.assertEqual({term: checks for term, (_, _, checks) in self.store.load_schedule().items()},
+                         {"calcium": 1, "cholesterol": 1, "mice": 1})
+
+    def test_run_sleeps_while_workers_are_saturated(self):
+        terms = [f"topic {i}" for i in range(6)]
+        stop = threading.Event()
+        checked = []
+        ticks = [0]
+
+        def clock():
+            ticks[0] += 1
+            return self.now
+
+        def fake_search(term, since, max_results=10):
+            threading.Event().wait(0.1)
+            checked.append(term)
+            if len(checked) == len(terms):
+                stop.set()
+            return []
+
+        scheduler = RefreshScheduler(self.store, workers=2, rate=1000, clock=clock)
+        with patch("find_new_papers.search_pubmed_since", side_effect=fake_search), patch("builtins.print"):
+            scheduler.run(lambda: terms, stop)
+
+        self.assertEqual(sorted(checked), sorted(terms))
+        # A few clock reads per finished check, not a busy loop while every query is overdue
+        self.assertLess(ticks[0], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
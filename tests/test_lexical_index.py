@@ -0,0 +1,51 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from lexical_index import LexicalIndex, tokenize, write_lexical_index
+
+RECORDS = [
+    {"title": "Calcium and cholesterol in mice", "authors": "Jane Smith", "year": "2020", "faiss_id": 10},
+    {"title": "Vitamin D in mice", "authors": "Kim Lee", "year": "2021", "faiss_id": 11},
+    {"title": "Calcium signalling", "authors": "John Doe", "year": "2020", "keywords": "bone", "faiss_id": 12},
+]
+
+
+class TestLexicalIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "zotero_lexical.npz"
+        write_lexical_index(self.path, RECORDS)
+        self.index = LexicalIndex(self.path)
+
+    def test_tokenize_drops_stopwords_and_punctuation(self):
+        self.assertEqual(tokenize("The Effect of Vitamin-D on LDL_c!"), ["effect", "vitamin", "d", "ldl", "c"])
+
+    def test_bm25_ranking(self):
+        scores, ids, confident = self.index.search("calcium cholesterol", 3)
+        self.assertEqual(ids.tolist(), [10, 12])  # paper 11 matches no term
+        self.assertGreater(scores[0], scores[1])
+        self.assertTrue(confident)
+
+        # A one-word query matching several papers is never confident
+        _, ids, confident = self.index.search("mice", 3)
+        self.assertEqual(sorted(ids.tolist()), [10, 11])
+        self.assertFalse(confident)
+
+        _, ids, _ = self.index.search("bone Doe", 1)
+        self.assertEqual(ids.tolist(), [12])
+
+    def test_unknown_terms_and_empty_index(self):
+        self.assertEqual(len(self.index.search("insulin", 5)[1]), 0)
+        write_lexical_index(self.path, [])
+        self.assertEqual(len(LexicalIndex(self.path).search("calcium", 5)[1]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
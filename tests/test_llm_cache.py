@@ -0,0 +1,55 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+from llm_cache import LLMCache, cache_key, cached_completion
+
+
+class TestLLMCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = LLMCache(Path(self.tmp.name) / "llm.sqlite")
+        patcher = patch("llm_cache.get_llm_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_second_call_is_served_from_cache(self):
+        call = MagicMock(return_value="calcium AND cholesterol")
+        for _ in range(3):
+            result = cached_completion("gpt", "template {q}", "template calcium", call)
+        self.assertEqual(result, "calcium AND cholesterol")
+        self.assertEqual(call.call_count, 1)
+
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (2, 1, 1))
+        self.assertGreaterEqual(stats["saved_seconds"], 0)
+
+    def test_key_covers_model_template_and_params(self):
+        base = cache_key("gpt", "t", "p", {"max_tokens": 200})
+        self.assertNotEqual(base, cache_key("gpt-4o", "t", "p", {"max_tokens": 200}))
+        self.assertNotEqual(base, cache_key("gpt", "t2", "p", {"max_tokens": 200}))
+        self.assertNotEqual(base, cache_key("gpt", "t", "p", {"max_tokens": 300}))
+
+    def test_expired_entries_are_misses(self):
+        self.cache.put("k", "gpt", "old answer", 1.0)
+        self.assertEqual(self.cache.get("k"), "old answer")
+        self.cache.ttl_seconds = -1
+        self.assertIsNone(self.cache.get("k"))
+
+    def test_evicts_least_recently_used_over_size_cap(self):
+        self.cache.max_bytes = 250
+        for key in ("a", "b", "c"):
+            self.cache.put(key, "gpt", "x" * 100, 1.0)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+
+if __name__ == "__main__":
+    unittest.main()
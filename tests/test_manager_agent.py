@@ -0,0 +1,94 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+import concurrency
+from manager_agent import gather_sources, synthesize_stream
+from tracing import stage_breakdown, trace
+
+
+def chunk(text):
+    return MagicMock(choices=[MagicMock(delta=MagicMock(content=text))])
+
+
+class TestGatherSources(unittest.TestCase):
+
+    def test_zotero_and_pubmed_run_concurrently(self):
+        # Each branch waits for the other; run one after the other this would time out
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fake_zotero(query, k):
+            barrier.wait()
+            return [{"title": "Zotero paper"}]
+
+        def fake_pubmed(query, max_results):
+            barrier.wait()
+            return [{"title": "PubMed paper"}]
+
+        with patch("manager_agent.query_zotero_library", side_effect=fake_zotero), \
+             patch("manager_agent.iterative_pubmed_search", side_effect=fake_pubmed):
+            zotero_results, pubmed_results = gather_sources("calcium and cholesterol")
+
+        self.assertEqual(zotero_results[0]["title"], "Zotero paper")
+        self.assertEqual(pubmed_results[0]["title"], "PubMed paper")
+
+
+class TestSynthesizeStream(unittest.TestCase):
+
+    def test_yields_tokens_and_logs_time_to_first_token(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "queries.db"
+            stream = [chunk(None), chunk("Calcium "), chunk("lowers "), chunk("LDL.")]
+            timings = {}
+            with patch("manager_agent.client.chat.completions.create", return_value=iter(stream)) as mock_create:
+                pieces = list(synthesize_stream("q", [], [], query_id=7, timings=timings, db_path=db_path))
+
+            self.assertEqual(pieces, ["Calcium ", "lowers ", "LDL."])
+            self.assertTrue(mock_create.call_args.kwargs["stream"])
+            self.assertLessEqual(timings["ttft_seconds"], timings["total_seconds"])
+
+            conn = sqlite3.connect(db_path)
+            names = {row[0] for row in conn.execute("SELECT name FROM query_metrics WHERE query_id = 7")}
+            conn.close()
+            self.assertEqual(names, {"synthesis_ttft_seconds", "synthesis_seconds"})
+
+    def test_open_stream_leaves_openai_slots_for_short_calls(self):
+        slots = {"openai": threading.BoundedSemaphore(1), "openai_synthesis": threading.BoundedSemaphore(1)}
+        with patch.dict(concurrency._semaphores, slots), \
+             patch("manager_agent.client.chat.completions.create", return_value=iter([chunk("Calcium ")] * 3)):
+            pieces = synthesize_stream("q", [], [])
+            next(pieces)
+            self.assertFalse(slots["openai_synthesis"].acquire(blocking=False))
+            self.assertTrue(slots["openai"].acquire(blocking=False))
+            slots["openai"].release()
+            pieces.close()
+        self.assertTrue(slots["openai_synthesis"].acquire(blocking=False))
+
+    def test_failed_and_cancelled_synthesis_are_traced(self):
+        def failing_stream():
+            yield chunk("Calcium ")
+            raise ConnectionError("stream dropped")
+
+        with trace() as t:
+            with patch("manager_agent.client.chat.completions.create", return_value=failing_stream()):
+                with self.assertRaises(ConnectionError):
+                    list(synthesize_stream("q", [], []))
+            with patch("manager_agent.client.chat.completions.create", return_value=iter([chunk("Calcium ")] * 3)):
+                pieces = synthesize_stream("q", [], [])
+                next(pieces)
+                pieces.close()
+
+        self.assertEqual([s.status for s in t.spans], ["error", "cancelled"])
+        self.assertEqual(t.spans[0].attrs["error"], "ConnectionError: stream dropped")
+        self.assertEqual(stage_breakdown([s.to_dict() for s in t.spans])[0]["errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from meta_store import MetaStore, write_meta_store
+
+
+class TestMetaStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "zotero_meta.bin"
+
+    def test_round_trip_with_random_access(self):
+        records = [
+            {"title": f"Paper {i}", "authors": "Jane Smith, Jürgen Müller", "year": str(2000 + i), "id": f"key{i}"}
+            for i in range(100)
+        ]
+        write_meta_store(self.path, records, attrs={"embedding_model": "test"})
+
+        store = MetaStore(self.path)
+        self.assertEqual(len(store), 100)
+        self.assertEqual(store[42], records[42])
+        self.assertEqual(store[-1], records[-1])
+        self.assertEqual(list(store), records)
+        self.assertEqual(store.attrs, {"embedding_model": "test"})
+        with self.assertRaises(IndexError):
+            store[100]
+
+    def test_maps_faiss_ids_to_rows(self):
+        records = [{"id": f"key{i}"} for i in range(4)]
+        write_meta_store(self.path, records, ids=[907, 12, 5000, 44])
+
+        store = MetaStore(self.path)
+        rows = store.rows_for_ids([[5000, 12, -1, 3]])
+        self.assertEqual(rows.tolist(), [[2, 1, -1, -1]])
+        self.assertEqual(store[rows[0][0]], records[2])
+        with self.assertRaises(ValueError):
+            write_meta_store(self.path, records, ids=[1, 1, 2, 3])
+
+    def test_stores_without_ids_use_row_numbers(self):
+        write_meta_store(self.path, [{"id": "a"}, {"id": "b"}])
+        self.assertEqual(MetaStore(self.path).rows_for_ids([1, 0, 2, -1]).tolist(), [1, 0, -1, -1])
+
+    def test_empty_store(self):
+        write_meta_store(self.path, [])
+        self.assertEqual(list(MetaStore(self.path)), [])
+
+    def test_rejects_other_files(self):
+        self.path.write_bytes(b"\x80\x04not a store")
+        with self.assertRaises(ValueError):
+            MetaStore(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import io
+import unittest
+from unittest.mock import patch
+from xml.etree import ElementTree as ET
+
+from pubmed_parser import iter_pubmed_articles
+
+EFETCH_XML = b"""<?xml version="1.0" ?>
+<PubmedArticleSet>
+    <PubmedArticle>
+        <MedlineCitation>
+            <PMID Version="1">31234567</PMID>
+            <Article>
+                <Journal>
+                    <Title>Journal of Lipid Research</Title>
+                    <JournalIssue><PubDate><MedlineDate>2019 Nov-Dec</MedlineDate></PubDate></JournalIssue>
+                </Journal>
+                <ArticleTitle>Calcium intake and <i>LDL</i> cholesterol</ArticleTitle>
+                <ELocationID EIdType="pii">S0022</ELocationID>
+                <ELocationID EIdType="doi">10.1000/jlr.2019.1</ELocationID>
+                <Abstract>
+                    <AbstractText Label="BACKGROUND">Calcium may lower LDL.</AbstractText>
+                    <AbstractText Label="RESULTS">LDL fell by 5%.</AbstractText>
+                </Abstract>
+                <AuthorList>
+                    <Author><LastName>Doe</LastName><ForeName>John</ForeName></Author>
+                    <Author><CollectiveName>Lipid Consortium</CollectiveName></Author>
+                </AuthorList>
+            </Article>
+            <MeshHeadingList>
+                <MeshHeading><DescriptorName>Calcium, Dietary</DescriptorName></MeshHeading>
+                <MeshHeading><DescriptorName>Cholesterol, LDL</DescriptorName></MeshHeading>
+            </MeshHeadingList>
+        </MedlineCitation>
+    </PubmedArticle>
+    <PubmedArticle>
+        <MedlineCitation>
+            <PMID Version="1">7654321</PMID>
+            <Article>
+                <Journal><JournalIssue><PubDate><Year>2001</Year></PubDate></JournalIssue></Journal>
+                <ArticleTitle>No abstract here</ArticleTitle>
+            </Article>
+        </MedlineCitation>
+        <PubmedData>
+            <ArticleIdList><ArticleId IdType="doi">10.1000/old.2001</ArticleId></ArticleIdList>
+        </PubmedData>
+    </PubmedArticle>
+</PubmedArticleSet>
+"""
+
+
+class TestPubmedParser(unittest.TestCase):
+
+    def test_parses_rich_fields(self):
+        first, second = list(iter_pubmed_articles(io.BytesIO(EFETCH_XML)))
+
+        self.assertEqual(first["pmid"], "31234567")
+        self.assertEqual(first["doi"], "10.1000/jlr.2019.1")
+        self.assertEqual(first["title"], "Calcium intake and LDL cholesterol")
+        self.assertEqual(first["abstract"], "BACKGROUND: Calcium may lower LDL.\nRESULTS: LDL fell by 5%.")
+        self.assertEqual([s["label"] for s in first["abstract_sections"]], ["BACKGROUND", "RESULTS"])
+        self.assertEqual(first["authors"], "John Doe, Lipid Consortium")
+        self.assertEqual(first["year"], "2019")
+        self.assertEqual(first["journal"], "Journal of Lipid Research")
+        self.assertEqual(first["mesh_terms"], ["Calcium, Dietary", "Cholesterol, LDL"])
+        self.assertEqual(first["url"], "https://pubmed.ncbi.nlm.nih.gov/31234567/")
+
+        self.assertEqual(second["doi"], "10.1000/old.2001")
+        self.assertEqual(second["abstract"], "[No abstract available]")
+        self.assertEqual(second["year"], "2001")
+
+    def test_accepts_bytes(self):
+        self.assertEqual(len(list(iter_pubmed_articles(EFETCH_XML))), 2)
+
+    def test_parsed_articles_are_detached_from_the_root(self):
+        roots = []
+        iterparse = ET.iterparse
+
+        def spy(source, events):
+            for event, elem in iterparse(source, events=events):
+                if not roots:
+                    roots.append(elem)
+                yield event, elem
+
+        with patch("pubmed_parser.ET.iterparse", side_effect=spy):
+            self.assertEqual(len(list(iter_pubmed_articles(EFETCH_XML))), 2)
+        self.assertEqual(roots[0].tag, "PubmedArticleSet")
+        self.assertEqual(len(roots[0]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
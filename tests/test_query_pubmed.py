@@ -2,6 +2,7 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
 
+import io
 import unittest
 from unittest.mock import patch, MagicMock
 
@@ -10,7 +11,7 @@ from query_pubmed import query_pubmed, iterative_pubmed_search
 
 class TestPubMedSearch(unittest.TestCase):
 
-    @patch("query_pubmed.requests.get")
+    @patch("eutils.requests.Session.get")
     @patch("query_pubmed.client.chat.completions.create")
     def test_query_pubmed_returns_results(self, mock_openai, mock_requests):
         # Mock the OpenAI call to convert natural query to Boolean
@@ -71,8 +72,8 @@ class TestPubMedSearch(unittest.TestCase):
         
         # Setup mock responses
         mock_requests.side_effect = [
-            MagicMock(content=esearch_xml.encode("utf-8")),  # First call: esearch
-            MagicMock(content=efetch_xml.encode("utf-8")),   # Second call: efetch
+            MagicMock(status_code=200, content=esearch_xml.encode("utf-8")),  # First call: esearch
+            MagicMock(status_code=200, raw=io.BytesIO(efetch_xml.encode("utf-8"))),  # Second call: streamed efetch
         ]
 
         results = query_pubmed("cholesterol and calcium", max_results=2)
@@ -0,0 +1,153 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import numpy as np
+
+from answer_cache import CachedAnswer
+from query_client import QueryClient
+from query_server import make_server
+
+
+class TestQueryServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = make_server("127.0.0.1", 0)
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = QueryClient(f"http://127.0.0.1:{self.server.server_address[1]}")
+        printer = patch("builtins.print")
+        printer.start()
+        self.addCleanup(printer.stop)
+
+    def test_search_runs_on_the_server(self):
+        papers = [[{"id": "smith2020", "faiss_id": np.int64(7)}], []]
+        with patch("query_server.query_zotero_library_batch", return_value=papers) as mock_search:
+            results = self.client.search(["calcium", "LDL"], k=3, mode="lexical")
+        self.assertEqual(results, [[{"id": "smith2020", "faiss_id": 7}], []])
+        self.assertEqual(mock_search.call_args.args[0], ["calcium", "LDL"])
+        self.assertEqual(mock_search.call_args.kwargs, {"k": 3, "mode": "lexical"})
+        self.assertTrue(self.client.last_used_server)
+        self.assertIn("loads", self.client.last_index_stats)
+        self.assertEqual(self.client.health()["status"], "ok")
+
+    def test_call_results_are_kept_per_thread(self):
+        with patch("query_server.query_zotero_library_batch", return_value=[[]]):
+            self.client.search(["calcium"])
+        other = {}
+
+        def pubmed_search():
+            with patch("query_server.query_pubmed", return_value=[]):
+                self.client.pubmed("q", iterative=False)
+            other.update(used_server=self.client.last_used_server, stats=self.client.last_index_stats)
+
+        thread = threading.Thread(target=pubmed_search)
+        thread.start()
+        thread.join()
+        self.assertEqual(other, {"used_server": True, "stats": None})  # a PubMed call carries no index stats
+        self.assertIn("loads", self.client.last_index_stats)
+
+    def test_answer_cache_is_consulted_on_the_server(self):
+        hit = CachedAnswer(query_id=3, query="Calcium and LDL?", similarity=0.97, asked_at=datetime(2024, 5, 1, 9, 30),
+                           answer="Calcium modestly lowers LDL.", zotero=[{"id": "smith2020"}], pubmed=[],
+                           saved_seconds=12.0)
+        with patch("query_server.lookup_answer", side_effect=[hit, None]) as mock_lookup:
+            self.assertEqual(self.client.lookup_answer("calcium and LDL", 8), hit)
+            self.assertIsNone(self.client.lookup_answer("calcium and LDL", 9, force_refresh=True))
+        self.assertTrue(self.client.last_used_server)
+        self.assertEqual(mock_lookup.call_args.args, ("calcium and LDL", 9))
+        self.assertEqual(mock_lookup.call_args.kwargs, {"force_refresh": True})
+
+    def test_each_thread_has_its_own_session(self):
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(self.client.session))
+        thread.start()
+        thread.join()
+        self.assertIs(self.client.session, self.client.session)
+        self.assertIsNot(sessions[0], self.client.session)
+
+    def test_bad_requests_are_reported(self):
+        with self.assertRaisesRegex(RuntimeError, "400"):
+            self.client.search(["calcium"], mode="psychic")
+
+    def test_synthesis_streams_pieces_and_timings(self):
+        def fake_stream(query, zotero, pubmed, query_id=None, timings=None):
+            self.assertEqual((query, zotero, query_id), ("q", [{"title": "A"}], 7))
+            yield "Calcium "
+            yield "lowers LDL."
+            timings["total_seconds"] = 1.5
+
+        with patch("query_server.synthesize_stream", side_effect=fake_stream):
+            timings = {}
+            pieces = list(self.client.synthesize_stream("q", [{"title": "A"}], [], query_id=7, timings=timings))
+        self.assertEqual(pieces, ["Calcium ", "lowers LDL."])
+        self.assertEqual(timings, {"total_seconds": 1.5})
+
+    def test_synthesis_errors_reach_the_client(self):
+        def failing_stream(*args, **kwargs):
+            yield "Calcium "
+            raise RuntimeError("rate limited")
+
+        with patch("query_server.synthesize_stream", side_effect=failing_stream):
+            with self.assertRaisesRegex(RuntimeError, "rate limited"):
+                list(self.client.synthesize_stream("q", [], []))
+
+    def test_requests_are_served_concurrently(self):
+        # Each request waits for the other; served one at a time this would time out
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fake_sources(query, k, max_results, iterative):
+            barrier.wait()
+            return [{"title": query}], []
+
+        results = {}
+        with patch("query_server.gather_sources", side_effect=fake_sources):
+            threads = [
+                threading.Thread(target=lambda q=q: results.setdefault(q, self.client.gather_sources(q)))
+                for q in ("a", "b")
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results["a"], ([{"title": "a"}], []))
+        self.assertEqual(results["b"], ([{"title": "b"}], []))
+
+
+class TestLocalFallback(unittest.TestCase):
+
+    def test_runs_in_process_without_a_server(self):
+        # Nothing listens on port 1
+        client = QueryClient("http://127.0.0.1:1")
+        with patch("manager_agent.gather_sources", return_value=([{"title": "local"}], [])) as mock_local, \
+             patch.object(client.session, "post", wraps=client.session.post) as mock_post:
+            for _ in range(3):
+                self.assertEqual(client.gather_sources("q"), ([{"title": "local"}], []))
+        self.assertFalse(client.last_used_server)
+        self.assertEqual(mock_local.call_count, 3)
+        # After one refused connection the server is not retried for a while
+        self.assertEqual(mock_post.call_count, 1)
+
+    def test_answer_lookup_runs_in_process_without_a_server(self):
+        client = QueryClient("")
+        with patch("manager_agent.lookup_answer", return_value=None) as mock_lookup:
+            self.assertIsNone(client.lookup_answer("q", 4))
+        mock_lookup.assert_called_once_with("q", 4, force_refresh=False)
+        self.assertFalse(client.last_used_server)
+
+    def test_disabled_server_url(self):
+        client = QueryClient("")
+        self.assertIsNone(client.health())
+        with patch("query_pubmed.query_pubmed", return_value=[{"pmid": "1"}]):
+            self.assertEqual(client.pubmed("q", iterative=False), [{"pmid": "1"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import faiss
+import numpy as np
+
+from meta_store import write_meta_store
+from lexical_index import write_lexical_index
+from query_zotero import ZoteroIndex, query_zotero_library, query_zotero_library_batch, rrf_fuse
+from evaluate_zotero import score
+from utils import replace_atomically
+
+
+def write_library(folder, n):
+    """Writes a tiny flat index with n papers and matching metadata."""
+    index = faiss.IndexFlatL2(4)
+    index.add(np.eye(4, dtype=np.float32)[np.arange(n) % 4] * (1 + np.arange(n)[:, None]))
+    metadata = [{"title": f"Paper {i}", "authors": "", "year": "2024", "id": f"key{i}"} for i in range(n)]
+    replace_atomically(folder / "zotero.index", lambda path: faiss.write_index(index, path))
+    write_meta_store(folder / "zotero_meta.bin", metadata)
+
+
+class TestZoteroIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.folder = Path(self.tmp.name)
+        write_library(self.folder, 3)
+        self.handle = ZoteroIndex(self.folder / "zotero.index", self.folder / "zotero_meta.bin")
+
+    def test_loads_once_and_reloads_on_new_files(self):
+        query = np.array([[1, 0, 0, 0]], dtype=np.float32)
+        _, I, metadata = self.handle.search(query, 2)
+        self.handle.search(query, 2)
+        self.assertEqual(self.handle.loads, 1)
+        self.assertEqual(metadata[I[0][0]]["title"], "Paper 0")
+        self.assertIsNotNone(self.handle.stats()["last_search_seconds"])
+
+        write_library(self.folder, 5)
+        index, metadata = self.handle.get()
+        self.assertEqual(self.handle.loads, 2)
+        self.assertEqual((index.ntotal, len(metadata)), (5, 5))
+
+    def test_merges_chunk_hits_per_paper(self):
+        from chunk_index import CHUNK_BITS
+        chunks = faiss.IndexIDMap2(faiss.IndexFlatL2(4))
+        # Two abstract chunks of paper 1 sit right on the query
+        chunks.add_with_ids(np.array([[0, 0, 0, 9], [0, 0, 0, 9]], dtype=np.float32),
+                            np.array([(1 << CHUNK_BITS) | 0, (1 << CHUNK_BITS) | 1]))
+        faiss.write_index(chunks, str(self.folder / "zotero_chunks.index"))
+
+        _, I, metadata = self.handle.search(np.array([[0, 0, 0, 9]], dtype=np.float32), 2)
+        self.assertEqual(I[0].tolist()[0], 1)
+        self.assertEqual(len(set(I[0].tolist())), 2)
+
+    def test_query_returns_decoded_rows(self):
+        with patch("query_zotero.ZOTERO_INDEX", self.handle), \
+             patch("query_zotero.get_embeddings", return_value=np.array([[0, 0, 2, 0]], dtype=np.float32)):
+            results = query_zotero_library("anything", k=5)
+        # Only 3 papers exist, so FAISS padding (-1) must be dropped
+        self.assertEqual([r["id"] for r in results], ["key2", "key0", "key1"])
+
+    def test_batch_embeds_and_searches_once(self):
+        vectors = np.array([[0, 0, 2, 0], [1, 0, 0, 0], [0, 3, 0, 0]], dtype=np.float32)
+        with patch("query_zotero.ZOTERO_INDEX", self.handle), \
+             patch("query_zotero.get_embeddings", return_value=vectors) as mock_embed, \
+             patch.object(self.handle, "search", wraps=self.handle.search) as mock_search:
+            results = query_zotero_library_batch(["q1", "q2", "q3"], k=2)
+
+        mock_embed.assert_called_once_with(["q1", "q2", "q3"])
+        mock_search.assert_called_once()
+        self.assertEqual(mock_search.call_args.args[0].shape, (3, 4))
+        self.assertEqual([[r["id"] for r in papers] for papers in results],
+                         [["key2", "key0"], ["key0", "key1"], ["key1", "key0"]])
+
+        questions = [{"query": "q1", "expected": ["key2"]}, {"query": "q2", "expected": ["key1"]}, {"query": "q3"}]
+        self.assertEqual(score(questions, results, 2), {"judged_queries": 2, "recall@2": 1.0, "mrr": 0.75})
+
+    def test_lexical_and_hybrid_modes(self):
+        records = [
+            {"title": "Calcium and cholesterol", "authors": "Jane Smith", "year": "2020", "faiss_id": 0},
+            {"title": "Vitamin D in mice", "authors": "Kim Lee", "year": "2021", "faiss_id": 1},
+            {"title": "Calcium signalling in mice", "authors": "John Doe", "year": "2020", "faiss_id": 2},
+        ]
+        write_lexical_index(self.folder / "zotero_lexical.npz", records)
+        vectors = np.array([[0, 1, 0, 0]], dtype=np.float32)
+        with patch("query_zotero.ZOTERO_INDEX", self.handle), \
+             patch("query_zotero.get_embeddings", return_value=vectors) as mock_embed:
+            lexical = query_zotero_library("calcium cholesterol", k=2, mode="lexical")
+            confident = query_zotero_library("calcium cholesterol", k=2, mode="hybrid")
+            self.assertEqual(mock_embed.call_count, 0)
+            fused = query_zotero_library("mice", k=3, mode="hybrid")
+            self.assertEqual(mock_embed.call_count, 1)
+
+        self.assertEqual([r["id"] for r in lexical], ["key0", "key2"])
+        self.assertEqual([r["id"] for r in confident], ["key0", "key2"])
+        self.assertEqual(self.handle.stats()["lexical_shortcuts"], 1)
+        # key1 is first lexically and first semantically, so it leads the fused list
+        self.assertEqual([r["id"] for r in fused][0], "key1")
+        with self.assertRaises(ValueError):
+            query_zotero_library("mice", mode="fuzzy")
+
+    def test_refuses_vectors_from_another_backend(self):
+        index, metadata = self.handle.get()
+        write_meta_store(self.folder / "zotero_meta.bin", list(metadata), attrs={"embedding_model": "local-hash-768-3-4-5"})
+        with patch("query_zotero.ZOTERO_INDEX", self.handle), \
+             patch("query_zotero.get_embeddings") as mock_embed:
+            with self.assertRaises(RuntimeError):
+                query_zotero_library("calcium", mode="semantic")
+        mock_embed.assert_not_called()
+
+    def test_refuses_index_and_metadata_from_different_builds(self):
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(4))
+        index.add_with_ids(np.eye(4, dtype=np.float32)[:2], np.array([10, 11]))
+        faiss.write_index(index, str(self.folder / "zotero.index"))
+        records = [{"title": "Paper", "authors": "", "year": "2024", "id": "key"}] * 2
+        write_meta_store(self.folder / "zotero_meta.bin", records, ids=[10, 12])
+        with self.assertRaises(RuntimeError):
+            self.handle._load(self.handle._stamp(), attempts=1)
+
+        write_meta_store(self.folder / "zotero_meta.bin", records, ids=[11, 10])
+        self.assertEqual(self.handle.get()[0].ntotal, 2)
+
+    def test_rrf_fuse(self):
+        self.assertEqual(rrf_fuse([[5, 7, 9], [7, 3, -1]], 3).tolist(), [7, 5, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
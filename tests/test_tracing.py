@@ -0,0 +1,127 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import json
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import db
+from concurrency import parallel_map
+from tracing import (estimate_cost, in_context, record, span, stage_breakdown, stage_percentiles, trace,
+                     traced)
+
+
+class TestSpans(unittest.TestCase):
+
+    def test_nesting_follows_threads_wrapped_with_in_context(self):
+        with trace() as t:
+            with span("outer") as outer:
+                with span("inner"):
+                    pass
+                with ThreadPoolExecutor(max_workers=2) as pool:
+                    pool.submit(in_context(traced("worker")(lambda: None))).result()
+                parallel_map(traced("mapped")(lambda x: x), [1, 2], max_workers=2)
+            with span("unrelated"):
+                pass
+        by_name = {}
+        for s in t.spans:
+            by_name.setdefault(s.name, []).append(s)
+        self.assertIsNone(outer.parent_id)
+        for name in ("inner", "worker", "mapped"):
+            self.assertTrue(all(s.parent_id == outer.span_id for s in by_name[name]), name)
+        self.assertEqual(len(by_name["mapped"]), 2)
+        self.assertIsNone(by_name["unrelated"][0].parent_id)
+
+    def test_errors_are_recorded_and_reraised(self):
+        with trace() as t:
+            with self.assertRaises(ValueError):
+                with span("failing"):
+                    raise ValueError("boom")
+        self.assertEqual(t.spans[0].status, "error")
+        self.assertEqual(t.spans[0].attrs["error"], "ValueError: boom")
+
+    def test_usage_and_cost(self):
+        self.assertAlmostEqual(estimate_cost("gpt-4o-mini-2024-07-18", 1_000_000, 1_000_000), 0.75)
+        self.assertAlmostEqual(estimate_cost("gpt-4-0613", 1000, 500), 0.06)
+        self.assertIsNone(estimate_cost("unknown-model", 1000))
+
+        with trace() as t:
+            with span("openai.chat") as s:
+                s.add_usage("gpt-4", 1000, 0)
+                s.add_usage("gpt-4", 0, 1000)
+            done = record("synthesis", 0.25, ttft_ms=80)
+        self.assertEqual((s.prompt_tokens, s.completion_tokens), (1000, 1000))
+        self.assertAlmostEqual(s.cost_usd, 0.09)
+        self.assertEqual(done.duration_ms, 250)
+        self.assertIn(done, t.spans)
+
+    def test_spans_outside_a_trace_are_not_kept(self):
+        with span("loose") as s:
+            pass
+        self.assertIsNotNone(s.duration_ms)
+        with trace() as t:
+            pass
+        self.assertEqual(t.spans, [])
+
+
+class TestPersistence(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = Path(self.tmp.name) / "queries.db"
+        self.addCleanup(db.close_connection, self.db_path)
+
+    def test_trace_saves_spans_and_exports_jsonl(self):
+        export = Path(self.tmp.name) / "spans.jsonl"
+        query_id = db.log_query("calcium and cholesterol", db_path=self.db_path)
+        with trace(query_id, db_path=self.db_path, export=export):
+            with span("sources", k=5):
+                with span("openai.embeddings") as s:
+                    s.add_usage("text-embedding-3-small", 1_000_000)
+
+        spans = db.load_spans(query_id, db_path=self.db_path)
+        self.assertEqual([s["name"] for s in spans], ["sources", "openai.embeddings"])
+        self.assertEqual(spans[0]["attrs"], {"k": 5})
+        self.assertEqual(spans[1]["parent_id"], spans[0]["span_id"])
+        self.assertAlmostEqual(spans[1]["cost_usd"], 0.02)
+
+        exported = [json.loads(line) for line in export.read_text().splitlines()]
+        self.assertEqual({e["query_id"] for e in exported}, {query_id})
+        self.assertEqual(len(exported), 2)
+        self.assertEqual(len(db.recent_spans(10, db_path=self.db_path)), 2)
+
+
+class TestSummaries(unittest.TestCase):
+
+    def spans(self):
+        def s(name, started, ms, cost=None, status="ok", tokens=None):
+            return {"name": name, "started_at": started, "duration_ms": ms, "cost_usd": cost, "status": status,
+                    "prompt_tokens": tokens, "completion_tokens": None}
+        return [
+            s("synthesis", 3, 900, cost=0.03, tokens=1200),
+            s("ncbi.esearch", 1, 100),
+            s("ncbi.esearch", 2, 300, status="error"),
+            s("zotero.search", 0, 20),
+        ]
+
+    def test_stage_breakdown(self):
+        rows = stage_breakdown(self.spans())
+        self.assertEqual([r["stage"] for r in rows], ["zotero.search", "ncbi.esearch", "synthesis"])
+        esearch = rows[1]
+        self.assertEqual((esearch["calls"], esearch["ms"], esearch["errors"]), (2, 400, 1))
+        self.assertEqual(rows[2]["tokens"], 1200)
+
+    def test_stage_percentiles(self):
+        rows = stage_percentiles(self.spans())
+        self.assertEqual(rows[0]["stage"], "synthesis")
+        esearch = next(r for r in rows if r["stage"] == "ncbi.esearch")
+        self.assertEqual(esearch["p50_ms"], 200)
+        self.assertAlmostEqual(esearch["p95_ms"], 290)
+
+
+if __name__ == "__main__":
+    unittest.main()
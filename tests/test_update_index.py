@@ -0,0 +1,203 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import faiss
+import numpy as np
+
+import build_index
+import update_index
+from bib_entries import entry_id
+from embedding_backends import get_embedding_backend
+from embedding_cache import EmbeddingCache
+from meta_store import MetaStore, write_meta_store
+from test_embedding_pipeline import fake_embeddings, patch_embeddings_api, patch_encoding
+
+BIB_TEMPLATE = """
+@article{{smith2020,
+  title = {{{smith_title}}},
+  author = {{Smith, Jane}},
+  year = {{2020}}
+}}
+@article{{lee2021,
+  title = {{Vitamin D in mice}},
+  author = {{Lee, Kim}},
+  year = {{2021}},
+  abstract = {{{lee_abstract}}},
+  keywords = {{vitamin D, bone}}
+}}
+{extra}
+"""
+
+EXTRA_ENTRY = """
+@article{doe2022,
+  title = {Insulin signalling in adipose tissue},
+  author = {Doe, John},
+  year = {2022}
+}
+"""
+
+
+class IndexBuildTestCase(unittest.TestCase):
+    """Runs index builds in a temporary folder with a fake embeddings API, cache and tokenizer."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.addCleanup(os.chdir, cwd)
+
+        cache = EmbeddingCache(Path(self.tmp.name) / "embeddings.sqlite")
+        patcher = patch("embedding_pipeline.get_embedding_cache", return_value=cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        api = patch_embeddings_api()
+        self.mock = api.start().return_value.embeddings.create
+        self.addCleanup(api.stop)
+        encoding = patch_encoding()
+        encoding.start()
+        self.addCleanup(encoding.stop)
+
+    def write_bib(self, smith_title="Calcium and cholesterol", extra="",
+                  lee_abstract="Mice were fed vitamin D. Bone density rose."):
+        Path("library.bib").write_text(
+            BIB_TEMPLATE.format(smith_title=smith_title, extra=extra, lee_abstract=lee_abstract)
+        )
+
+    def search_keys(self, index, text):
+        vector = np.array([fake_embeddings([text], None).data[0].embedding], dtype=np.float32)
+        _, I = index.search(vector, 1)
+        store = MetaStore("zotero_meta.bin")
+        return [store[row]["id"] for row in store.rows_for_ids(I[0]) if row >= 0]
+
+
+class TestUpdateIndex(IndexBuildTestCase):
+
+    def check_update(self, index_spec):
+        self.write_bib(extra=EXTRA_ENTRY)
+        build_index.main(index_spec)
+        self.assertIsInstance(faiss.read_index("zotero.index"), faiss.IndexIDMap2)
+
+        # Edit one title and delete another entry
+        self.write_bib(smith_title="Calcium intake and LDL cholesterol")
+        calls = self.mock.call_count
+        update_index.main()
+
+        # Only the edited title was embedded
+        self.assertEqual(self.mock.call_count, calls + 1)
+        self.assertEqual(self.mock.call_args.kwargs["input"], ["Calcium intake and LDL cholesterol"])
+
+        index = faiss.read_index("zotero.index")
+        store = MetaStore("zotero_meta.bin")
+        self.assertEqual(index.ntotal, 2)
+        self.assertEqual([m["id"] for m in store], ["smith2020", "lee2021"])
+        self.assertEqual(sorted(faiss.vector_to_array(index.id_map)),
+                         sorted([entry_id("smith2020"), entry_id("lee2021")]))
+        self.assertEqual(self.search_keys(index, "Calcium intake and LDL cholesterol"), ["smith2020"])
+
+    def test_edits_and_deletions_on_flat_index(self):
+        self.check_update("Flat")
+
+    def test_edits_and_deletions_on_hnsw_index(self):
+        # HNSW cannot remove vectors, so the index is rebuilt from its stored vectors
+        self.check_update("HNSW")
+
+    def test_chunk_index_follows_abstract_edits(self):
+        self.write_bib(extra=EXTRA_ENTRY)
+        build_index.main(chunks=True)
+        chunks = faiss.read_index("zotero_chunks.index")
+        self.assertEqual(chunks.ntotal, 2)  # lee2021: one abstract chunk + keywords
+
+        self.write_bib(lee_abstract="Mice were fed vitamin D for ten weeks.")
+        calls = self.mock.call_count
+        update_index.main()
+
+        # Only the new abstract chunk was embedded; keywords came from the cache
+        self.assertEqual(self.mock.call_count, calls + 1)
+        self.assertEqual(self.mock.call_args.kwargs["input"], ["Mice were fed vitamin D for ten weeks."])
+        chunks = faiss.read_index("zotero_chunks.index")
+        self.assertEqual(chunks.ntotal, 2)
+        self.assertEqual(MetaStore("zotero_meta.bin")[1]["abstract"], "Mice were fed vitamin D for ten weeks.")
+
+        build_index.main(chunks=False)
+        self.assertFalse(os.path.exists("zotero_chunks.index"))
+
+    def test_upgrades_index_built_before_stable_ids(self):
+        self.write_bib()
+        build_index.main()
+        index = faiss.read_index("zotero.index")
+        plain = faiss.downcast_index(index.index)
+        faiss.write_index(plain, "zotero.index")
+        write_meta_store("zotero_meta.bin", [
+            {"title": m["title"], "authors": m["authors"], "year": m["year"], "id": m["id"]}
+            for m in MetaStore("zotero_meta.bin")
+        ])
+
+        calls = self.mock.call_count
+        update_index.main()
+        self.assertEqual(self.mock.call_count, calls)  # nothing re-embedded
+        index = faiss.read_index("zotero.index")
+        self.assertIsInstance(index, faiss.IndexIDMap)
+        self.assertEqual(self.search_keys(index, "Vitamin D in mice"), ["lee2021"])
+
+
+def numbered_bib(n):
+    return "\n".join(f"@article{{key{i}, title = {{Topic {i} in mice}}, author = {{Doe, John}}, year = {{2020}}}}"
+                     for i in range(n))
+
+
+class TestBuildCheckpoints(IndexBuildTestCase):
+
+    def fail_on(self, text):
+        def embed(input, model):
+            if text in input:
+                raise ConnectionError("network down")
+            return fake_embeddings(input, model)
+        self.mock.side_effect = embed
+
+    def test_resumes_interrupted_build_from_checkpoint(self):
+        Path("library.bib").write_text(numbered_bib(10))
+        self.fail_on("Topic 9 in mice")
+        # Batches of 2 with 4 in flight: the first window of 8 entries is checkpointed
+        with patch("embedding_pipeline.EMBEDDING_BATCH_SIZE", 2), patch.object(get_embedding_backend(), "concurrency", 4):
+            with self.assertRaises(ConnectionError):
+                build_index.main(checkpoint_every=1)
+            self.assertFalse(os.path.exists("zotero.index"))
+            self.assertEqual(faiss.read_index("zotero.index.partial").ntotal, 8)
+
+            self.mock.side_effect = fake_embeddings
+            with patch("build_index.embed_into_index", wraps=build_index.embed_into_index) as embed:
+                build_index.main(checkpoint_every=1, resume=True)
+
+        self.assertEqual(embed.call_args.args[0], ["Topic 8 in mice", "Topic 9 in mice"])
+        index, store = faiss.read_index("zotero.index"), MetaStore("zotero_meta.bin")
+        self.assertEqual(index.ntotal, 10)
+        self.assertEqual(sorted(faiss.vector_to_array(index.id_map)), sorted(store.ids))
+        self.assertEqual(self.search_keys(index, "Topic 3 in mice"), ["key3"])
+        for leftover in ("zotero.index.partial", build_index.CHECKPOINT_FILE):
+            self.assertFalse(os.path.exists(leftover))
+
+    def test_checkpoint_of_another_library_is_not_resumed(self):
+        Path("library.bib").write_text(numbered_bib(3))
+        self.fail_on("Topic 2 in mice")
+        with patch("embedding_pipeline.EMBEDDING_BATCH_SIZE", 1), patch.object(get_embedding_backend(), "concurrency", 1):
+            with self.assertRaises(ConnectionError):
+                build_index.main(checkpoint_every=1)
+        self.assertTrue(os.path.exists("zotero.index.partial"))
+
+        self.mock.side_effect = fake_embeddings
+        Path("library.bib").write_text(numbered_bib(4))
+        with patch("build_index.embed_into_index", wraps=build_index.embed_into_index) as embed:
+            build_index.main(resume=True)
+        self.assertEqual(len(embed.call_args.args[0]), 4)
+        self.assertEqual(faiss.read_index("zotero.index").ntotal, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import io
+import json
+import tempfile
+from datetime import date
+import unittest
+from unittest.mock import patch, MagicMock
+
+import watch_pubmed
+
+
+def article_xml(pmid):
+    return (f"<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>"
+            f"<ArticleTitle>Paper {pmid}</ArticleTitle>"
+            f"<Journal><Title>J</Title><JournalIssue><PubDate><Year>2024</Year></PubDate></JournalIssue></Journal>"
+            f"</Article></MedlineCitation></PubmedArticle>")
+
+
+class FakeEutils:
+    """History-server stand-in: epost stores the IDs, efetch serves windows of them."""
+
+    def __init__(self, results):
+        self.results = results
+        self.posted = []
+        self.fetches = []
+        self.searches = []
+
+    def esearch(self, term, retmax=20, **params):
+        self.searches.append((term, params))
+        return {"ids": self.results[term]}
+
+    def epost(self, ids, db="pubmed", webenv=None):
+        self.posted.append(list(ids))
+        return {"webenv": "WE", "query_key": "1"}
+
+    def efetch(self, webenv=None, query_key=None, retstart=0, retmax=20, stream=False, **params):
+        self.fetches.append((retstart, retmax))
+        ids = self.posted[-1][retstart:retstart + retmax]
+        body = "<PubmedArticleSet>" + "".join(article_xml(pid) for pid in ids) + "</PubmedArticleSet>"
+        return MagicMock(raw=io.BytesIO(body.encode()))
+
+
+class TestWatchPubmed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache_file = os.path.join(self.tmp.name, "pubmed_cache.json")
+        self.db_path = os.path.join(self.tmp.name, "queries.db")
+        for name, value in (("CACHE_FILE", self.cache_file), ("DB_PATH", self.db_path)):
+            patcher = patch(f"watch_pubmed.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_watcher(self, fake, terms):
+        with patch("watch_pubmed.get_eutils_client", return_value=fake), \
+             patch("watch_pubmed.get_recent_queries", return_value=terms), \
+             patch("watch_pubmed.FETCH_BATCH", 2), \
+             patch("builtins.print"):
+            watch_pubmed.main()
+
+    def store(self):
+        store = watch_pubmed.WatchStore(self.db_path)
+        self.addCleanup(store.close)
+        return store
+
+    def test_new_ids_are_deduplicated_and_fetched_in_batches(self):
+        terms = ["calcium", "cholesterol", "mice"]
+        fake = FakeEutils({"calcium": ["1", "2", "3"], "cholesterol": ["3", "4", "5"], "mice": []})
+        self.run_watcher(fake, terms)
+
+        self.assertEqual(fake.posted, [["1", "2", "3", "4", "5"]])
+        self.assertEqual(fake.fetches, [(0, 2), (2, 2), (4, 2)])
+        self.assertEqual(self.store().filter_new("cholesterol", ["3", "4", "5", "6"]), ["6"])
+
+        # A second run only asks for records entered since the first, finds nothing new and fetches nothing
+        self.run_watcher(fake, terms)
+        self.assertEqual(len(fake.posted), 1)
+        today = date.today().strftime("%Y/%m/%d")
+        self.assertNotIn("mindate", fake.searches[0][1])
+        self.assertEqual(fake.searches[-1][1],
+                         {"sort": "most+recent", "datetype": "edat", "mindate": today, "maxdate": today})
+
+    def test_failed_search_keeps_watermark(self):
+        fake = FakeEutils({"calcium": ["1"]})
+        fake.esearch = MagicMock(side_effect=RuntimeError("HTTP 500"))
+        self.run_watcher(fake, ["calcium"])
+        self.assertIsNone(self.store().watermark("calcium"))
+
+    def test_papers_that_failed_to_fetch_are_retried(self):
+        fake = FakeEutils({"calcium": ["1", "2", "3"], "mice": ["4"]})
+        efetch = fake.efetch
+
+        def flaky_efetch(retstart=0, **params):
+            if retstart == 2:
+                raise RuntimeError("HTTP 502")
+            return efetch(retstart=retstart, **params)
+
+        fake.efetch = flaky_efetch
+        self.run_watcher(fake, ["calcium", "mice"])
+        store = self.store()
+        self.assertEqual(store.filter_new("calcium", ["1", "2", "3"]), ["3"])
+        self.assertIsNone(store.watermark("calcium"))
+        self.assertEqual(store.filter_new("mice", ["4"]), ["4"])
+        self.assertIsNone(store.watermark("mice"))
+
+        # An epost failure fetches nothing, so nothing is marked seen
+        fake.efetch = efetch
+        fake.epost = MagicMock(side_effect=RuntimeError("HTTP 500"))
+        self.run_watcher(fake, ["calcium", "mice"])
+        self.assertEqual(store.filter_new("calcium", ["3"]), ["3"])
+
+        del fake.epost
+        self.run_watcher(fake, ["calcium", "mice"])
+        self.assertEqual(fake.posted[-1], ["3", "4"])
+        self.assertEqual(store.filter_new("calcium", ["3"]), [])
+        self.assertIsNotNone(store.watermark("mice"))
+
+    def test_legacy_json_cache_is_imported_once(self):
+        with open(self.cache_file, "w") as f:
+            json.dump({"calcium": ["1", "2"]}, f)
+        fake = FakeEutils({"calcium": ["1", "2", "3"]})
+        self.run_watcher(fake, ["calcium"])
+
+        self.assertEqual(fake.posted, [["3"]])
+        self.assertFalse(os.path.exists(self.cache_file))
+        self.assertTrue(os.path.exists(self.cache_file + ".migrated"))
+        self.assertEqual(self.store().seen_count("calcium"), 3)
+
+    def test_fetch_records_parses_structured_records(self):
+        fake = FakeEutils({})
+        with patch("watch_pubmed.get_eutils_client", return_value=fake):
+            records = watch_pubmed.fetch_records(["11", "12"])
+        self.assertEqual(records["12"]["title"], "Paper 12")
+        self.assertEqual(records["11"]["year"], "2024")
+        self.assertEqual(records["11"]["url"], "https://pubmed.ncbi.nlm.nih.gov/11/")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+
+import db
+from watch_store import WatchStore, WATCH_PUBMED, REFRESH_DAEMON
+
+
+class TestWatchStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = WatchStore(Path(self.tmp.name) / "queries.db")
+        self.addCleanup(self.store.close)
+
+    def test_seen_pmids_are_per_term_and_keep_first_seen(self):
+        self.store.mark_seen("calcium", ["1", "2"], date(2024, 1, 1))
+        self.store.mark_seen("calcium", ["2", "3"], date(2024, 2, 1))
+        self.assertEqual(self.store.filter_new("calcium", ["4", "3", "2", "1"]), ["4"])
+        self.assertEqual(self.store.filter_new("cholesterol", ["1"]), ["1"])
+        first_seen = self.store._conn.execute(
+            "SELECT first_seen FROM seen_pmids WHERE term = 'calcium' AND pmid = '2'"
+        ).fetchone()[0]
+        self.assertEqual(first_seen, "2024-01-01")
+        self.assertEqual(self.store.seen_count(), 3)
+
+    def test_filter_new_handles_more_ids_than_sqlite_parameters(self):
+        ids = [str(i) for i in range(1200)]
+        self.store.mark_seen("calcium", ids[::2])
+        self.assertEqual(self.store.filter_new("calcium", ids), ids[1::2])
+
+    def test_watermarks(self):
+        self.assertIsNone(self.store.watermark("calcium"))
+        self.store.set_watermark("calcium", date(2024, 3, 1))
+        self.store.set_watermark("calcium", date(2024, 3, 8))
+        self.assertEqual(self.store.watermark("calcium"), date(2024, 3, 8))
+
+    def test_watchers_keep_separate_state(self):
+        daemon = WatchStore(self.store.path, watcher=REFRESH_DAEMON)
+        self.store.mark_seen("calcium", ["1"])
+        self.store.set_watermark("calcium", date(2024, 3, 1))
+        self.assertEqual(daemon.filter_new("calcium", ["1", "2"]), ["1", "2"])
+        self.assertIsNone(daemon.watermark("calcium"))
+        self.assertEqual(daemon.seen_count(), 0)
+
+    def test_state_from_before_watchers_is_kept_for_both(self):
+        path = Path(self.tmp.name) / "old.db"
+        conn = sqlite3.connect(path)
+        for script in db.MIGRATIONS[:4]:
+            conn.executescript(script)
+        conn.execute("PRAGMA user_version = 4")
+        conn.execute("INSERT INTO seen_pmids VALUES ('calcium', '1', '2024-01-01')")
+        conn.execute("INSERT INTO watch_watermarks VALUES ('calcium', '2024-03-01')")
+        conn.commit()
+        conn.close()
+        self.addCleanup(db.close_connection, path)
+
+        for watcher in (WATCH_PUBMED, REFRESH_DAEMON):
+            store = WatchStore(path, watcher=watcher)
+            self.assertEqual(store.filter_new("calcium", ["1", "2"]), ["2"])
+            self.assertEqual(store.watermark("calcium"), date(2024, 3, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()